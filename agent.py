@@ -1,11 +1,25 @@
 from __future__ import annotations
 
+import contextvars
 import json
-from dataclasses import dataclass
+import marshal
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import List, Dict, Optional, Callable, Any
+from typing import List, Dict, Optional, Callable, Any, Tuple, Union
 
-import requests
+from conversation_memory import ConversationMemory
+from deadlines import TURN_BUDGET, DeadlineExceeded, LLM_TIMEOUT, deadline_scope, expired, timeout_for
+from llm_pool import base_url, current_session, get_llm_pool, session_scope
+from llm_scheduler import BACKGROUND, INTERACTIVE, get_llm_scheduler
+import references
+from prompt_budget import calibrate_tokens, count_tokens, fit_messages, fit_payload, messages_tokens, set_context_size
+import tracing
+from skill_executor import HANDLER_CONCURRENCY, HANDLER_TIMEOUT, check_cancelled, get_skill_executor
+from utterance_cache import get_utterance_cache
 
 
 # =========================
@@ -13,7 +27,43 @@ import requests
 # =========================
 
 LLAMA_SERVER_URL = "http://localhost:8080/v1/chat/completions"
+# Plusieurs llama-server : répartition de charge et bascule (voir llm_pool.py).
+# Vide -> LLAMA_SERVER_URL seul.
+LLAMA_SERVER_URLS: List[str] = []
 MODEL_NAME = "Qwen_Qwen3-0.6B-Q8_0"  # adapte selon ton modèle local
+# Budget (tokens) des résultats de handlers injectés dans les prompts de réponse
+RESULT_TOKENS = 600
+HANDLER_ERROR_MESSAGE = "J'ai rencontré un problème en traitant ta demande."
+
+# Profils de génération des appels qui répondent en JSON :
+# (tokens de base, tokens par slot, tokens par token du message recopié).
+# max_tokens suit ce que la réponse peut contenir au plus, la réflexion de
+# Qwen3 est désactivée, et la réponse est lue en streaming puis coupée dès
+# que l'objet JSON est complet (json_stream.py).
+GENERATION_PROFILES: Dict[str, Tuple[int, int, float]] = {
+    "route": (48, 0, 1.5),     # {"intents": [...]} recopie des parties du message
+    "switch": (32, 0, 0.0),    # {"mode": ..., "intent": ...}
+    "extract": (24, 16, 1.0),  # {"slots": {...}} : une valeur par slot
+    "slot": (24, 0, 1.0),      # {"value": ...}
+}
+JSON_MAX_TOKENS = 256
+JSON_STOP = ["\n\n\n"]
+
+
+def generation_profile(name: str, text: Optional[str] = None, slots: int = 0) -> Dict[str, Any]:
+    """
+    Paramètres de send_llama_chat pour un appel JSON de type `name`
+    ("route", "switch", "extract", "slot"). `text` : message dont la réponse
+    peut recopier des parties ; `slots` : nombre de valeurs attendues.
+    """
+    base, per_slot, per_token = GENERATION_PROFILES[name]
+    max_tokens = base + per_slot * slots + int(per_token * count_tokens(text)) if text else base + per_slot * slots
+    return {
+        "max_tokens": min(max_tokens, JSON_MAX_TOKENS),
+        "stop": JSON_STOP,
+        "thinking": False,
+        "json_stream": True,
+    }
 
 
 def send_llama_chat(
@@ -22,10 +72,27 @@ def send_llama_chat(
     history: Optional[List[Dict[str, str]]] = None,
     temperature: float = 0.0,
     max_tokens: int = 512,
+    verbose: bool = True,
+    backend: Optional[str] = None,
+    priority: str = INTERACTIVE,
+    stop: Optional[List[str]] = None,
+    thinking: bool = True,
+    json_stream: bool = False,
 ) -> str:
     """
     Client simple pour ton llama-server, style OpenAI.
+    La requête part vers le serveur le moins chargé du pool (ou `backend`
+    s'il est précisé), avec bascule sur un autre serveur en cas d'échec.
+    Les messages sont réduits si besoin pour tenir dans le contexte du
+    modèle (prompt_budget.fit_messages).
+    Le timeout est borné par le temps restant du tour (deadlines.py).
+    `priority` : INTERACTIVE (défaut) ou BACKGROUND pour les traitements de
+    masse, qui ne doivent pas retarder les tours des utilisateurs.
+    `stop`, `thinking`, `json_stream` : voir generation_profile() ; avec
+    `json_stream` la génération s'arrête dès que l'objet JSON est complet.
+    Appelé depuis un handler annulé (skill_executor.py) : lève HandlerCancelled.
     """
+    check_cancelled()
     if history is None:
         history = []
 
@@ -40,10 +107,12 @@ def send_llama_chat(
             *history,
             {"role": "user", "content": user_content},
         ]
+    messages = fit_messages(messages, max_tokens)
 
-    print("Messages envoyés au modèle:")
-    for msg in messages:
-        print(f"{msg['role'].upper()}: {msg['content']}")
+    if verbose and tracing.enabled(tracing.DEBUG):
+        tracing.debug("Messages envoyés au modèle:\n%s", "\n".join(
+            f"{msg['role'].upper()}: {msg['content']}" for msg in messages
+        ))
 
     payload = {
         "model": MODEL_NAME,
@@ -51,25 +120,115 @@ def send_llama_chat(
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
-
+    if stop:
+        payload["stop"] = stop
+    if not thinking:
+        # Qwen3 : pas de bloc <think> avant la réponse
+        payload["chat_template_kwargs"] = {"enable_thinking": False}
+    if json_stream:
+        payload["stream"] = True
+        # usage dans le dernier morceau : lu seulement si le flux va jusqu'au bout
+        payload["stream_options"] = {"include_usage": True}
+
+    pool = llm_pool()
     try:
-        response = requests.post(LLAMA_SERVER_URL, json=payload, timeout=60)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        raise RuntimeError(f"Erreur lors de l'appel à llama-server: {e}") from e
-
-    data = response.json()
+        # Attente d'une place (priorité, équité entre sessions), puis appel
+        with get_llm_scheduler(len(pool.backends)).slot(priority, current_session(), timeout_for(LLM_TIMEOUT)):
+            data = pool.post(payload, timeout=timeout_for(LLM_TIMEOUT), only=backend)
+    except RuntimeError as e:
+        if expired() and not isinstance(e, DeadlineExceeded):
+            raise DeadlineExceeded(f"Budget de temps du tour épuisé: {e}") from e
+        raise
 
     try:
-        return data["choices"][0]["message"]["content"]
+        content = data["choices"][0]["message"]["content"]
     except (KeyError, IndexError) as e:
         raise RuntimeError(f"Format de réponse inattendu: {data}") from e
+    if tracing.active():
+        # Compte exact de llama-server (champ usage) si fourni, sinon estimation
+        usage = data.get("usage") or {}
+        tracing.add_llm_call(
+            usage.get("prompt_tokens") or messages_tokens(messages),
+            usage.get("completion_tokens") or count_tokens(content or ""),
+            estimated=not usage,
+        )
+    return content
+
+
+def llm_pool():
+    return get_llm_pool(LLAMA_SERVER_URLS or [LLAMA_SERVER_URL])
+
+
+# =========================
+# Santé du serveur et préchauffage
+# =========================
+
+HEALTH_TIMEOUT = 2.0    # un serveur injoignable est signalé en 2 s, pas 60
+WARMUP_TIMEOUT = 60.0   # attente max du chargement du modèle (/health en 503)
+
+
+def check_llama_server(timeout: float = WARMUP_TIMEOUT, url: str | None = None) -> Dict[str, Any]:
+    """
+    Attend que llama-server soit prêt (/health) puis retourne ses propriétés
+    (/props : nombre de slots, taille de contexte...). Lève RuntimeError tout
+    de suite si le serveur est injoignable, ou après `timeout` secondes si le
+    modèle est toujours en cours de chargement.
+    """
+    import requests
+
+    base = base_url(url or LLAMA_SERVER_URL)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = requests.get(f"{base}/health", timeout=HEALTH_TIMEOUT)
+        except requests.RequestException as e:
+            raise RuntimeError(f"llama-server injoignable sur {base}: {e}") from e
+        if response.status_code == 200:
+            break
+        # 503 pendant le chargement du modèle
+        if time.monotonic() >= deadline:
+            raise RuntimeError(
+                f"llama-server pas prêt après {timeout:.0f} s (HTTP {response.status_code})"
+            )
+        time.sleep(0.5)
+
+    try:
+        props = requests.get(f"{base}/props", timeout=HEALTH_TIMEOUT).json()
+    except (requests.RequestException, ValueError):
+        props = {}
+    return props if isinstance(props, dict) else {}
+
+
+def warm_prompts(prompts: List[str], parallel: int | None = None, backend: str | None = None) -> int:
+    """
+    Envoie chaque prompt système avec max_tokens=1 pour que llama-server en
+    garde le préfixe dans son cache KV. Les vrais appels commencent par le
+    même prompt système : seul le message utilisateur reste à calculer.
+    Retourne le nombre de prompts préchauffés avec succès.
+    """
+    if not prompts:
+        return 0
+
+    def warm(prompt: str) -> bool:
+        try:
+            send_llama_chat(system_prompt=prompt, max_tokens=1, verbose=False,
+                            backend=backend, priority=BACKGROUND)
+            return True
+        except RuntimeError as e:
+            tracing.warning("Préchauffage impossible: %s", e)
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel or len(prompts), len(prompts)))) as executor:
+        return sum(executor.map(warm, prompts))
 
 
 # =========================
 # Utilitaire JSON robuste
 # =========================
 
+_THINK = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+
+
 def parse_json_loose(text: str) -> dict:
     """
     Essaie de parser du JSON même si le modèle a mis des ```json ... ``` autour.
@@ -77,7 +236,8 @@ def parse_json_loose(text: str) -> dict:
     """
     if not text:
         return {}
-    s = text.strip()
+    # Réflexion éventuelle du modèle (Qwen3) avant le JSON
+    s = _THINK.sub("", text).strip()
 
     # Enlever les fences markdown éventuelles
     if s.startswith("```"):
@@ -103,11 +263,18 @@ def parse_json_loose(text: str) -> dict:
 # Slot filling générique
 # =========================
 
+# Réponse à une question de slot : si elle est courte, on n'extrait que ce
+# slot (prompt et sortie minimes) ; plus longue ou énumérée ("demain, à 10h
+# et avec Paul"), elle apporte sans doute d'autres valeurs -> extraction complète
+SLOT_ANSWER_MAX_WORDS = 6
+_ENUMERATION = re.compile(r"[,;\n]|\bet\b", re.IGNORECASE)
+
 @dataclass
 class Slot:
     name: str         # ex: "city"
     description: str  # description pour le LLM
     question: str     # question à poser si ce slot manque
+    required: bool = True  # un slot optionnel n'empêche pas on_ready
 
 
 class DialogStatus(Enum):
@@ -118,46 +285,41 @@ class DialogStatus(Enum):
 class GenericDialog:
     """
     Moteur générique de "slot filling" pour UN type de conversation.
+    `slots` est la liste du Skill (partagée) ; `values` ne contient que les
+    slots déjà remplis.
     """
 
+    __slots__ = ("slots", "values", "status")
+
     def __init__(self, slots: List[Slot]):
         self.slots: List[Slot] = slots
-        self.values: Dict[str, Optional[str]] = {s.name: None for s in slots}
+        self.values: Dict[str, str] = {}
         self.status: DialogStatus = DialogStatus.COLLECTING
 
     # --- Helpers ---
 
     def missing_slots(self) -> List[Slot]:
-        return [s for s in self.slots if not self.values.get(s.name)]
+        return [s for s in self.slots if s.required and not self.values.get(s.name)]
 
     def is_ready(self) -> bool:
-        return all(self.values.get(s.name) for s in self.slots)
-
-    # --- LLM: extraction générique ---
-
-    def analyze_user_message(self, user_message: str) -> None:
-        """
-        Demande au LLM d'extraire les valeurs de tous les slots
-        à partir du message utilisateur, en tenant compte des valeurs déjà connues.
-        Inclut :
-        - un prompt avec exemple,
-        - un retry ultra-strict si pas de JSON,
-        - la prise en compte des nombres (int/float/bool).
-        """
-        if not self.slots:
-            self.status = DialogStatus.READY
-            return
+        return all(self.values.get(s.name) for s in self.slots if s.required)
 
+    def slots_description(self) -> str:
         slot_specs = []
         for s in self.slots:
             current_val = self.values.get(s.name)
             slot_specs.append(
                 f'- "{s.name}": {s.description}. Valeur actuelle = {current_val!r}'
             )
-        slots_description = "\n".join(slot_specs)
+        return "\n".join(slot_specs)
 
-        # --- 1er prompt : explicatif + exemple ---
-        system_prompt = f"""
+    def extraction_prompt(self) -> str:
+        """
+        Prompt système d'extraction. Au premier tour (aucune valeur connue)
+        il ne dépend que du skill : c'est celui que warmup() préchauffe.
+        """
+        slots_description = self.slots_description()
+        return f"""
 Tu es un assistant chargé d'extraire des informations structurées
 à partir du message utilisateur.
 
@@ -207,14 +369,97 @@ Réponse attendue :
 }}
 """
 
+    def slot_answer_prompt(self, slot: Slot) -> str:
+        """Prompt système d'extraction ciblée : la valeur d'un seul slot."""
+        known = ", ".join(f"{name}={value!r}" for name, value in self.values.items())
+        return f"""
+Tu extrais UNE information de la réponse de l'utilisateur.
+Question posée : "{slot.question}"
+Information attendue : {slot.description}.
+Déjà connu : {known or "rien"}
+
+Réponds STRICTEMENT en JSON, sans texte autour :
+{{"value": "valeur ou null"}}
+
+Mets null si la réponse ne contient pas cette information.
+"""
+
+    # --- LLM: extraction générique ---
+
+    def _analyze_slot_answer(self, slot_name: str, user_message: str) -> bool:
+        """
+        Extraction ciblée de la réponse à la question du slot `slot_name`.
+        False si la réponse ne convient pas à ce mode (longue, énumération,
+        valeur introuvable) : l'appelant fait alors l'extraction complète.
+        """
+        slot = next((s for s in self.slots if s.name == slot_name), None)
+        if slot is None:
+            return False
+        if len(user_message.split()) > SLOT_ANSWER_MAX_WORDS or _ENUMERATION.search(user_message):
+            return False
+
+        with tracing.span("extract", mode="slot", slot=slot.name):
+            raw_answer = send_llama_chat(
+                system_prompt=self.slot_answer_prompt(slot),
+                user_content=user_message,
+                temperature=0.0,
+                **generation_profile("slot", user_message),
+            )
+        tracing.debug("Analyse LLM slot ciblé (brut): %s", raw_answer)
+        value = parse_json_loose(raw_answer).get("value")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or not value.strip() or value.strip().lower() == "null":
+            return False
+
+        self.values[slot.name] = value.strip()
+        return True
+
+    def analyze_user_message(
+        self,
+        user_message: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        target: Optional[str] = None,
+    ) -> None:
+        """
+        Demande au LLM d'extraire les valeurs de tous les slots
+        à partir du message utilisateur, en tenant compte des valeurs déjà connues.
+        Inclut :
+        - un prompt avec exemple,
+        - un retry ultra-strict si pas de JSON,
+        - la prise en compte des nombres (int/float/bool).
+        `history` : échanges précédents (ex : la question posée pour un slot).
+        `target` : slot dont on vient de poser la question ; une réponse courte
+        est d'abord extraite pour ce slot seul (voir SLOT_ANSWER_MAX_WORDS).
+        """
+        if not self.slots:
+            self.status = DialogStatus.READY
+            return
+
+        if target is not None and self._analyze_slot_answer(target, user_message):
+            self.status = DialogStatus.READY if self.is_ready() else DialogStatus.COLLECTING
+            tracing.debug("Valeurs actuelles: %s\nStatus: %s", self.values, self.status.name)
+            return
+
+        with tracing.span("extract", mode="full", slots=len(self.slots)):
+            self._extract_all(user_message, history)
+
+    def _extract_all(self, user_message: str, history: Optional[List[Dict[str, str]]]) -> None:
+        """Extraction de tous les slots (avec retry strict)."""
+        slots_description = self.slots_description()
+
+        # --- 1er prompt : explicatif + exemple ---
+        system_prompt = self.extraction_prompt()
+
         raw_answer = send_llama_chat(
             system_prompt=system_prompt,
             user_content=user_message,
+            history=history,
             temperature=0.0,
-            max_tokens=256,
+            **generation_profile("extract", user_message, len(self.slots)),
         )
 
-        print("Analyse LLM slots (brut, tentative 1):", raw_answer)
+        tracing.debug("Analyse LLM slots (brut, tentative 1): %s", raw_answer)
         data = parse_json_loose(raw_answer)
         slots_data = data.get("slots")
 
@@ -248,14 +493,14 @@ Si tu ne connais pas une valeur, mets-la à null.
                 system_prompt=strict_prompt,
                 user_content=None,     # tout est dans le system_prompt
                 temperature=0.0,
-                max_tokens=256,
+                **generation_profile("extract", user_message, len(self.slots)),
             )
-            print("Analyse LLM slots (brut, tentative 2):", raw_answer)
+            tracing.debug("Analyse LLM slots (brut, tentative 2): %s", raw_answer)
             data = parse_json_loose(raw_answer)
             slots_data = data.get("slots", {})
 
         if not isinstance(slots_data, dict):
-            print("Impossible de parser les slots, aucune mise à jour.")
+            tracing.warning("Impossible de parser les slots, aucune mise à jour.")
             slots_data = {}
 
         # --- Mise à jour des valeurs (en acceptant aussi les nombres) ---
@@ -290,8 +535,7 @@ Si tu ne connais pas une valeur, mets-la à null.
         else:
             self.status = DialogStatus.COLLECTING
 
-        print("Valeurs actuelles:", self.values)
-        print("Status:", self.status.name)
+        tracing.debug("Valeurs actuelles: %s\nStatus: %s", self.values, self.status.name)
 
     # --- Décision de la prochaine action ---
 
@@ -322,6 +566,26 @@ class Skill:
     slots: List[Slot]
     final_answer_system_prompt: str
     on_ready: Optional[Callable[[Dict[str, str]], Any]] = None
+    concurrency: int = HANDLER_CONCURRENCY  # handlers simultanés de ce skill
+    timeout: float = HANDLER_TIMEOUT        # au-delà, réponse "en cours" (skill_executor.py)
+    # {slot: actions} : actions dont le slot prend l'ID d'un élément listé (references.py)
+    references: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+
+def _is_error(result: Any) -> bool:
+    """Résultat d'erreur d'un handler ({"type": "..._error"} ou message d'exception)."""
+    if isinstance(result, dict):
+        return str(result.get("type", "")).endswith("_error")
+    return result == HANDLER_ERROR_MESSAGE
+
+
+def _is_pending(result: Any) -> bool:
+    """Handler passé en arrière-plan ({"type": "..._pending"})."""
+    return isinstance(result, dict) and str(result.get("type", "")).endswith("_pending")
+
+
+SNAPSHOT_VERSION = 5
+RESET_COMMANDS = {"reset", "annule", "annuler", "stop"}
 
 
 class MultiSkillAgent:
@@ -333,61 +597,317 @@ class MultiSkillAgent:
     - last_asked_slot_name : quel slot on est en train de demander
     - smart switch : quand on attend une réponse de slot, on demande au LLM
       s'il faut continuer ce skill ou passer à un autre.
+
+    Un serveur garde des milliers d'agents en mémoire : l'état propre à la
+    session est réduit au minimum (__slots__, dialogs créés à la demande,
+    index des skills partagé si on passe un dict) et se sérialise en
+    quelques dizaines d'octets (snapshot / restore).
     """
 
-    def __init__(self, skills: List[Skill]):
-        self.skills: Dict[str, Skill] = {s.name: s for s in skills}
-        self.dialogs: Dict[str, GenericDialog] = {
-            s.name: GenericDialog(s.slots) for s in skills
-        }
+    __slots__ = (
+        "session_id", "skills", "dialogs", "current_skill_name",
+        "awaiting_slot_answer", "last_asked_slot_name", "memory", "results", "list_shown",
+        "queued", "warmup_report",
+    )
+
+    def __init__(
+        self,
+        skills: Union[List[Skill], Dict[str, Skill]],
+        warmup: bool = False,
+        session_id: Optional[str] = None,
+    ):
+        # Identifiant de session : garde la conversation sur le même serveur LLM
+        self.session_id: str = session_id or uuid.uuid4().hex
+        # Un dict {nom: Skill} est utilisé tel quel (partagé entre sessions)
+        self.skills: Dict[str, Skill] = skills if isinstance(skills, dict) else {s.name: s for s in skills}
+        # Créés au premier message qui concerne le skill (voir dialog())
+        self.dialogs: Dict[str, GenericDialog] = {}
         self.current_skill_name: Optional[str] = None
         self.awaiting_slot_answer: bool = False
         self.last_asked_slot_name: Optional[str] = None
+        # Historique borné en tokens, créé au premier échange
+        self.memory: Optional[ConversationMemory] = None
+        # Dernière liste renvoyée par chaque skill : {skill: ((ID, texte), ...)}
+        self.results: Optional[Dict[str, Tuple[references.Item, ...]]] = None
+        # La dernière liste a été affichée au tour précédent ("lis le 2e" juste après)
+        self.list_shown: bool = False
+        # Sous-tâches multi-intent incomplètes, reprises une à une : ((skill, valeurs), ...)
+        self.queued: Optional[Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...]] = None
+
+        # Préchauffage optionnel : un serveur absent est signalé tout de suite,
+        # l'agent reste utilisable (le serveur peut démarrer plus tard).
+        self.warmup_report: Optional[Dict[str, Any]] = None
+        if warmup:
+            try:
+                self.warmup_report = self.warmup()
+            except RuntimeError as e:
+                tracing.warning("Avertissement: %s", e)
 
-    # --- Intent detection ---
+    def dialog(self, skill_name: str) -> GenericDialog:
+        """Dialog en cours pour ce skill (créé au besoin)."""
+        dialog = self.dialogs.get(skill_name)
+        if dialog is None:
+            dialog = self.dialogs[skill_name] = GenericDialog(self.skills[skill_name].slots)
+        return dialog
 
-    def classify_intent(self, user_message: str) -> str:
-        skills_desc = []
-        for s in self.skills.values():
-            skills_desc.append(f'- "{s.name}": {s.description}')
-        skills_text = "\n".join(skills_desc)
+    def history(self, last: Optional[int] = None) -> List[Dict[str, str]]:
+        """Historique de la session pour send_llama_chat (voir ConversationMemory.messages)."""
+        return self.memory.messages(last) if self.memory is not None else []
 
-        system_prompt = f"""
+    # --- Snapshot ---
+
+    def snapshot(self) -> bytes:
+        """
+        État de la session en binaire compact (marshal) : de quoi la sortir
+        de la mémoire et la recréer plus tard avec restore(). Le format
+        dépend de la version de Python : c'est un format de travail, pas
+        d'archivage.
+        """
+        dialogs = tuple(
+            (name, dialog.status is DialogStatus.READY, tuple(dialog.values.items()))
+            for name, dialog in self.dialogs.items()
+            if dialog.values or dialog.status is not DialogStatus.COLLECTING
+        )
+        memory = self.memory.snapshot() if self.memory is not None else None
+        return marshal.dumps((
+            SNAPSHOT_VERSION,
+            self.session_id,
+            self.current_skill_name,
+            self.awaiting_slot_answer,
+            self.last_asked_slot_name,
+            dialogs,
+            memory,
+            tuple(self.results.items()) if self.results else None,
+            self.list_shown,
+            self.queued,
+        ))
+
+    @classmethod
+    def restore(cls, skills: Union[List[Skill], Dict[str, Skill]], data: bytes) -> "MultiSkillAgent":
+        """
+        Recrée un agent depuis snapshot(). Les skills ou slots qui n'existent
+        plus sont ignorés. Lève ValueError si les données sont illisibles.
+        """
+        try:
+            state = marshal.loads(data)
+            version, session_id, current, awaiting, last_asked, dialogs = state[:6]
+        except (EOFError, TypeError, ValueError) as e:
+            raise ValueError(f"Snapshot de session illisible: {e}") from e
+        if version not in (1, 2, 3, 4, SNAPSHOT_VERSION):
+            raise ValueError(f"Version de snapshot inconnue: {version}")
+
+        agent = cls(skills, session_id=session_id)
+        for name, ready, values in dialogs:
+            if name not in agent.skills:
+                continue
+            dialog = agent.dialog(name)
+            known = {s.name for s in dialog.slots}
+            dialog.values = {k: v for k, v in values if k in known}
+            dialog.status = DialogStatus.READY if ready else DialogStatus.COLLECTING
+        if current in agent.skills:
+            agent.current_skill_name = current
+            agent.awaiting_slot_answer = awaiting
+            agent.last_asked_slot_name = last_asked
+        if version >= 2 and state[6] is not None:
+            summary, turns = state[6]
+            agent.memory = ConversationMemory(list(turns), summary)
+        if version >= 3 and state[7]:
+            agent.results = {
+                skill: tuple(tuple(item) for item in items)
+                for skill, items in state[7] if skill in agent.skills
+            }
+        if version >= 4:
+            agent.list_shown = state[8]
+        if version >= 5 and state[9]:
+            agent.queued = tuple(task for task in state[9] if task[0] in agent.skills) or None
+        return agent
+
+    # --- Prompts système ---
+    #
+    # Les parties fixes viennent en tête : elles ne dépendent que de la liste
+    # des skills, et restent donc dans le cache KV de llama-server d'un tour
+    # à l'autre (et dès le premier tour après warmup()).
+
+    def skills_text(self) -> str:
+        return "\n".join(f'- "{s.name}": {s.description}' for s in self.skills.values())
+
+    def router_prompt(self) -> str:
+        skills_text = self.skills_text()
+        return f"""
 Tu es un routeur de requêtes.
 On dispose des types de conversation (skills) suivants :
 
 {skills_text}
 
-À partir du message utilisateur ci-dessous, tu dois choisir
-le *meilleur* skill parmi la liste.
+Le message utilisateur ci-dessous peut contenir UNE ou PLUSIEURS demandes.
+Pour chaque demande, choisis le *meilleur* skill parmi la liste et recopie
+la partie du message qui la concerne.
 
 Tu réponds STRICTEMENT en JSON :
 
 {{
-  "intent": "nom_du_skill"
+  "intents": [
+    {{"intent": "nom_du_skill", "message": "partie du message"}}
+  ]
 }}
 
 - "intent" doit être exactement égal à l'un des noms listés ci-dessus.
+- S'il n'y a qu'une demande, la liste contient un seul élément avec le message complet.
+
+Exemple :
+Message : "résume mes mails non lus et montre mon agenda de demain"
+Réponse :
+{{
+  "intents": [
+    {{"intent": "email", "message": "résume mes mails non lus"}},
+    {{"intent": "calendar", "message": "montre mon agenda de demain"}}
+  ]
+}}
 """
 
-        raw = send_llama_chat(
-            system_prompt=system_prompt,
-            user_content=user_message,
-            temperature=0.0,
-            max_tokens=128,
-        )
+    def smart_switch_prompt(self) -> str:
+        """Partie fixe du prompt de smart switch ; le contexte du tour est ajouté à la suite."""
+        skills_text = self.skills_text()
+        return f"""
+Tu es un classificateur de contexte de conversation.
+
+Les skills possibles sont :
+{skills_text}
+
+Ta tâche:
+1. Dire si l'utilisateur, dans son message, semble:
+   - répondre à la question en cours pour le skill indiqué dans le contexte
+   - ou bien entamer une nouvelle demande qui correspond à un autre skill
+2. Si c'est une nouvelle demande, indiquer le skill le plus pertinent.
+
+Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
+
+{{
+  "mode": "continue" | "switch",
+  "intent": "nom_du_skill_ou_null"
+}}
+
+- "mode" = "continue" si l'utilisateur répond à la question du slot en cours.
+- "mode" = "switch" si l'utilisateur commence une nouvelle demande.
+- Si "mode" = "switch", "intent" doit être un des noms de skill valides ci-dessus
+  ou "null" si tu n'es pas sûr.
+"""
 
-        print("Analyse LLM intent (brut):", raw)
+    # --- Préchauffage ---
+
+    def warmup(self, timeout: float = WARMUP_TIMEOUT) -> Dict[str, Any]:
+        """
+        Vérifie que chaque llama-server du pool répond, puis préchauffe en
+        parallèle les préfixes fixes (routeur, smart switch, extraction de
+        chaque skill) pour que le premier vrai tour profite du cache KV.
+        Lève RuntimeError si aucun serveur n'est joignable.
+        """
+        start = time.perf_counter()
+        prompts = [self.router_prompt(), self.smart_switch_prompt()]
+        prompts += [
+            GenericDialog(skill.slots).extraction_prompt()
+            for skill in self.skills.values() if skill.slots
+        ]
+
+        def warm_backend(url: str) -> Dict[str, Any]:
+            try:
+                props = check_llama_server(timeout, url)
+            except RuntimeError as e:
+                tracing.warning("Avertissement: %s", e)
+                return {"url": url, "reachable": False, "warmed": 0}
+            # Au-delà du nombre de slots du serveur, les préfixes s'évinceraient
+            # les uns les autres : on n'en envoie pas plus à la fois.
+            slots = props.get("total_slots") if isinstance(props.get("total_slots"), int) else None
+            calibrate_tokens(url)
+            n_ctx = props.get("default_generation_settings", {}).get("n_ctx")
+            return {
+                "url": url,
+                "reachable": True,
+                "warmed": warm_prompts(prompts, slots, backend=url),
+                "server_slots": slots,
+                "n_ctx": n_ctx,
+            }
+
+        urls = llm_pool().urls
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            backends = list(executor.map(warm_backend, urls))
+
+        if not any(b["reachable"] for b in backends):
+            raise RuntimeError("Aucun llama-server joignable : " + ", ".join(urls))
+
+        # Capacité réelle du pool : le scheduler ne dépasse pas le nombre de slots
+        if all(b.get("server_slots") for b in backends if b["reachable"]):
+            get_llm_scheduler(len(urls)).set_capacity(
+                sum(b["server_slots"] for b in backends if b["reachable"])
+            )
+        # Les prompts doivent tenir dans le plus petit contexte du pool
+        contexts = [b["n_ctx"] for b in backends if isinstance(b.get("n_ctx"), int)]
+        if contexts:
+            set_context_size(min(contexts))
+
+        report = {
+            "prompts": len(prompts),
+            "backends": backends,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000),
+        }
+        warmed = sum(b["warmed"] for b in backends)
+        tracing.info("Préchauffage llama-server: %d/%d prompts en %d ms", warmed, len(prompts) * len(urls), report["elapsed_ms"])
+        return report
+
+    # --- Intent detection ---
+
+    def plan_intents(self, user_message: str) -> List[tuple[str, str]]:
+        """
+        Découpe le message en une ou plusieurs tâches (skill, sous-message).
+        Ex: "résume mes mails non lus et montre mon agenda de demain"
+        -> [("email", "résume mes mails non lus"), ("calendar", "montre mon agenda de demain")]
+        Un seul appel LLM, comme le routage simple.
+        """
+        system_prompt = self.router_prompt()
+
+        with tracing.span("route") as span:
+            raw = send_llama_chat(
+                system_prompt=system_prompt,
+                user_content=user_message,
+                temperature=0.0,
+                **generation_profile("route", user_message),
+            )
+            tasks = self._parse_intents(raw, user_message)
+            span.set(intents=[name for name, _ in tasks])
+        return tasks
+
+    def _parse_intents(self, raw: str, user_message: str) -> List[tuple[str, str]]:
+        tracing.debug("Analyse LLM intent (brut): %s", raw)
 
         data = parse_json_loose(raw)
-        intent = data.get("intent")
+        items = data.get("intents")
+        if not isinstance(items, list):
+            # Ancien format {"intent": "..."} toléré
+            items = [{"intent": data.get("intent"), "message": user_message}]
+
+        tasks: List[tuple[str, str]] = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            intent = item.get("intent")
+            if intent not in self.skills:
+                continue
+            sub_message = item.get("message")
+            if not isinstance(sub_message, str) or not sub_message.strip():
+                sub_message = user_message
+            tasks.append((intent, sub_message.strip()))
 
-        if intent not in self.skills:
-            if "smalltalk" in self.skills:
-                return "smalltalk"
-            return next(iter(self.skills.keys()))
+        if not tasks:
+            fallback = "smalltalk" if "smalltalk" in self.skills else next(iter(self.skills.keys()))
+            return [(fallback, user_message)]
 
-        return intent
+        # Une seule tâche : elle garde le message complet (contexte intact)
+        if len(tasks) == 1:
+            return [(tasks[0][0], user_message)]
+        return tasks
+
+    def classify_intent(self, user_message: str) -> str:
+        return self.plan_intents(user_message)[0][0]
 
     # --- Smart switch ---
 
@@ -402,7 +922,6 @@ Tu réponds STRICTEMENT en JSON :
             return "route", None
 
         skill = self.skills[self.current_skill_name]
-        dialog = self.dialogs[self.current_skill_name]
 
         slot_desc = ""
         if self.last_asked_slot_name:
@@ -411,56 +930,26 @@ Tu réponds STRICTEMENT en JSON :
                     slot_desc = f'nom="{s.name}", description="{s.description}", question="{s.question}"'
                     break
 
-        skills_desc = []
-        for s in self.skills.values():
-            skills_desc.append(f'- "{s.name}": {s.description}')
-        skills_text = "\n".join(skills_desc)
-
-        system_prompt = f"""
-Tu es un classificateur de contexte de conversation.
-
+        system_prompt = self.smart_switch_prompt() + f"""
 Contexte:
 - Le système est actuellement en train de traiter le skill "{self.current_skill_name}".
 - Il attend une réponse de l'utilisateur à propos d'un champ (slot) spécifique :
   {slot_desc}
-
-Les skills possibles sont :
-{skills_text}
-
-Message utilisateur actuel:
-"{user_message}"
-
-Ta tâche:
-1. Dire si l'utilisateur semble:
-   - répondre à la question en cours pour ce skill
-   - ou bien entamer une nouvelle demande qui correspond à un autre skill
-2. Si c'est une nouvelle demande, indiquer le skill le plus pertinent.
-
-Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
-
-{{
-  "mode": "continue" | "switch",
-  "intent": "nom_du_skill_ou_null"
-}}
-
-- "mode" = "continue" si l'utilisateur répond à la question du slot en cours.
-- "mode" = "switch" si l'utilisateur commence une nouvelle demande.
-- Si "mode" = "switch", "intent" doit être un des noms de skill valides ci-dessus
-  ou "null" si tu n'es pas sûr.
 """
 
-        raw = send_llama_chat(
-            system_prompt=system_prompt,
-            user_content=user_message,
-            temperature=0.0,
-            max_tokens=128,
-        )
-
-        print("Analyse LLM smart switch (brut):", raw)
+        with tracing.span("switch") as span:
+            raw = send_llama_chat(
+                system_prompt=system_prompt,
+                user_content=user_message,
+                temperature=0.0,
+                **generation_profile("switch"),
+            )
+            tracing.debug("Analyse LLM smart switch (brut): %s", raw)
 
-        data = parse_json_loose(raw)
-        mode = data.get("mode")
-        intent = data.get("intent")
+            data = parse_json_loose(raw)
+            mode = data.get("mode")
+            intent = data.get("intent")
+            span.set(mode=mode, intent=intent)
 
         if mode not in {"continue", "switch"}:
             return "continue", None
@@ -479,11 +968,51 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
         self.current_skill_name = None
         self.awaiting_slot_answer = False
         self.last_asked_slot_name = None
+        self.memory = None
+        self.results = None
+        self.list_shown = False
+        self.queued = None
+        # Handlers encore en cours pour cette session
+        get_skill_executor().cancel(self.session_id)
         # on peut aussi reset les dialogs si besoin
 
     # --- Orchestration d'un message utilisateur ---
 
-    def handle_user_message(self, user_message: str) -> str:
+    def handle_user_message(self, user_message: str, budget: Optional[float] = TURN_BUDGET) -> str:
+        """
+        Point d'entrée d'un tour. `budget` (secondes) borne la durée totale du
+        tour : chaque appel LLM et chaque handler voient le temps restant.
+        """
+        with session_scope(self.session_id), deadline_scope(budget), tracing.turn(self.session_id) as span:
+            try:
+                answer = self._handle_user_message(user_message)
+                if self.queued and self.current_skill_name is None:
+                    question = self._resume_queued()
+                    if question is not None:
+                        answer = f"{answer}\n\n{question}"
+            except DeadlineExceeded as e:
+                tracing.warning("Tour interrompu: %s", e)
+                span.set(deadline_exceeded=True)
+                return "Désolé, je n'ai pas réussi à répondre à temps. Peux-tu réessayer ?"
+            span.set(skill=self.current_skill_name, awaiting_slot=self.last_asked_slot_name)
+        answer = self._with_finished_tasks(answer)
+        if user_message.lower() not in RESET_COMMANDS:
+            if self.memory is None:
+                self.memory = ConversationMemory()
+            self.memory.add(user_message, answer, self.session_id)
+        return answer
+
+    def _with_finished_tasks(self, answer: str) -> str:
+        """Ajoute à la réponse les tâches d'arrière-plan terminées depuis le tour précédent."""
+        finished = get_skill_executor().collect(self.session_id)
+        if not finished:
+            return answer
+        for _, details in finished:
+            self._remember(details["skill"], details["result"])
+        done = "\n".join(f"- {message}" for message, _ in finished)
+        return f"Terminé entre-temps :\n{done}\n\n{answer}"
+
+    def _handle_user_message(self, user_message: str) -> str:
         """
         Traite un message utilisateur en combinant:
         - smart switch (si on est en slot-filling),
@@ -492,11 +1021,14 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
         - handler on_ready.
         """
 
-        if user_message.lower() in {"reset", "annule", "annuler", "stop"}:
+        if user_message.lower() in RESET_COMMANDS:
             self.reset_context()
             return "D'accord, on repart de zéro. De quoi veux-tu parler ?"
 
         skill_name: str
+        routed = False  # skill choisi par le routeur (pas de dialog en cours)
+        # Une liste affichée ne vaut que pour le tour qui la suit
+        list_shown, self.list_shown = self.list_shown, False
 
         # 1) Smart switch si on attend une réponse de slot
         if self.current_skill_name and self.awaiting_slot_answer:
@@ -504,9 +1036,9 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
 
             if decision == "continue":
                 skill_name = self.current_skill_name
-                print(f"[DEBUG] SmartSwitch => CONTINUE skill: {skill_name}")
+                tracing.debug("SmartSwitch => CONTINUE skill: %s", skill_name)
             elif decision == "switch":
-                print(f"[DEBUG] SmartSwitch => SWITCH skill (intent={switch_intent})")
+                tracing.debug("SmartSwitch => SWITCH skill (intent=%s)", switch_intent)
                 # on sort du skill courant
                 self.awaiting_slot_answer = False
                 self.last_asked_slot_name = None
@@ -523,30 +1055,56 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
                 skill_name = self.classify_intent(user_message)
                 self.current_skill_name = skill_name
         else:
-            # pas en attente de slot -> simple routing
-            print("MEssage utilisateur reçu:", user_message)
-            skill_name = self.classify_intent(user_message)
+            # Commande déjà vue : ni routage ni extraction
+            answer = self._fast_path(user_message)
+            if answer is not None:
+                return answer
+
+            tracing.debug("Message utilisateur reçu: %s", user_message)
+            referred = self._referred_skill(user_message) if list_shown else None
+            if referred is not None:
+                # "lis le deuxième" juste après une liste : skill de cette liste
+                skill_name = referred
+                tracing.debug("Référence à la dernière liste => skill: %s", skill_name)
+            else:
+                # pas en attente de slot -> routing (éventuellement multi-tâches)
+                routed = True
+                tasks = self.plan_intents(user_message)
+                if len(tasks) > 1:
+                    tracing.debug("Multi-intent: %s", [name for name, _ in tasks])
+                    return self.handle_multi_intent(tasks)
+                skill_name = tasks[0][0]
+                tracing.debug("Nouveau skill sélectionné: %s", skill_name)
             self.current_skill_name = skill_name
-            print(f"[DEBUG] Nouveau skill sélectionné: {skill_name}")
 
         skill = self.skills[skill_name]
-        dialog = self.dialogs[skill_name]
 
         # 2) Skill sans slots -> simple réponse LLM
         if not skill.slots:
             self.awaiting_slot_answer = False
             self.last_asked_slot_name = None
 
-            answer = send_llama_chat(
-                system_prompt=skill.final_answer_system_prompt,
-                user_content=user_message,
-                temperature=0.7,
-                max_tokens=256,
-            )
+            with tracing.span("render", skill=skill.name):
+                answer = send_llama_chat(
+                    system_prompt=skill.final_answer_system_prompt,
+                    user_content=user_message,
+                    history=self.history(),
+                    temperature=0.7,
+                    max_tokens=256,
+                )
             return answer
 
         # 3) Skill AVEC slots -> slot-filling
-        dialog.analyze_user_message(user_message)
+        dialog = self.dialog(skill_name)
+        # Réponse à une question de slot : l'extraction voit la question posée
+        answering = self.awaiting_slot_answer and self.last_asked_slot_name is not None
+        learnable = routed and not answering and not dialog.values
+        dialog.analyze_user_message(
+            user_message,
+            history=self.history(last=1) if answering else None,
+            target=self.last_asked_slot_name if answering else None,
+        )
+        self._resolve_references(skill, dialog, user_message)
         action, slot = dialog.next_action()
 
         if action == "ask_slot" and slot is not None:
@@ -563,30 +1121,12 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
 
             # 1) Handler Python si défini
             if skill.on_ready is not None:
-                try:
-                    result = skill.on_ready(values)
-                except Exception as e:
-                    print("Erreur dans le handler du skill:", e)
-                    result = "J'ai rencontré un problème en traitant ta demande."
-
-                if isinstance(result, str):
-                    answer = result
-                else:
-                    payload_json = json.dumps(result, ensure_ascii=False, indent=2)
-                    user_question = (
-                        f"Voici les données structurées produites par la logique métier "
-                        f"du skill '{skill.name}' :\n{payload_json}\n\n"
-                        "Formule une réponse claire et naturelle pour l'utilisateur."
-                    )
-
-                    answer = send_llama_chat(
-                        system_prompt=skill.final_answer_system_prompt,
-                        user_content=user_question,
-                        temperature=0.7,
-                        max_tokens=256,
-                    )
+                answer, result = self._answer_from_handler(skill, values)
+                # Demande résolue d'un coup : candidate pour le chemin rapide
+                if learnable and not _is_error(result):
+                    get_utterance_cache().learn(user_message, skill_name, values)
 
-                self.dialogs[skill_name] = GenericDialog(skill.slots)
+                self.dialogs.pop(skill_name, None)
                 self.current_skill_name = None
                 return answer
 
@@ -596,17 +1136,279 @@ Tu réponds STRICTEMENT en JSON, SANS texte autour, au format:
                 "Formule une réponse appropriée pour l'utilisateur."
             )
 
-            final_answer = send_llama_chat(
-                system_prompt=skill.final_answer_system_prompt,
-                user_content=user_question,
-                temperature=0.7,
-                max_tokens=256,
-            )
+            with tracing.span("render", skill=skill.name):
+                final_answer = send_llama_chat(
+                    system_prompt=skill.final_answer_system_prompt,
+                    user_content=user_question,
+                    temperature=0.7,
+                    max_tokens=256,
+                )
 
-            self.dialogs[skill_name] = GenericDialog(skill.slots)
+            self.dialogs.pop(skill_name, None)
             self.current_skill_name = None
             return final_answer
 
         self.awaiting_slot_answer = False
         self.last_asked_slot_name = None
         return "Je suis un peu perdu, peux-tu reformuler ?"
+
+    # --- Exécution des handlers ---
+
+    def _answer_from_handler(self, skill: Skill, values: Dict[str, str]) -> tuple[str, Any]:
+        """Appelle on_ready puis formule la réponse. Retourne (réponse, résultat brut)."""
+        result = self._run_on_ready(skill, values)
+        self._remember(skill.name, result)
+        if isinstance(result, str):
+            return result, result
+        if _is_pending(result):
+            return result["message"], result
+
+        # JSON compact, réduit au budget (ex : longue liste d'emails)
+        payload_json = fit_payload(result, RESULT_TOKENS)
+        user_question = (
+            f"Voici les données structurées produites par la logique métier "
+            f"du skill '{skill.name}' :\n{payload_json}\n\n"
+            "Formule une réponse claire et naturelle pour l'utilisateur."
+        )
+
+        try:
+            with tracing.span("render", skill=skill.name):
+                answer = send_llama_chat(
+                    system_prompt=skill.final_answer_system_prompt,
+                    user_content=user_question,
+                    temperature=0.7,
+                    max_tokens=256,
+                )
+        except DeadlineExceeded:
+            # L'action est déjà faite : on répond avec le message brut du handler
+            if not (isinstance(result, dict) and result.get("message")):
+                raise
+            answer = str(result["message"])
+        return answer, result
+
+    # --- Références aux listes affichées ---
+
+    def _remember(self, skill_name: str, result: Any) -> None:
+        results = references.remember(self.results, skill_name, result)
+        if results is not self.results:
+            self.results = results
+            self.list_shown = True
+
+    def _referred_skill(self, user_message: str) -> Optional[str]:
+        """
+        Skill de la dernière liste si le message est une commande explicite
+        sur un de ses éléments ("lis le deuxième"). Appelé seulement au tour
+        qui suit la liste.
+        """
+        last = references.latest(self.results)
+        if last is None:
+            return None
+        skill_name, items = last
+        skill = self.skills.get(skill_name)
+        if skill is None or not skill.references:
+            return None
+        return skill_name if references.command_reference(user_message, items) is not None else None
+
+    def _resolve_references(self, skill: Skill, dialog: GenericDialog, user_message: str) -> None:
+        """
+        Remplace "le deuxième", "celui de Marie"... par l'ID de l'élément
+        listé, pour les actions qui prennent un ID (Skill.references).
+        """
+        items = (self.results or {}).get(skill.name)
+        if not items:
+            return
+        action = (dialog.values.get("action") or "").strip().lower()
+        for slot_name, actions in skill.references.items():
+            if action not in actions:
+                continue
+            value = dialog.values.get(slot_name)
+            item_id = references.resolve(user_message, items)
+            if item_id is None and value:
+                item_id = references.resolve(value.partition("|")[0], items, loose=True)
+            if item_id is None:
+                continue
+            dialog.values[slot_name] = (
+                references.substitute(value, item_id, references.item_ids(items)) if value else item_id
+            )
+            tracing.debug("Référence résolue: %s = %r", slot_name, dialog.values[slot_name])
+        dialog.status = DialogStatus.READY if dialog.is_ready() else DialogStatus.COLLECTING
+
+    def _fast_path(self, user_message: str) -> Optional[str]:
+        """
+        Message de même forme qu'une commande déjà résolue plusieurs fois
+        (utterance_cache.py) : on appelle directement le handler, sans
+        routage ni extraction. None si le cache ne sait pas répondre.
+        """
+        cache = get_utterance_cache()
+        hit = cache.lookup(user_message)
+        if hit is None:
+            return None
+        skill_name, values = hit
+        skill = self.skills.get(skill_name)
+        if skill is None or skill.on_ready is None:
+            return None
+        if skill.references and (self.results or {}).get(skill_name):
+            # "le 2e" dépend de la liste affichée dans cette session
+            return None
+        if any(s.required and not values.get(s.name) for s in skill.slots):
+            return None
+
+        tracing.debug("Chemin rapide => %s %s", skill_name, values)
+        self.current_skill_name = None
+        self.awaiting_slot_answer = False
+        self.last_asked_slot_name = None
+        answer, result = self._answer_from_handler(skill, values)
+        if _is_error(result):
+            cache.demote(user_message)
+        return answer
+
+    def _run_on_ready(self, skill: Skill, values: Dict[str, str]) -> Any:
+        """Handler du skill sur le pool borné (skill_executor.py)."""
+        with tracing.span("handler", skill=skill.name) as span:
+            try:
+                result = get_skill_executor().run(skill, values, self.session_id)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                tracing.error("Erreur dans le handler du skill: %s", e)
+                result = HANDLER_ERROR_MESSAGE
+            span.set(status="pending" if _is_pending(result) else "error" if _is_error(result) else "ok")
+            return result
+
+    # --- Multi-intent ---
+
+    def _run_task(self, skill_name: str, sub_message: str) -> Dict[str, Any]:
+        """
+        Exécute une sous-tâche de bout en bout avec son propre dialog
+        (extraction des slots + handler). Sans effet sur l'état de la session.
+        """
+        skill = self.skills[skill_name]
+
+        if not skill.slots:
+            with tracing.span("render", skill=skill_name):
+                answer = send_llama_chat(
+                    system_prompt=skill.final_answer_system_prompt,
+                    user_content=sub_message,
+                    history=self.history(),
+                    temperature=0.7,
+                    max_tokens=256,
+                )
+            return {"skill": skill_name, "status": "answered", "result": answer}
+
+        dialog = GenericDialog(skill.slots)
+        dialog.analyze_user_message(sub_message)
+        action, slot = dialog.next_action()
+
+        if action == "ask_slot" and slot is not None:
+            return {"skill": skill_name, "status": "ask_slot", "slot": slot, "dialog": dialog}
+
+        values = {k: v for k, v in dialog.values.items() if v is not None}
+        if skill.on_ready is None:
+            result: Any = {"valeurs": values}
+        else:
+            result = self._run_on_ready(skill, values)
+        return {"skill": skill_name, "status": "done", "result": result}
+
+    def _resume_queued(self) -> Optional[str]:
+        """
+        Reprend la prochaine sous-tâche multi-intent en attente : elle
+        devient le skill courant. Retourne la question de son slot manquant.
+        """
+        while self.queued:
+            (skill_name, values), rest = self.queued[0], self.queued[1:]
+            self.queued = rest or None
+            skill = self.skills.get(skill_name)
+            if skill is None:
+                continue
+            dialog = GenericDialog(skill.slots)
+            dialog.values = dict(values)
+            action, slot = dialog.next_action()
+            if action != "ask_slot" or slot is None:
+                continue
+            self.dialogs[skill_name] = dialog
+            self.current_skill_name = skill_name
+            self.awaiting_slot_answer = True
+            self.last_asked_slot_name = slot.name
+            return slot.question
+        return None
+
+    def handle_multi_intent(self, tasks: List[tuple[str, str]]) -> str:
+        """
+        Exécute plusieurs sous-tâches en parallèle (extraction + handlers)
+        puis fusionne les résultats en une seule réponse.
+        Durée ~ la sous-tâche la plus lente, pas la somme.
+        """
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            # copy_context : les sous-tâches gardent la session (affinité de serveur)
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._run_task, name, text)
+                for name, text in tasks
+            ]
+            outcomes = []
+            for (name, _), future in zip(tasks, futures):
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    tracing.error("Erreur dans une sous-tâche: %s", e)
+                    outcomes.append({
+                        "skill": name,
+                        "status": "done",
+                        "result": "J'ai rencontré un problème en traitant cette partie de ta demande.",
+                    })
+
+        done = [o for o in outcomes if o["status"] != "ask_slot"]
+        for o in done:
+            self._remember(o["skill"], o["result"])
+        pending = [o for o in outcomes if o["status"] == "ask_slot"]
+
+        parts: List[str] = []
+        if done:
+            payload = [
+                {"skill": o["skill"], "resultat": o["result"]} for o in done
+            ]
+            if len(done) == 1 and isinstance(done[0]["result"], str):
+                parts.append(done[0]["result"])
+            else:
+                instructions = "\n\n".join(
+                    f"Pour le skill '{o['skill']}':\n{self.skills[o['skill']].final_answer_system_prompt.strip()}"
+                    for o in done
+                )
+                system_prompt = (
+                    "Tu es un assistant qui répond en une seule fois à plusieurs demandes de l'utilisateur.\n"
+                    "Tu reçois les résultats de chaque demande, dans l'ordre.\n\n"
+                    f"{instructions}\n\n"
+                    "Présente chaque résultat dans une partie distincte, "
+                    "en français, de manière naturelle et concise."
+                )
+                with tracing.span("render", skill=[o["skill"] for o in done]):
+                    parts.append(send_llama_chat(
+                        system_prompt=system_prompt,
+                        user_content=(
+                            "Voici les résultats des différentes demandes :\n"
+                            f"{fit_payload(payload, RESULT_TOKENS * len(done))}\n\n"
+                            "Formule une réponse unique, claire et naturelle pour l'utilisateur."
+                        ),
+                        temperature=0.7,
+                        max_tokens=512,
+                    ))
+
+        if pending:
+            # La première tâche incomplète devient le skill courant de la session,
+            # les suivantes sont reprises une à une quand elle est terminée
+            first = pending[0]
+            self.current_skill_name = first["skill"]
+            self.dialogs[first["skill"]] = first["dialog"]
+            self.awaiting_slot_answer = True
+            self.last_asked_slot_name = first["slot"].name
+            rest = tuple((o["skill"], tuple(o["dialog"].values.items())) for o in pending[1:])
+            if rest:
+                self.queued = rest + (self.queued or ())
+                names = ", ".join(f"'{name}'" for name, _ in rest)
+                parts.append(f"Il me manque aussi des informations pour {names} : on s'en occupe juste après.")
+            parts.append(first["slot"].question)
+        else:
+            self.current_skill_name = None
+            self.awaiting_slot_answer = False
+            self.last_asked_slot_name = None
+
+        return "\n\n".join(parts)
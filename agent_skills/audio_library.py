@@ -0,0 +1,331 @@
+# =========================
+# Bibliothèque audio indexée
+# =========================
+#
+# Scanne les dossiers de musique configurés et garde, pour chaque fichier :
+# nom normalisé, extension, taille, mtime et durée (lue dans l'en-tête pour
+# WAV / OGG, sans décoder). Le tout est persisté dans un cache JSON ; au
+# rescan, seuls les fichiers dont (taille, mtime) a changé sont relus.
+#
+# Un nouveau fichier change la date de modification de son dossier : en
+# cas de recherche infructueuse, on compare les dates des dossiers vus au
+# dernier scan (un stat par dossier, au plus toutes les
+# RESCAN_MIN_INTERVAL secondes) et on rescanne si l'une a bougé.
+#
+# La recherche ("joue Scandinavianz Morning") passe par un index de
+# trigrammes en mémoire : on ne compare la requête qu'aux fichiers qui
+# partagent au moins un trigramme, ce qui reste de l'ordre de la
+# milliseconde même avec des dizaines de milliers de fichiers.
+
+from typing import Dict, List, Optional, Set, Tuple
+import json
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+import wave
+
+import tracing
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg", ".oga", ".opus", ".flac", ".m4a"}
+MUSIC_DIRS = ["./Files", "./Music", os.path.expanduser("~/Music")]
+CACHE_FILE = "./Files/.audio_library.json"
+CACHE_VERSION = 1
+
+MIN_SCORE = 0.3
+RESCAN_MIN_INTERVAL = 2.0
+
+_RE_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(text: str) -> str:
+    """'Scandinavianz-Morning.MP3' -> 'scandinavianz morning'"""
+    base, ext = os.path.splitext(text)
+    if ext.lower() in AUDIO_EXTENSIONS:
+        text = base
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _RE_NON_ALNUM.sub(" ", text).strip()
+
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# =========================
+# Lecture des en-têtes (durée)
+# =========================
+
+def _wav_duration(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, "rb") as w:
+            rate = w.getframerate()
+            return round(w.getnframes() / rate, 2) if rate else None
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _ogg_duration(path: str) -> Optional[float]:
+    """
+    Durée d'un OGG (Vorbis / Opus) : fréquence lue dans le premier paquet,
+    position de granule lue dans la dernière page. Deux petites lectures.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(128)
+            if not head.startswith(b"OggS"):
+                return None
+            if (i := head.find(b"\x01vorbis")) != -1:
+                rate = struct.unpack_from("<I", head, i + 12)[0]
+            elif head.find(b"OpusHead") != -1:
+                rate = 48000  # les granules Opus sont toujours à 48 kHz
+            else:
+                return None
+
+            size = os.fstat(f.fileno()).st_size
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+    except OSError:
+        return None
+
+    last = tail.rfind(b"OggS")
+    if last == -1 or last + 14 > len(tail) or not rate:
+        return None
+    granule = struct.unpack_from("<q", tail, last + 6)[0]
+    return round(granule / rate, 2) if granule > 0 else None
+
+
+def read_duration(path: str, ext: str) -> Optional[float]:
+    if ext == ".wav":
+        return _wav_duration(path)
+    if ext in (".ogg", ".oga", ".opus"):
+        return _ogg_duration(path)
+    return None
+
+
+# =========================
+# Index
+# =========================
+
+class AudioLibrary:
+    """
+    Index des fichiers audio des dossiers configurés, avec recherche approchée.
+    """
+
+    def __init__(self, directories: Optional[List[str]] = None, cache_file: str = CACHE_FILE):
+        self.directories = directories if directories is not None else MUSIC_DIRS
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._paths: List[str] = []
+        self._names: List[str] = []
+        self._grams: List[Set[str]] = []
+        self._by_gram: Dict[str, List[int]] = {}
+        self._by_name: Dict[str, int] = {}
+        self._loaded = False
+        self._dir_mtimes: Dict[str, float] = {}   # dossier -> mtime au dernier scan
+        self._checked_at = 0.0
+
+    # --- Scan / cache ---
+
+    def _load_cache(self) -> Dict[str, Dict]:
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def _save_cache(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".audio-library-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "files": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            tracing.error("Erreur lors de la sauvegarde du cache audio: %s", e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _walk(self, root: str, dir_mtimes: Dict[str, float]):
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            try:
+                dir_mtimes[current] = os.stat(current).st_mtime
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            ext = os.path.splitext(entry.name)[1].lower()
+                            if ext in AUDIO_EXTENSIONS:
+                                yield entry, ext
+            except OSError:
+                continue
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Rescanne les dossiers. Les fichiers inchangés (taille + mtime)
+        reprennent leurs métadonnées du cache sans être rouverts.
+        """
+        with self._lock:
+            previous = self._entries or self._load_cache()
+            entries: Dict[str, Dict] = {}
+            dir_mtimes: Dict[str, float] = {}
+            stats = {"files": 0, "updated": 0}
+
+            for directory in self.directories:
+                if not os.path.isdir(directory):
+                    continue
+                for entry, ext in self._walk(directory, dir_mtimes):
+                    path = os.path.abspath(entry.path)
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    stats["files"] += 1
+                    cached = previous.get(path)
+                    if cached and cached["size"] == st.st_size and cached["mtime"] == st.st_mtime:
+                        entries[path] = cached
+                        continue
+                    stats["updated"] += 1
+                    entries[path] = {
+                        "name": entry.name,
+                        "norm": normalize_name(entry.name),
+                        "ext": ext,
+                        "size": st.st_size,
+                        "mtime": st.st_mtime,
+                        "duration": read_duration(path, ext),
+                    }
+
+            changed = stats["updated"] or len(entries) != len(previous)
+            self._entries = entries
+            self._dir_mtimes = dir_mtimes
+            self._checked_at = time.monotonic()
+            self._build_index()
+            if changed:
+                self._save_cache()
+            self._loaded = True
+            return stats
+
+    def _build_index(self) -> None:
+        self._paths = list(self._entries.keys())
+        self._names = [self._entries[p]["norm"] for p in self._paths]
+        self._grams = [trigrams(n) for n in self._names]
+        by_gram: Dict[str, List[int]] = {}
+        by_name: Dict[str, int] = {}
+        for i, grams in enumerate(self._grams):
+            by_name.setdefault(self._names[i], i)
+            for g in grams:
+                by_gram.setdefault(g, []).append(i)
+        self._by_gram = by_gram
+        self._by_name = by_name
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh()
+
+    def _dirs_changed(self) -> bool:
+        for directory in self.directories:
+            if os.path.isdir(directory) != (directory in self._dir_mtimes):
+                return True
+        for directory, mtime in self._dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Rescanne si un dossier a changé depuis le dernier scan (vérifié au
+        plus toutes les RESCAN_MIN_INTERVAL secondes). True si rescanné.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < RESCAN_MIN_INTERVAL:
+            return False
+        self._checked_at = now
+        if not self._dirs_changed():
+            return False
+        self.refresh()
+        return True
+
+    # --- Recherche ---
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[float, Dict]]:
+        """
+        Retourne les meilleurs fichiers pour la requête : [(score, entrée), ...]
+        Score = similarité de Jaccard sur les trigrammes (1.0 = nom identique).
+        Si rien n'est assez proche, les dossiers sont revérifiés (fichiers
+        ajoutés depuis le dernier scan).
+        """
+        self._ensure_loaded()
+        results = self._search(query, limit)
+        if (not results or results[0][0] < MIN_SCORE) and self.refresh_if_changed():
+            results = self._search(query, limit)
+        return results
+
+    def _search(self, query: str, limit: int) -> List[Tuple[float, Dict]]:
+        norm = normalize_name(os.path.basename(query))
+        if not norm:
+            return []
+
+        if (exact := self._by_name.get(norm)) is not None:
+            return [(1.0, self._entry(exact))]
+
+        # Filtre par préfixe : un nom de score >= MIN_SCORE partage au moins
+        # k trigrammes avec la requête, donc au moins un des (n - k + 1)
+        # trigrammes les plus rares. On ne part que de ceux-là.
+        q_grams = trigrams(norm)
+        by_rarity = sorted(q_grams, key=lambda g: len(self._by_gram.get(g, ())))
+        k = max(1, math.ceil(MIN_SCORE * len(by_rarity)))
+        candidates: Set[int] = set()
+        for g in by_rarity[:len(by_rarity) - k + 1]:
+            candidates.update(self._by_gram.get(g, ()))
+
+        scored = []
+        for i in candidates:
+            common = len(q_grams & self._grams[i])
+            score = common / (len(q_grams) + len(self._grams[i]) - common)
+            # Bonus si la requête est contenue telle quelle dans le nom
+            if norm in self._names[i]:
+                score = max(score, 0.9)
+            scored.append((score, i))
+        scored.sort(reverse=True)
+        return [(round(score, 3), self._entry(i)) for score, i in scored[:limit]]
+
+    def resolve(self, query: str) -> Optional[Dict]:
+        """Meilleur fichier pour la requête, ou None si rien d'assez proche."""
+        results = self.search(query, limit=1)
+        if results and results[0][0] >= MIN_SCORE:
+            return results[0][1]
+        return None
+
+    def _entry(self, i: int) -> Dict:
+        path = self._paths[i]
+        return {"path": path, **self._entries[path]}
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._paths)
+
+
+_library: Optional[AudioLibrary] = None
+
+
+def get_library() -> AudioLibrary:
+    global _library
+    if _library is None:
+        _library = AudioLibrary()
+    return _library
@@ -0,0 +1,345 @@
+# =========================
+# Moteur de lecture audio (non bloquant)
+# =========================
+#
+# Un thread dédié possède pygame.mixer et consomme une file de commandes
+# (play, enqueue, pause, resume, stop, skip, volume). Le handler du skill
+# audio dépose une commande et retourne tout de suite : l'agent continue
+# de répondre pendant la lecture.
+#
+# Playlist sans blanc entre les pistes : un second thread décode à
+# l'avance la piste suivante (pygame.mixer.Sound) dans un tampon de
+# PREFETCH_TRACKS places, et le thread audio la place dans la file du
+# canal (Channel.queue) avant la fin de la piste courante : SDL enchaîne
+# sans trou. Une place est réservée (sémaphore) avant le décodage et
+# rendue quand la piste sort du tampon : en mémoire, au plus piste
+# courante + piste en file sur le canal + PREFETCH_TRACKS pistes décodées
+# (en cours de décodage comprises), quelle que soit la longueur de la
+# playlist. Une piste trop grosse pour être décodée d'un coup
+# (MAX_DECODED_BYTES) est jouée en streaming (pygame.mixer.music), sans
+# garantie d'enchaînement parfait.
+
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import os
+import queue
+import threading
+from collections import deque
+
+import tracing
+
+# Intervalle de vérification de fin de piste pendant la lecture (thread audio uniquement)
+END_CHECK_INTERVAL = 0.25
+
+PREFETCH_TRACKS = 1
+MAX_DECODED_BYTES = 96 * 1024 * 1024
+
+# Ratio décodé / fichier pour estimer la taille PCM avant décodage
+_DECODE_RATIO = {".wav": 1, ".flac": 2}
+_DEFAULT_DECODE_RATIO = 11
+
+Command = Tuple[str, Any]
+
+
+class _Track:
+    __slots__ = ("path", "sound", "generation")
+
+    def __init__(self, path: str, sound: Any, generation: int):
+        self.path = path
+        self.sound = sound          # pygame.mixer.Sound, ou None -> streaming
+        self.generation = generation
+
+
+def estimated_decoded_size(path: str) -> int:
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    return size * _DECODE_RATIO.get(ext, _DEFAULT_DECODE_RATIO)
+
+
+class AudioPlayer:
+    """
+    Lecteur audio piloté par une file de commandes, joué dans un thread de fond.
+    """
+
+    def __init__(self):
+        self._commands: "queue.Queue[Command]" = queue.Queue()
+        self._state_lock = threading.Lock()
+        self._state = "stopped"       # stopped | playing | paused
+        self._track: Optional[str] = None
+        self._volume = 1.0
+        self._last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+        # Playlist : chemins pas encore décodés, puis pistes décodées prêtes
+        self._playlist: Deque[str] = deque()
+        self._playlist_cond = threading.Condition(self._state_lock)
+        self._ready: "queue.Queue[_Track]" = queue.Queue()
+        self._slots = threading.Semaphore(PREFETCH_TRACKS)  # places libres du tampon
+        self._generation = 0
+        self._decoding = 0            # pistes retirées de la playlist, pas encore dans _ready
+        self._prefetcher: Optional[threading.Thread] = None
+        self._mixer_ready = threading.Event()
+
+        # Côté thread audio uniquement
+        self._pygame = None
+        self._channel = None
+        self._current: Optional[_Track] = None
+        self._queued: Optional[_Track] = None
+
+    # --- API (appelée depuis les handlers, ne bloque jamais) ---
+
+    def play(self, file_path: str) -> None:
+        self.play_all([file_path])
+
+    def play_all(self, paths: List[str]) -> None:
+        """Remplace la playlist et lance la lecture."""
+        self._send("play", list(paths))
+
+    def enqueue(self, paths: List[str]) -> None:
+        """Ajoute des pistes à la fin de la playlist."""
+        self._send("enqueue", list(paths))
+
+    def pause(self) -> None:
+        self._send("pause")
+
+    def resume(self) -> None:
+        self._send("resume")
+
+    def stop(self) -> None:
+        self._send("stop")
+
+    def skip(self) -> None:
+        self._send("skip")
+
+    def set_volume(self, volume: float) -> None:
+        self._send("volume", max(0.0, min(1.0, volume)))
+
+    def status(self) -> Dict[str, Any]:
+        with self._state_lock:
+            return {
+                "state": self._state,
+                "track": os.path.basename(self._track) if self._track else None,
+                "volume": int(round(self._volume * 100)),
+                "queued": len(self._playlist) + self._ready.qsize(),
+                "error": self._last_error,
+            }
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._commands.put(("shutdown", None))
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    # --- Threads ---
+
+    def _send(self, name: str, arg: Any = None) -> None:
+        self._ensure_started()
+        self._commands.put((name, arg))
+
+    def _ensure_started(self) -> None:
+        with self._state_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audio-player", daemon=True)
+                self._thread.start()
+                self._prefetcher = threading.Thread(target=self._prefetch_loop, name="audio-prefetch", daemon=True)
+                self._prefetcher.start()
+
+    def _set_state(self, state: str, track: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._state_lock:
+            self._state = state
+            self._track = track
+            self._last_error = error
+
+    # --- Décodage anticipé ---
+
+    def _prefetch_loop(self) -> None:
+        while True:
+            # Une place libre avant de décoder : c'est la borne mémoire
+            self._slots.acquire()
+            with self._playlist_cond:
+                while not self._playlist:
+                    self._playlist_cond.wait()
+                path = self._playlist.popleft()
+                generation = self._generation
+                self._decoding += 1
+
+            sound = None
+            if estimated_decoded_size(path) <= MAX_DECODED_BYTES:
+                try:
+                    self._mixer_ready.wait()
+                    sound = self._pygame.mixer.Sound(path)
+                except Exception as e:
+                    tracing.warning("Décodage impossible, lecture en streaming (%s): %s", os.path.basename(path), e)
+
+            with self._state_lock:
+                self._decoding -= 1
+                if generation == self._generation:
+                    self._ready.put(_Track(path, sound, generation))
+                else:
+                    self._slots.release()  # playlist remplacée ou arrêtée entre-temps
+            self._commands.put(("prefetched", None))
+
+    def _reset_playlist(self) -> None:
+        with self._playlist_cond:
+            self._generation += 1
+            self._playlist.clear()
+            while True:
+                try:
+                    self._ready.get_nowait()
+                except queue.Empty:
+                    break
+                self._slots.release()
+
+    def _next_ready(self) -> Optional[_Track]:
+        while True:
+            try:
+                track = self._ready.get_nowait()
+            except queue.Empty:
+                return None
+            self._slots.release()
+            if track.generation == self._generation:
+                return track
+
+    # --- Thread audio ---
+
+    def _run(self) -> None:
+        # pygame n'est importé et initialisé qu'au premier usage, dans ce thread
+        try:
+            import pygame
+            pygame.mixer.init()
+            self._channel = pygame.mixer.Channel(0)
+            pygame.mixer.set_reserved(1)
+        except Exception as e:
+            self._set_state("stopped", error=f"Impossible d'initialiser l'audio : {e}")
+            return
+
+        self._pygame = pygame
+        self._mixer_ready.set()
+        pygame.mixer.music.set_volume(self._volume)
+
+        while True:
+            playing = self._state == "playing"
+            try:
+                # Pendant la lecture, on se réveille régulièrement pour
+                # suivre l'enchaînement des pistes ; sinon on attend une commande.
+                name, arg = self._commands.get(timeout=END_CHECK_INTERVAL if playing else None)
+            except queue.Empty:
+                name, arg = "tick", None
+
+            if name == "shutdown":
+                self._channel.stop()
+                pygame.mixer.music.stop()
+                pygame.mixer.quit()
+                return
+
+            try:
+                self._handle(name, arg)
+                self._advance()
+            except Exception as e:
+                self._set_state("stopped", error=f"Erreur lors de la lecture : {e}")
+
+    def _handle(self, name: str, arg: Any) -> None:
+        music = self._pygame.mixer.music
+
+        if name in ("play", "enqueue"):
+            if name == "play":
+                self._stop_output()
+                self._reset_playlist()
+            with self._playlist_cond:
+                self._playlist.extend(arg)
+                self._playlist_cond.notify()
+            if name == "play":
+                self._set_state("playing", arg[0] if arg else None)
+        elif name == "pause" and self._state == "playing":
+            self._channel.pause()
+            music.pause()
+            self._set_state("paused", self._track)
+        elif name == "resume" and self._state == "paused":
+            self._channel.unpause()
+            music.unpause()
+            self._set_state("playing", self._track)
+        elif name == "stop":
+            self._stop_output()
+            self._reset_playlist()
+            self._set_state("stopped")
+        elif name == "skip":
+            # La piste en file sur le canal (si déjà décodée) devient la courante
+            queued = self._queued
+            self._stop_output()
+            if queued is not None:
+                self._start(queued)
+            self._set_state("playing", self._track)
+        elif name == "volume":
+            self._volume = arg
+            self._channel.set_volume(arg)
+            music.set_volume(arg)
+
+    def _stop_output(self) -> None:
+        self._channel.stop()
+        self._pygame.mixer.music.stop()
+        self._current = None
+        self._queued = None
+
+    def _start(self, track: _Track) -> None:
+        if track.sound is not None:
+            self._channel.play(track.sound)
+            self._channel.set_volume(self._volume)
+        else:
+            music = self._pygame.mixer.music
+            music.load(track.path)
+            music.play()
+        self._current = track
+        self._queued = None
+        self._set_state("playing", track.path)
+
+    def _advance(self) -> None:
+        """Suit l'enchaînement : piste terminée, piste suivante à mettre en file."""
+        if self._state != "playing":
+            return
+
+        current = self._current
+        if current is not None:
+            # SDL est passé tout seul à la piste mise en file
+            if (self._queued is not None and current.sound is not None
+                    and self._queued.sound is not None
+                    and self._channel.get_sound() is self._queued.sound):
+                self._current, self._queued = self._queued, None
+                self._set_state("playing", self._current.path)
+                current = self._current
+
+            busy = (self._channel.get_busy() if current.sound is not None
+                    else self._pygame.mixer.music.get_busy())
+            if not busy:
+                current = self._current = None
+
+        if current is None:
+            nxt = self._queued or self._next_ready()
+            if nxt is None:
+                with self._state_lock:
+                    pending = bool(self._playlist) or self._decoding > 0
+                if not pending:
+                    self._set_state("stopped")
+                return
+            self._start(nxt)
+            current = nxt
+
+        # Décodage anticipé -> file du canal, pour un enchaînement sans blanc
+        if self._queued is None and current.sound is not None:
+            nxt = self._next_ready()
+            if nxt is not None:
+                if nxt.sound is not None:
+                    self._channel.queue(nxt.sound)
+                self._queued = nxt
+
+
+_player: Optional[AudioPlayer] = None
+
+
+def get_player() -> AudioPlayer:
+    """Lecteur partagé par le processus (un seul périphérique audio)."""
+    global _player
+    if _player is None:
+        _player = AudioPlayer()
+    return _player
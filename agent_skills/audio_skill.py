@@ -2,66 +2,178 @@
 # Audio Skill
 # =========================
 
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 import os
-import pygame
-from agent import Skill, Slot
+from agent import Skill
+from skill_registry import build_skill
+from agent_skills.audio_library import AUDIO_EXTENSIONS, get_library
+from agent_skills.audio_player import get_player
 
-# Initialiser pygame mixer pour l'audio
-pygame.mixer.init()
+
+def _parse_volume(raw: str) -> float:
+    """'50', '50%', '0.5' -> 0.5"""
+    value = float(raw.strip().rstrip('%').replace(',', '.'))
+    return value / 100 if value > 1 else value
+
+
+def _folder_tracks(folder: str) -> List[str]:
+    """Fichiers audio d'un dossier (récursif), dans l'ordre alphabétique."""
+    tracks = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                tracks.append(os.path.join(root, name))
+    return sorted(tracks)
+
+
+def _resolve_tracks(spec: str) -> Tuple[List[str], List[str]]:
+    """
+    'a.mp3 | Scandinavianz Morning | ./Music/album' -> (chemins, introuvables)
+    Chaque élément est un chemin, un dossier ou un nom approximatif.
+    """
+    tracks: List[str] = []
+    missing: List[str] = []
+    library = get_library()
+
+    for item in [part.strip() for part in spec.split('|') if part.strip()]:
+        if os.path.isdir(item):
+            tracks.extend(_folder_tracks(item))
+        elif os.path.exists(item):
+            tracks.append(item)
+        elif (match := library.resolve(item)) is not None:
+            tracks.append(match["path"])
+        else:
+            missing.append(item)
+
+    return tracks, missing
 
 
 def audio_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
+    action = values.get("action", "play").lower().strip()
     file_path = values.get("file_path", "")
+    player = get_player()
 
-    # Vérifier si le fichier existe
-    if not os.path.exists(file_path):
-        return {
-            "type": "audio_error",
-            "file_path": file_path,
-            "error": f"Le fichier '{file_path}' n'existe pas.",
-        }
+    if action in ["play", "jouer", "lire", "écouter", "ecouter", "queue", "ajouter", "enqueue"]:
+        if not file_path:
+            return {
+                "type": "audio_error",
+                "error": "Indique le fichier audio (ou le dossier) à jouer.",
+            }
 
-    try:
-        pygame.mixer.music.load(file_path)
-        pygame.mixer.music.play()
+        # Chemins exacts, dossiers, sinon recherche approchée dans la bibliothèque
+        tracks, missing = _resolve_tracks(file_path)
+        if not tracks:
+            suggestions = [entry["name"] for _, entry in get_library().search(file_path, limit=3)]
+            return {
+                "type": "audio_error",
+                "file_path": file_path,
+                "suggestions": suggestions,
+                "error": f"Aucun fichier audio ne correspond à '{file_path}'.",
+            }
 
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
+        # La lecture se fait en arrière-plan : on répond tout de suite
+        if action in ["queue", "ajouter", "enqueue"]:
+            player.enqueue(tracks)
+            message = f"{len(tracks)} piste(s) ajoutée(s) à la file d'attente."
+        else:
+            player.play_all(tracks)
+            if len(tracks) == 1:
+                message = f"Lecture lancée : {os.path.basename(tracks[0])}"
+            else:
+                message = f"Playlist lancée : {len(tracks)} pistes, en commençant par {os.path.basename(tracks[0])}"
 
-        return {
+        result = {
             "type": "audio_success",
-            "file_path": file_path,
-            "message": f"Lecture terminée de : {os.path.basename(file_path)}",
+            "action": "queue" if action in ["queue", "ajouter", "enqueue"] else "play",
+            "file_path": tracks[0] if len(tracks) == 1 else file_path,
+            "tracks": len(tracks),
+            "message": message,
         }
-    except Exception as e:
+        if missing:
+            result["not_found"] = missing
+        return result
+
+    if action in ["pause"]:
+        player.pause()
+        message = "Lecture mise en pause."
+    elif action in ["resume", "reprendre", "continuer"]:
+        player.resume()
+        message = "Lecture reprise."
+    elif action in ["stop", "arrêter", "arreter"]:
+        player.stop()
+        message = "Lecture arrêtée."
+    elif action in ["skip", "suivant", "passer"]:
+        player.skip()
+        message = "Piste suivante."
+    elif action in ["volume"]:
+        try:
+            volume = _parse_volume(values.get("volume", ""))
+        except ValueError:
+            return {
+                "type": "audio_error",
+                "error": f"Volume invalide : '{values.get('volume', '')}'. Donne une valeur entre 0 et 100.",
+            }
+        player.set_volume(volume)
+        message = f"Volume réglé à {int(round(min(max(volume, 0.0), 1.0) * 100))}%."
+    elif action in ["status", "statut", "état", "etat"]:
+        message = "État du lecteur audio."
+    else:
         return {
             "type": "audio_error",
-            "file_path": file_path,
-            "error": f"Erreur lors de la lecture : {str(e)}",
+            "error": f"Action non reconnue : '{action}'. Utilise : play, queue, pause, resume, stop, skip, volume ou status.",
         }
 
+    result = {
+        "type": "audio_success",
+        "action": action,
+        "message": message,
+    }
+    # Les commandes sont asynchrones : l'état n'est fiable que pour "status"
+    if action in ["status", "statut", "état", "etat"]:
+        result["player"] = player.status()
+    return result
 
-def create_audio_skill() -> Skill:
-    """Crée et retourne le skill audio"""
-    audio_slots = [
-        Slot(
-            name="file_path",
-            description="le chemin complet du fichier audio (mp3, wav, ogg, etc.) à jouer. Peut être un nom de fichier simple si l'utilisateur le donne, exemple: 'musique.mp3' ou 'Scandinavianz-Morning.mp3'",
-            question="Quel est le nom ou le chemin complet du fichier audio que tu veux écouter ?",
-        )
-    ]
-
-    return Skill(
-        name="audio",
-        description="lecture et contrôle de fichiers audio (musique, sons). Utilise cette skill quand l'utilisateur demande de jouer, lire ou écouter un fichier audio",
-        slots=audio_slots,
-        final_answer_system_prompt="""
+
+# Métadonnées lues par skill_registry sans importer ce module
+SKILL = {
+    "name": "audio",
+    "description": "lecture et contrôle de fichiers audio (musique, sons). Utilise cette skill quand l'utilisateur demande de jouer, lire ou écouter un fichier audio, une playlist ou un dossier, ou de mettre en pause, reprendre, arrêter, passer ou changer le volume",
+    "slots": [
+        {
+            "name": "action",
+            "description": (
+                "l'action voulue : play (jouer un ou plusieurs fichiers, ou un dossier), "
+                "queue (ajouter à la file d'attente), pause, resume (reprendre), "
+                "stop (arrêter), skip (piste suivante), volume (régler le volume), status (état du lecteur)"
+            ),
+            "question": "Que veux-tu faire ? (jouer/ajouter à la file/pause/reprendre/arrêter/suivant/volume)",
+        },
+        {
+            "name": "file_path",
+            "description": "le chemin ou le nom (même approximatif) du fichier audio à jouer, ou un dossier. Plusieurs fichiers sont séparés par '|', exemple: 'musique.mp3', 'Scandinavianz Morning | intro.wav', './Music/album'. Seulement pour les actions play et queue",
+            "question": "Quel est le nom ou le chemin complet du fichier audio que tu veux écouter ?",
+            "required": False,
+        },
+        {
+            "name": "volume",
+            "description": "le niveau de volume entre 0 et 100, seulement pour l'action volume",
+            "question": "À quel volume (0 à 100) ?",
+            "required": False,
+        },
+    ],
+    "final_answer_system_prompt": """
 Tu es un assistant audio qui aide à jouer des fichiers sonores.
-Tu reçois des données structurées avec le chemin du fichier audio et le résultat de la lecture.
-Si c'est un succès, confirme que l'audio a été joué.
+Tu reçois des données structurées avec l'action demandée et l'état du lecteur.
+Si c'est un succès, confirme l'action (lecture lancée, pause, volume...).
 Si c'est une erreur, explique le problème de manière claire et propose une solution.
 Réponds en français de façon naturelle et concise.
 """,
-        on_ready=audio_on_ready,
-    )
+    "on_ready": "audio_on_ready",
+    # Un seul lecteur : les commandes passent une par une
+    "concurrency": 1,
+}
+
+
+def create_audio_skill() -> Skill:
+    """Crée et retourne le skill audio"""
+    return build_skill(SKILL, audio_on_ready)
@@ -0,0 +1,395 @@
+# =========================
+# Journal des mutations du calendrier
+# =========================
+#
+# Chaque ajout / modification / suppression est ajouté en fin de
+# "calendar.ics.journal" (une ligne JSON par opération) au lieu de
+# réécrire tout le fichier ICS. Le modèle en mémoire est mis à jour
+# directement, et un thread de fond :
+#   - regroupe les fsync (toutes les N opérations ou après un délai),
+#   - compacte périodiquement : réécrit calendar.ics de façon atomique
+#     puis repart d'un journal vide.
+#
+# Au chargement (ou après un crash), on relit calendar.ics puis on rejoue
+# le journal. Les opérations sont idempotentes (upsert / suppression par
+# UID) : rejouer un journal déjà intégré au snapshot ne change rien.
+#
+# Plusieurs sessions (threads ou processus) peuvent partager les fichiers :
+# les écritures se font sous verrou (flock sur "calendar.ics.lock") et
+# chacun relit les lignes ajoutées par les autres avant d'écrire. Les
+# listeners (rappels) sont aussi prévenus des opérations des autres
+# processus : le journal est relu toutes les POLL_INTERVAL secondes.
+
+from typing import Callable, Dict, List, Optional
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from icalendar import Calendar, Event
+
+import tracing
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+FSYNC_BATCH = 16          # fsync au plus tard toutes les N opérations
+FSYNC_INTERVAL = 0.5      # ... ou après ce délai (secondes)
+COMPACT_EVERY = 500       # compaction après N opérations journalisées
+POLL_INTERVAL = 2.0       # relecture du journal (écritures des autres processus) s'il y a des listeners
+
+# listener(op, uid, event) ; event vaut None pour une suppression, et le
+# calendrier complet pour op == "reload" (snapshot rechargé depuis le disque)
+JournalListener = Callable[[str, str, Optional[Event]], None]
+
+
+def empty_calendar() -> Calendar:
+    """Calendrier vide avec les propriétés requises."""
+    cal = Calendar()
+    cal.add('prodid', '-//Home Assistant Agent//FR')
+    cal.add('version', '2.0')
+    cal.add('calscale', 'GREGORIAN')
+    cal.add('method', 'PUBLISH')
+    return cal
+
+
+class CalendarJournal:
+    """
+    Modèle en mémoire du calendrier + journal append-only sur disque.
+    """
+
+    def __init__(
+        self,
+        calendar_path: str,
+        fsync_batch: int = FSYNC_BATCH,
+        fsync_interval: float = FSYNC_INTERVAL,
+        compact_every: int = COMPACT_EVERY,
+    ):
+        self.calendar_path = calendar_path
+        self.journal_path = calendar_path + ".journal"
+        self.lock_path = calendar_path + ".lock"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        self._lock = threading.RLock()
+        self._calendar: Optional[Calendar] = None
+        self._index: Dict[str, Event] = {}
+        self._journal_file = None
+        self._journal_ino: Optional[int] = None
+        self._offset = 0              # octets du journal déjà appliqués
+        self._unsynced = 0            # opérations écrites mais pas encore fsync
+        self._first_unsynced = 0.0
+        self._since_compaction = 0
+        self._listeners: List[JournalListener] = []
+        self._file_lock_depth = 0
+
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._worker = threading.Thread(target=self._background_loop, name="calendar-journal", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    # --- Abonnements (rappels, caches...) ---
+
+    def add_listener(self, listener: JournalListener) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+            self._wakeup.notify()  # le thread de fond passe en relecture périodique
+
+    def remove_listener(self, listener: JournalListener) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    # --- Lecture ---
+
+    def calendar(self) -> Calendar:
+        """
+        Retourne le modèle en mémoire, à jour des écritures des autres sessions.
+        """
+        with self._lock:
+            self._catch_up()
+            return self._calendar
+
+    def find(self, uid: str) -> Optional[Event]:
+        with self._lock:
+            self._catch_up()
+            return self._index.get(uid)
+
+    # --- Mutations (O(1) sur disque) ---
+
+    def add(self, event: Event) -> None:
+        self._record("add", str(event.get('uid', '')), event)
+
+    def edit(self, event: Event) -> None:
+        self._record("edit", str(event.get('uid', '')), event)
+
+    def remove(self, uid: str) -> None:
+        self._record("remove", uid, None)
+
+    def update(self, uid: str, change: Callable[[Event], None]) -> Optional[Event]:
+        """
+        Applique change() à une copie de l'événement puis la journalise, le
+        tout sous verrou : deux modifications concurrentes ne s'entremêlent
+        pas, et le modèle en mémoire n'est remplacé qu'une fois l'opération
+        écrite. Retourne la copie modifiée, ou None si l'UID est inconnu.
+        """
+        with self._lock, self._file_lock():
+            self._catch_up()
+            existing = self._index.get(uid)
+            if existing is None:
+                return None
+            event = Event.from_ical(existing.to_ical())
+            change(event)
+            self._record("edit", uid, event)
+            return event
+
+    def _record(self, op: str, uid: str, event: Optional[Event]) -> None:
+        entry = {"op": op, "uid": uid, "ts": datetime.now().isoformat(timespec="seconds")}
+        if event is not None:
+            entry["ics"] = event.to_ical().decode("utf-8")
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+        with self._lock, self._file_lock():
+            self._catch_up()
+            f = self._journal_file
+            f.seek(0, os.SEEK_END)
+            if f.tell() > self._offset:
+                # Ligne tronquée laissée par un crash : on la termine
+                f.write(b"\n")
+            f.write(line)
+            f.flush()
+            self._offset = f.tell()
+
+            self._apply(op, uid, event)
+
+            if self._unsynced == 0:
+                self._first_unsynced = time.monotonic()
+            self._unsynced += 1
+            self._since_compaction += 1
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+            self._wakeup.notify()
+
+        self._notify(op, uid, event)
+
+    def _notify(self, op: str, uid: str, event) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(op, uid, event)
+            except Exception as e:
+                tracing.error("Erreur dans un listener du journal: %s", e)
+
+    # --- Durabilité ---
+
+    def flush(self) -> None:
+        """Force le fsync des opérations en attente."""
+        with self._lock:
+            self._sync()
+
+    def compact(self) -> None:
+        """
+        Réécrit calendar.ics de façon atomique à partir du modèle en mémoire,
+        puis remplace le journal par un journal vide.
+        """
+        with self._lock, self._file_lock():
+            self._catch_up()
+            self._sync()
+            self._write_snapshot()
+            self._replace_journal()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Accès exclusif aux fichiers pour une opération qui réécrit calendar.ics
+        elle-même (import). Le journal est compacté avant, et le modèle est
+        rechargé depuis le disque après ; le journal est à nouveau remplacé
+        pour que les autres processus rechargent aussi.
+        """
+        with self._lock, self._file_lock():
+            self.compact()
+            try:
+                yield
+            finally:
+                self._replace_journal()
+                self._calendar = None
+                self._catch_up()
+                self._notify("reload", "", self._calendar)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._sync()
+            self._wakeup.notify()
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+
+    # --- Interne ---
+
+    @contextmanager
+    def _file_lock(self):
+        # Réentrant : toujours appelé sous self._lock, on compte la profondeur
+        # pour ne pas reprendre un flock déjà détenu par ce processus.
+        if fcntl is None or self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _replace_journal(self) -> None:
+        # Nouveau journal vide, substitué atomiquement : les autres
+        # processus détectent le changement d'inode et rechargent.
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".journal-")
+        os.close(fd)
+        os.replace(tmp_path, self.journal_path)
+        self._open_journal()
+        self._since_compaction = 0
+
+    def _open_journal(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        self._journal_file = open(self.journal_path, "a+b")
+        self._journal_ino = os.fstat(self._journal_file.fileno()).st_ino
+        self._offset = 0
+        self._unsynced = 0
+
+    def _load_snapshot(self) -> None:
+        cal = None
+        if os.path.exists(self.calendar_path):
+            try:
+                with open(self.calendar_path, 'rb') as f:
+                    cal = Calendar.from_ical(f.read())
+            except Exception as e:
+                tracing.error("Erreur lors du chargement du calendrier: %s", e)
+        if cal is None:
+            cal = empty_calendar()
+
+        self._calendar = cal
+        self._index = {
+            str(c.get('uid', '')): c for c in cal.subcomponents if c.name == "VEVENT"
+        }
+
+    def _write_snapshot(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.calendar_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".calendar-", suffix=".ics.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._calendar.to_ical())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.calendar_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _journal_replaced(self) -> bool:
+        try:
+            return os.stat(self.journal_path).st_ino != self._journal_ino
+        except FileNotFoundError:
+            return True
+
+    def _catch_up(self) -> None:
+        """
+        Charge le snapshot si besoin et applique les lignes de journal non lues
+        (écrites par d'autres processus) ; les listeners en sont prévenus.
+        """
+        if self._calendar is None or self._journal_file is None or self._journal_replaced():
+            reloaded = self._calendar is not None
+            self._load_snapshot()
+            self._open_journal()
+            if reloaded:
+                # Compaction par un autre processus : le snapshot peut contenir
+                # des opérations jamais vues dans notre journal
+                self._notify("reload", "", self._calendar)
+
+        f = self._journal_file
+        f.seek(self._offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # ligne en cours d'écriture (ou tronquée par un crash)
+            self._offset += len(raw)
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            try:
+                event = Event.from_ical(entry["ics"]) if entry.get("ics") else None
+            except ValueError as e:
+                tracing.warning("Entrée de journal ignorée: %s", e)
+                continue
+            op, uid = entry.get("op", ""), entry.get("uid", "")
+            self._apply(op, uid, event)
+            self._notify(op, uid, self._index.get(uid) if op != "remove" else None)
+
+    def _apply(self, op: str, uid: str, event: Optional[Event]) -> None:
+        if op in ("add", "edit") and event is not None:
+            existing = self._index.get(uid)
+            if existing is event:
+                return
+            if existing is not None:
+                self._calendar.subcomponents = [
+                    c for c in self._calendar.subcomponents if c is not existing
+                ]
+            self._calendar.add_component(event)
+            self._index[uid] = event
+        elif op == "remove":
+            existing = self._index.pop(uid, None)
+            if existing is not None:
+                self._calendar.subcomponents = [
+                    c for c in self._calendar.subcomponents if c is not existing
+                ]
+
+    def _sync(self) -> None:
+        if self._unsynced and self._journal_file is not None:
+            os.fsync(self._journal_file.fileno())
+            self._unsynced = 0
+
+    def _background_loop(self) -> None:
+        with self._lock:
+            while not self._closed:
+                if self._unsynced:
+                    remaining = self.fsync_interval - (time.monotonic() - self._first_unsynced)
+                    if remaining <= 0:
+                        self._sync()
+                        continue
+                    self._wakeup.wait(remaining)
+                elif self._listeners:
+                    self._wakeup.wait(POLL_INTERVAL)
+                    if self._calendar is not None and not self._closed:
+                        try:
+                            self._catch_up()
+                        except Exception as e:
+                            tracing.error("Erreur lors de la relecture du journal: %s", e)
+                else:
+                    self._wakeup.wait()
+
+                if self._since_compaction >= self.compact_every and not self._closed:
+                    try:
+                        self.compact()
+                    except Exception as e:
+                        tracing.error("Erreur lors de la compaction du calendrier: %s", e)
@@ -0,0 +1,318 @@
+# =========================
+# Rappels des événements du calendrier
+# =========================
+#
+# Les prochains déclenchements (événement - délai de rappel) sont rangés
+# dans un tas binaire. Un seul thread dort jusqu'au prochain déclenchement
+# (Condition.wait avec timeout) : pas de boucle de polling, pas de relecture
+# du calendrier à chaque tick.
+#
+# Mise à jour incrémentale : le scheduler écoute le journal du calendrier.
+# Ajout / modification -> on recalcule les rappels de cet événement
+# seulement ; suppression -> on invalide. Les entrées obsolètes restent
+# dans le tas mais sont ignorées grâce à un numéro de génération par UID
+# (suppression paresseuse, O(log n) par opération).
+#
+# Les événements récurrents (RRULE) sont développés sur une fenêtre
+# glissante (HORIZON) ; une entrée "horizon" dans le tas relance le
+# développement avant que la fenêtre ne soit épuisée. Un événement unique
+# n'a qu'une occurrence : ses rappels vont dans le tas quelle que soit leur
+# distance.
+
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import itertools
+import threading
+from datetime import date, datetime, timedelta
+
+import pytz
+from icalendar import Calendar, Event
+
+import tracing
+
+PARIS_TZ = pytz.timezone('Europe/Paris')
+
+DEFAULT_LEAD_TIMES = (timedelta(minutes=15),)
+HORIZON = timedelta(days=7)
+
+# callback(message, details)
+ReminderCallback = Callable[[str, Dict[str, str]], None]
+
+_HORIZON_UID = ""
+_FAR_FUTURE = PARIS_TZ.localize(datetime(9999, 12, 31))
+
+
+def _as_datetime(value) -> datetime:
+    """dtstart (date, datetime naïf ou aware) -> datetime aware Europe/Paris."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return PARIS_TZ.localize(value)
+        return value.astimezone(PARIS_TZ)
+    if isinstance(value, date):
+        return PARIS_TZ.localize(datetime(value.year, value.month, value.day))
+    raise ValueError(f"Date de début invalide: {value!r}")
+
+
+def _event_lead_times(event: Event, defaults: Tuple[timedelta, ...]) -> List[timedelta]:
+    """Délais de rappel : les VALARM relatifs de l'événement, sinon ceux par défaut."""
+    leads = []
+    for alarm in event.walk("VALARM"):
+        trigger = alarm.get("trigger")
+        if trigger is not None and isinstance(trigger.dt, timedelta):
+            leads.append(-trigger.dt)
+    return leads or list(defaults)
+
+
+def _fire_times(start: datetime, leads: List[timedelta], now: datetime) -> List[Tuple[datetime, timedelta]]:
+    """
+    (heure du rappel, avance) pour une occurrence. Si l'occurrence est à
+    venir mais que des rappels sont déjà passés (événement créé moins d'une
+    avance avant son début), ils sont remplacés par un rappel immédiat.
+    """
+    fires = [(start - lead, lead) for lead in leads if start - lead >= now]
+    if start >= now and len(fires) < len(leads):
+        fires.append((now, start - now))
+    return fires
+
+
+def _occurrences(event: Event, start: datetime, end: datetime) -> List[datetime]:
+    """Débuts d'occurrence de l'événement dans [start, end]."""
+    dtstart = event.get("dtstart")
+    if dtstart is None:
+        return []
+    first = _as_datetime(dtstart.dt)
+
+    rrule = event.get("rrule")
+    if rrule is None:
+        return [first] if start <= first <= end else []
+
+    from dateutil.rrule import rruleset, rrulestr
+
+    rules = rruleset()
+    # dateutil travaille en heure locale naïve pour respecter les changements d'heure
+    naive_first = first.replace(tzinfo=None)
+    rules.rrule(rrulestr(rrule.to_ical().decode(), dtstart=naive_first))
+    exdates = event.get("exdate")
+    for exdate in exdates if isinstance(exdates, list) else [exdates] if exdates else []:
+        for ex in exdate.dts:
+            rules.exdate(_as_datetime(ex.dt).replace(tzinfo=None))
+
+    naive = rules.between(
+        start.astimezone(PARIS_TZ).replace(tzinfo=None),
+        end.astimezone(PARIS_TZ).replace(tzinfo=None),
+        inc=True,
+    )
+    return [PARIS_TZ.localize(d) for d in naive]
+
+
+class ReminderScheduler:
+    """
+    Tas de rappels + thread de déclenchement, partagé par les sessions d'un processus.
+    """
+
+    def __init__(
+        self,
+        lead_times: Tuple[timedelta, ...] = DEFAULT_LEAD_TIMES,
+        horizon: timedelta = HORIZON,
+        clock: Callable[[], datetime] = lambda: datetime.now(PARIS_TZ),
+    ):
+        self.lead_times = tuple(lead_times)
+        self.horizon = horizon
+        self._clock = clock
+
+        # (timestamp, seq, uid, generation, début d'occurrence, délai)
+        self._heap: List[Tuple[float, int, str, int, datetime, timedelta]] = []
+        self._seq = itertools.count()
+        self._generation: Dict[str, int] = {}
+        self._recurring: Dict[str, Event] = {}
+        self._summaries: Dict[str, str] = {}
+        self._horizon_end: Optional[datetime] = None
+
+        self._subscribers: Dict[str, ReminderCallback] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    # --- Sessions ---
+
+    def subscribe(self, session_id: str, callback: ReminderCallback) -> None:
+        with self._cond:
+            self._subscribers[session_id] = callback
+
+    def unsubscribe(self, session_id: str) -> None:
+        with self._cond:
+            self._subscribers.pop(session_id, None)
+
+    # --- Chargement / mises à jour ---
+
+    def load(self, cal: Calendar) -> None:
+        """Programme les rappels de tous les événements du calendrier."""
+        with self._cond:
+            now = self._clock()
+            self._horizon_end = now + self.horizon
+            for event in cal.walk("VEVENT"):
+                self._schedule_event(event, now)
+            self._push_horizon_marker()
+            self._cond.notify()
+
+    def on_journal_op(self, op: str, uid: str, event) -> None:
+        """Listener du journal du calendrier (add / edit / remove / reload)."""
+        if op == "reload":
+            self.reload(event)
+            return
+        with self._cond:
+            if op == "remove" or event is None:
+                self._invalidate(uid)
+                self._recurring.pop(uid, None)
+                self._summaries.pop(uid, None)
+            else:
+                self._schedule_event(event, self._clock())
+            self._cond.notify()
+
+    def reload(self, cal: Calendar) -> None:
+        """Reprogramme tout après un rechargement complet du calendrier."""
+        with self._cond:
+            for uid in list(self._summaries):
+                self._invalidate(uid)
+            self._recurring.clear()
+            self._summaries.clear()
+            self._heap = []  # load() remet le marqueur d'horizon
+        self.load(cal)
+
+    def pending_count(self) -> int:
+        """Nombre de rappels encore valides dans le tas."""
+        with self._cond:
+            return sum(
+                1 for entry in self._heap
+                if entry[2] != _HORIZON_UID and self._generation.get(entry[2]) == entry[3]
+            )
+
+    # --- Thread de déclenchement ---
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="calendar-reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            due = []
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self._clock().timestamp()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    due = self._pop_due()
+                    if due:
+                        break
+                if self._stopped:
+                    return
+                subscribers = list(self._subscribers.values())
+
+            # Notifications hors verrou : un callback lent ne bloque pas le tas
+            for message, details in due:
+                for callback in subscribers:
+                    try:
+                        callback(message, details)
+                    except Exception as e:
+                        tracing.error("Erreur lors de l'envoi d'un rappel: %s", e)
+
+    # --- Interne (appelé sous self._cond) ---
+
+    def _invalidate(self, uid: str) -> int:
+        generation = self._generation.get(uid, 0) + 1
+        self._generation[uid] = generation
+        return generation
+
+    def _schedule_event(self, event: Event, now: datetime) -> None:
+        uid = str(event.get("uid", ""))
+        if not uid:
+            return
+        generation = self._invalidate(uid)
+
+        leads = _event_lead_times(event, self.lead_times)
+        if event.get("rrule") is not None:
+            self._recurring[uid] = event
+            window_end = (self._horizon_end or now + self.horizon) + max(leads)
+        else:
+            self._recurring.pop(uid, None)
+            window_end = _FAR_FUTURE
+        try:
+            starts = _occurrences(event, now, window_end)
+        except (ValueError, TypeError) as e:
+            tracing.warning("Rappels ignorés pour %s: %s", uid, e)
+            return
+
+        summary = str(event.get("summary", "Sans titre"))
+        for start in starts:
+            for fire_at, lead in _fire_times(start, leads, now):
+                heapq.heappush(
+                    self._heap,
+                    (fire_at.timestamp(), next(self._seq), uid, generation, start, lead),
+                )
+        self._summaries[uid] = summary
+
+    def _push_horizon_marker(self) -> None:
+        # Redévelopper les récurrences à mi-fenêtre
+        at = self._clock() + self.horizon / 2
+        heapq.heappush(self._heap, (at.timestamp(), next(self._seq), _HORIZON_UID, 0, at, timedelta()))
+
+    def _extend_horizon(self) -> None:
+        now = self._clock()
+        previous_end = self._horizon_end or now
+        self._horizon_end = now + self.horizon
+        for uid, event in list(self._recurring.items()):
+            generation = self._generation.get(uid, 0)
+            leads = _event_lead_times(event, self.lead_times)
+            summary = str(event.get("summary", "Sans titre"))
+            # Seulement les occurrences nouvellement couvertes par la fenêtre
+            already_covered = previous_end + max(leads)
+            for start in _occurrences(event, already_covered, self._horizon_end + max(leads)):
+                if start <= already_covered:
+                    continue
+                for fire_at, lead in _fire_times(start, leads, now):
+                    heapq.heappush(
+                        self._heap,
+                        (fire_at.timestamp(), next(self._seq), uid, generation, start, lead),
+                    )
+            self._summaries[uid] = summary
+        self._push_horizon_marker()
+
+    def _pop_due(self) -> List[Tuple[str, Dict[str, str]]]:
+        now_ts = self._clock().timestamp()
+        due = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            _, _, uid, generation, start, lead = heapq.heappop(self._heap)
+            if uid == _HORIZON_UID:
+                self._extend_horizon()
+                continue
+            if self._generation.get(uid) != generation:
+                continue  # événement modifié ou supprimé depuis
+            summary = self._summaries.get(uid, "Sans titre")
+            minutes = int(lead.total_seconds() // 60)
+            when = start.strftime('%H:%M')
+            if minutes > 0:
+                message = f"Rappel : '{summary}' commence dans {minutes} min (à {when})."
+            else:
+                message = f"Rappel : '{summary}' commence maintenant ({when})."
+            due.append((message, {
+                "uid": uid,
+                "summary": summary,
+                "start": start.strftime('%Y-%m-%d %H:%M'),
+            }))
+        return due
@@ -4,61 +4,73 @@
 
 from typing import Any, Dict, List, Optional
 import os
-import re
 from datetime import datetime, timedelta
 from icalendar import Calendar, Event
-from dateutil import parser as dateutil_parser
 import pytz
 import random
 
-from agent import Skill, Slot
+from agent import Skill
+from skill_registry import build_skill
+import tracing
+from agent_skills.french_datetime import parse_datetime, parse_duration
+from agent_skills import ics_stream
+from agent_skills.calendar_journal import CalendarJournal
+from agent_skills.calendar_reminders import ReminderScheduler
 
 # Constants
 CALENDAR_FILE = "./Files/calendar.ics"
 PARIS_TZ = pytz.timezone('Europe/Paris')
 
+_journal: Optional[CalendarJournal] = None
+_reminders: Optional[ReminderScheduler] = None
+
 
 # =========================
 # Helper Functions
 # =========================
 
+def get_calendar_journal() -> CalendarJournal:
+    """
+    Retourne le journal du calendrier (partagé par toutes les sessions du processus).
+    """
+    global _journal
+    if _journal is None or _journal.calendar_path != CALENDAR_FILE:
+        _journal = CalendarJournal(CALENDAR_FILE)
+    return _journal
+
+
+def get_reminder_scheduler() -> ReminderScheduler:
+    """
+    Démarre (une seule fois) le scheduler de rappels : chargement des
+    événements à venir, puis mises à jour incrémentales via le journal.
+    """
+    global _reminders
+    if _reminders is None:
+        journal = get_calendar_journal()
+        _reminders = ReminderScheduler()
+        _reminders.load(journal.calendar())
+        journal.add_listener(_reminders.on_journal_op)
+        _reminders.start()
+    return _reminders
+
+
 def load_calendar() -> Calendar:
     """
-    Charge le calendrier ICS depuis le fichier.
+    Retourne le calendrier en mémoire : calendar.ics + journal rejoué.
     Retourne un calendrier vide si le fichier n'existe pas.
     """
-    if not os.path.exists(CALENDAR_FILE):
-        # Créer un nouveau calendrier avec les propriétés requises
-        cal = Calendar()
-        cal.add('prodid', '-//Home Assistant Agent//FR')
-        cal.add('version', '2.0')
-        cal.add('calscale', 'GREGORIAN')
-        cal.add('method', 'PUBLISH')
-        return cal
-
-    try:
-        with open(CALENDAR_FILE, 'rb') as f:
-            return Calendar.from_ical(f.read())
-    except Exception as e:
-        print(f"Erreur lors du chargement du calendrier: {e}")
-        # Retourner un calendrier vide en cas d'erreur
-        cal = Calendar()
-        cal.add('prodid', '-//Home Assistant Agent//FR')
-        cal.add('version', '2.0')
-        return cal
+    return get_calendar_journal().calendar()
 
 
 def save_calendar(cal: Calendar) -> None:
     """
-    Sauvegarde le calendrier au format ICS.
-    Crée le dossier Files si nécessaire.
+    Force la réécriture complète de calendar.ics (compaction du journal).
+    Les handlers n'en ont pas besoin : chaque mutation est journalisée.
     """
-    os.makedirs("./Files", exist_ok=True)
     try:
-        with open(CALENDAR_FILE, 'wb') as f:
-            f.write(cal.to_ical())
+        get_calendar_journal().compact()
     except Exception as e:
-        print(f"Erreur lors de la sauvegarde du calendrier: {e}")
+        tracing.error("Erreur lors de la sauvegarde du calendrier: %s", e)
 
 
 def find_event_by_uid(cal: Calendar, uid: str) -> Optional[Event]:
@@ -89,100 +101,14 @@ def parse_french_datetime(date_str: str, time_str: str = None) -> datetime:
 
     Exemples:
       - "aujourd'hui" -> aujourd'hui à midi
-      - "demain" -> demain à midi
+      - "lundi prochain", "le 15 janvier" -> date parsée, midi par défaut
+      - "ce soir", "dans 2 semaines à 9h" -> date et heure
       - "14h30" -> 14:30
-      - "2026-01-15" -> date parsée
 
+    Voir agent_skills/french_datetime.py pour la grammaire complète.
     Retourne un datetime en timezone Europe/Paris.
     """
-    if not date_str:
-        date_str = "aujourd'hui"
-
-    # Normaliser
-    date_lower = date_str.lower().strip()
-
-    # Pattern matching pour les dates françaises
-    today = datetime.now(PARIS_TZ)
-
-    if date_lower in ["aujourd'hui", "aujourdhui", "today", "auj"]:
-        base_date = today
-    elif date_lower in ["demain", "tomorrow", "tmr"]:
-        base_date = today + timedelta(days=1)
-    elif date_lower in ["après-demain", "apres-demain", "après demain", "apres demain"]:
-        base_date = today + timedelta(days=2)
-    elif match := re.match(r'dans (\d+) jours?', date_lower):
-        days = int(match.group(1))
-        base_date = today + timedelta(days=days)
-    else:
-        # Essayer de parser avec dateutil
-        try:
-            parsed_date = dateutil_parser.parse(date_str, dayfirst=True)
-            if parsed_date.tzinfo is None:
-                base_date = PARIS_TZ.localize(parsed_date)
-            else:
-                base_date = parsed_date.astimezone(PARIS_TZ)
-        except:
-            # Par défaut: aujourd'hui
-            base_date = today
-
-    # Parser l'heure si fournie
-    if time_str:
-        time_lower = time_str.lower().strip()
-        hour, minute = 12, 0  # Défaut
-
-        # Patterns: "14h30", "14:30", "14h", "2pm", etc.
-        if match := re.match(r'(\d{1,2})[h:](\d{2})', time_lower):
-            hour, minute = int(match.group(1)), int(match.group(2))
-        elif match := re.match(r'(\d{1,2})h', time_lower):
-            hour = int(match.group(1))
-            minute = 0
-        else:
-            try:
-                parsed_time = dateutil_parser.parse(time_str)
-                hour, minute = parsed_time.hour, parsed_time.minute
-            except:
-                pass
-
-        return base_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-    # Pas d'heure fournie: midi par défaut
-    return base_date.replace(hour=12, minute=0, second=0, microsecond=0)
-
-
-def parse_duration(duration_str: str) -> timedelta:
-    """
-    Parse une durée en français.
-
-    Exemples:
-      - "1h", "1 heure" -> 1 heure
-      - "30min", "30 minutes" -> 30 minutes
-      - "2h30" -> 2h30
-
-    Retourne un timedelta.
-    """
-    if not duration_str:
-        return timedelta(hours=1)  # Durée par défaut: 1 heure
-
-    duration_lower = duration_str.lower().strip()
-
-    # Pattern: "2h30", "2h30min"
-    if match := re.match(r'(\d+)h(\d+)', duration_lower):
-        hours = int(match.group(1))
-        minutes = int(match.group(2))
-        return timedelta(hours=hours, minutes=minutes)
-
-    # Pattern: "2h", "2 heures"
-    if match := re.match(r'(\d+)\s*h(?:eures?)?', duration_lower):
-        hours = int(match.group(1))
-        return timedelta(hours=hours)
-
-    # Pattern: "30min", "30 minutes"
-    if match := re.match(r'(\d+)\s*min(?:utes?)?', duration_lower):
-        minutes = int(match.group(1))
-        return timedelta(minutes=minutes)
-
-    # Par défaut: 1 heure
-    return timedelta(hours=1)
+    return parse_datetime(date_str, time_str)
 
 
 def list_events_summary(cal: Calendar) -> List[Dict[str, str]]:
@@ -239,10 +165,10 @@ def handle_add_event(cal: Calendar, info: str) -> Dict[str, Any]:
         # Format attendu: "titre | date | heure | description | durée"
         # Ou langage naturel que l'on essaie de parser
 
-        # Valeurs par défaut
+        # Valeurs par défaut (sans heure explicite, le parser prend midi)
         title = "Sans titre"
         date_str = "aujourd'hui"
-        time_str = "12h"
+        time_str = None
         description = ""
         duration_str = "1h"
 
@@ -262,16 +188,19 @@ def handle_add_event(cal: Calendar, info: str) -> Dict[str, Any]:
         else:
             # Tentative de parsing simple
             # Chercher un titre (début jusqu'à un mot-clé de date)
-            date_keywords = ['demain', 'aujourd', 'dans', 'le ', 'à ', '2026', '2025']
+            date_keywords = ['demain', 'aujourd', 'ce soir', 'ce matin', 'dans', 'le ', 'lundi', 'mardi',
+                             'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche', 'à ', '2026', '2025']
             found_keyword = False
             for keyword in date_keywords:
                 if keyword in info.lower():
                     idx = info.lower().index(keyword)
                     title = info[:idx].strip()
                     rest = info[idx:].strip()
-                    # Le reste contient date/heure/description
-                    # On fait simple: tout est dans rest
+                    # Le reste contient date/heure/durée : le parser
+                    # cherche chaque partie dans la phrase
                     date_str = rest
+                    if 'dure' in rest.lower():
+                        duration_str = rest[rest.lower().index('dure'):]
                     found_keyword = True
                     break
 
@@ -293,9 +222,8 @@ def handle_add_event(cal: Calendar, info: str) -> Dict[str, Any]:
             event.add('description', description)
         event.add('dtstamp', datetime.now(PARIS_TZ))
 
-        # Ajouter au calendrier
-        cal.add_component(event)
-        save_calendar(cal)
+        # Ajouter au calendrier (journalisé, sans réécrire le fichier)
+        get_calendar_journal().add(event)
 
         return {
             "type": "calendar_success",
@@ -334,8 +262,7 @@ def handle_remove_event(cal: Calendar, uid: str) -> Dict[str, Any]:
         summary = str(event.get('summary', 'Sans titre'))
 
         # Supprimer l'événement
-        cal.subcomponents = [comp for comp in cal.subcomponents if comp.get('uid') != uid]
-        save_calendar(cal)
+        get_calendar_journal().remove(uid)
 
         return {
             "type": "calendar_success",
@@ -369,41 +296,47 @@ def handle_edit_event(cal: Calendar, info: str) -> Dict[str, Any]:
             }
 
         uid = parts[0]
-        event = find_event_by_uid(cal, uid)
-
-        if not event:
-            return {
-                "type": "calendar_error",
-                "message": f"Aucun événement trouvé avec l'UID '{uid}'."
-            }
 
-        # Modifier les champs fournis
-        if len(parts) >= 2 and parts[1]:
-            event['summary'] = parts[1]
+        def change(event: Event) -> None:
+            # Modifier les champs fournis
+            if len(parts) >= 2 and parts[1]:
+                event['summary'] = parts[1]
+
+            if len(parts) >= 3 and parts[2]:
+                # Nouvelle date
+                new_time_str = parts[3] if len(parts) >= 4 and parts[3] else None
+                new_dtstart = parse_french_datetime(parts[2], new_time_str)
+
+                # Conserver la durée originale
+                old_dtstart = event.get('dtstart').dt
+                old_dtend = event.get('dtend').dt
+                if hasattr(old_dtstart, 'hour') and hasattr(old_dtend, 'hour'):
+                    duration = old_dtend - old_dtstart
+                else:
+                    duration = timedelta(hours=1)
 
-        if len(parts) >= 3 and parts[2]:
-            # Nouvelle date
-            new_time_str = parts[3] if len(parts) >= 4 and parts[3] else None
-            new_dtstart = parse_french_datetime(parts[2], new_time_str)
+                # add() encode les dates (vDDDTypes) : le modèle en mémoire
+                # reste valide sans repasser par le fichier
+                for key, value in (('dtstart', new_dtstart), ('dtend', new_dtstart + duration)):
+                    event.pop(key, None)
+                    event.add(key, value)
 
-            # Conserver la durée originale
-            old_dtstart = event.get('dtstart').dt
-            old_dtend = event.get('dtend').dt
-            if hasattr(old_dtstart, 'hour') and hasattr(old_dtend, 'hour'):
-                duration = old_dtend - old_dtstart
-            else:
-                duration = timedelta(hours=1)
+            if len(parts) >= 5 and parts[4]:
+                event['description'] = parts[4]
 
-            event['dtstart'] = new_dtstart
-            event['dtend'] = new_dtstart + duration
+            # Mettre à jour last-modified
+            event.pop('last-modified', None)
+            event.add('last-modified', datetime.now(PARIS_TZ))
 
-        if len(parts) >= 5 and parts[4]:
-            event['description'] = parts[4]
+        # Copie modifiée puis journalisée sous le verrou du journal : l'événement
+        # partagé n'est remplacé qu'une fois l'opération écrite
+        event = get_calendar_journal().update(uid, change)
 
-        # Mettre à jour last-modified
-        event['last-modified'] = datetime.now(PARIS_TZ)
-
-        save_calendar(cal)
+        if event is None:
+            return {
+                "type": "calendar_error",
+                "message": f"Aucun événement trouvé avec l'UID '{uid}'."
+            }
 
         return {
             "type": "calendar_success",
@@ -441,6 +374,78 @@ def handle_list_events(cal: Calendar) -> Dict[str, Any]:
         }
 
 
+def handle_import_events(source_path: str) -> Dict[str, Any]:
+    """
+    Importe un fichier ICS (potentiellement très gros) dans le calendrier.
+    Lecture et écriture en streaming : la mémoire reste constante.
+    """
+    source_path = source_path.strip()
+    if not source_path or not os.path.exists(source_path):
+        return {
+            "type": "calendar_error",
+            "message": f"Fichier ICS introuvable : '{source_path}'."
+        }
+
+    try:
+        # Le journal est compacté avant la fusion, le modèle rechargé après
+        with get_calendar_journal().exclusive():
+            stats = ics_stream.merge_into(CALENDAR_FILE, source_path, progress=ics_stream.print_progress)
+
+        return {
+            "type": "calendar_success",
+            "action": "import",
+            "imported": stats["imported"],
+            "skipped": stats["skipped"],
+            "count": stats["total"],
+            "message": (
+                f"{stats['imported']} événement(s) importé(s) depuis '{source_path}' "
+                f"({stats['skipped']} déjà présent(s))."
+            )
+        }
+
+    except Exception as e:
+        return {
+            "type": "calendar_error",
+            "message": f"Erreur lors de l'import : {str(e)}"
+        }
+
+
+def handle_export_events(dest_path: str) -> Dict[str, Any]:
+    """
+    Exporte le calendrier vers un autre fichier ICS, événement par événement.
+    """
+    dest_path = dest_path.strip()
+    if not dest_path:
+        return {
+            "type": "calendar_error",
+            "message": "Chemin de destination manquant pour l'export."
+        }
+
+    try:
+        # Intégrer le journal au fichier avant de le relire en streaming
+        get_calendar_journal().compact()
+        if os.path.exists(CALENDAR_FILE):
+            timezones: ics_stream.Timezones = {}
+            count = ics_stream.write_events(
+                dest_path, ics_stream.iter_events(CALENDAR_FILE, timezones=timezones), timezones=timezones
+            )
+        else:
+            count = ics_stream.write_events(dest_path, [])
+
+        return {
+            "type": "calendar_success",
+            "action": "export",
+            "count": count,
+            "message": f"{count} événement(s) exporté(s) vers '{dest_path}'."
+        }
+
+    except Exception as e:
+        return {
+            "type": "calendar_error",
+            "message": f"Erreur lors de l'export : {str(e)}"
+        }
+
+
 # =========================
 # Main Handler
 # =========================
@@ -453,6 +458,12 @@ def calendar_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
     action = values.get("action", "").lower()
     event_info = values.get("event_info", "")
 
+    # Import / export : en streaming, sans charger le calendrier en mémoire
+    if action in ["import", "importer"]:
+        return handle_import_events(event_info)
+    elif action in ["export", "exporter"]:
+        return handle_export_events(event_info)
+
     # Charger le calendrier
     cal = load_calendar()
 
@@ -468,7 +479,7 @@ def calendar_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
     else:
         return {
             "type": "calendar_error",
-            "message": f"Action non reconnue : '{action}'. Utilise : add, remove, edit, ou list."
+            "message": f"Action non reconnue : '{action}'. Utilise : add, remove, edit, list, import ou export."
         }
 
 
@@ -476,37 +487,45 @@ def calendar_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
 # Skill Definition
 # =========================
 
-def create_calendar_skill() -> Skill:
-    """Crée et retourne le skill calendrier ICS"""
-    calendar_slots = [
-        Slot(
-            name="action",
-            description="L'action voulue : add (ajouter), remove (supprimer), edit (modifier), list (lister)",
-            question="Que veux-tu faire avec le calendrier ? (ajouter/supprimer/modifier/lister)"
-        ),
-        Slot(
-            name="event_info",
-            description=(
+# Métadonnées lues par skill_registry sans importer ce module
+SKILL = {
+    "name": "calendar",
+    "description": "Gestion d'un calendrier avec ajout, suppression, modification, listing, import et export d'événements",
+    "slots": [
+        {
+            "name": "action",
+            "description": (
+                "L'action voulue : add (ajouter), remove (supprimer), edit (modifier), list (lister), "
+                "import (importer un fichier .ics), export (exporter vers un fichier .ics)"
+            ),
+            "question": "Que veux-tu faire avec le calendrier ? (ajouter/supprimer/modifier/lister/importer/exporter)",
+        },
+        {
+            "name": "event_info",
+            "description": (
                 "Les détails de l'événement selon l'action. "
                 "Pour ADD: titre | date | heure | description | durée. "
                 "Pour REMOVE: l'UID de l'événement à supprimer. "
                 "Pour EDIT: UID | nouveau_titre | nouvelle_date | nouvelle_heure | nouvelle_description. "
-                "Pour LIST: laisser vide ou dire 'tous'."
+                "Pour LIST: laisser vide ou dire 'tous'. "
+                "Pour IMPORT / EXPORT: le chemin du fichier .ics."
             ),
-            question="Donne-moi les détails nécessaires pour cette action."
-        )
-    ]
-
-    return Skill(
-        name="calendar",
-        description="Gestion d'un calendrier avec ajout, suppression, modification et listing d'événements",
-        slots=calendar_slots,
-        final_answer_system_prompt="""
+            "question": "Donne-moi les détails nécessaires pour cette action.",
+        },
+    ],
+    # Actions dont event_info est l'UID d'un événement listé ("supprime le 2e")
+    "references": {"event_info": ["remove", "supprimer", "delete", "effacer", "edit", "modifier", "update", "changer"]},
+    "final_answer_system_prompt": """
 Tu es un assistant qui gère un calendrier simple.
 Tu reçois des données structurées avec une action et les informations d'un événement.
 Si c'est un succès, informe clairement l'utilisateur du résultat.
 Si c'est une erreur, explique le problème simplement.
 Réponds en français, de manière naturelle et concise.
 """,
-        on_ready=calendar_on_ready
-    )
+    "on_ready": "calendar_on_ready",
+}
+
+
+def create_calendar_skill() -> Skill:
+    """Crée et retourne le skill calendrier ICS"""
+    return build_skill(SKILL, calendar_on_ready)
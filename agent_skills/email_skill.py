@@ -2,13 +2,46 @@
 # Email Skill - Simulated Emails
 # =========================
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 import os
 import json
-from agent import Skill, Slot, send_llama_chat
+import tempfile
+from contextlib import contextmanager
+from agent import Skill, send_llama_chat
+from deadlines import DeadlineExceeded, remaining
+from llm_scheduler import BACKGROUND
+from prompt_budget import truncate_text
+from skill_registry import build_skill
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
 
 # Constants
 EMAIL_FILE = "./Files/emails.json"
+# Temps du tour gardé pour formuler la réponse finale après les synthèses
+SYNTHESIS_RESERVE = 5.0
+# Au-delà, le corps du mail est tronqué avant synthèse (coût de prefill borné)
+EMAIL_BODY_TOKENS = 1024
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp crée en 0600 : le fichier remplacé garde ses droits, un nouveau
+# fichier prend ceux d'une création normale (umask lu une fois, à l'import)
+NEW_FILE_MODE = 0o666 & ~_umask()
+
+
+def _file_mode(path: str) -> int:
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return NEW_FILE_MODE
 
 
 # =========================
@@ -36,13 +69,57 @@ def save_emails(emails: List[Dict]) -> None:
     """
     Sauvegarde les emails au format JSON.
     Crée le dossier Files si nécessaire.
+    Écriture atomique (fichier temporaire + os.replace) : un autre processus
+    ne lit jamais un fichier à moitié écrit.
     """
-    os.makedirs("./Files", exist_ok=True)
+    directory = os.path.dirname(os.path.abspath(EMAIL_FILE))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = None
     try:
-        with open(EMAIL_FILE, 'w', encoding='utf-8') as f:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".emails-")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump({"emails": emails}, f, ensure_ascii=False, indent=2)
+        os.chmod(tmp_path, _file_mode(EMAIL_FILE))
+        os.replace(tmp_path, EMAIL_FILE)
     except Exception as e:
         print(f"Erreur lors de la sauvegarde des emails: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def emails_lock():
+    """
+    Verrou inter-processus (flock sur emails.json.lock) autour d'un
+    cycle lecture-modification-écriture des emails.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = EMAIL_FILE + ".lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def mark_emails_read(email_ids: Iterable[str]) -> None:
+    """
+    Marque des emails comme lus en relisant le fichier sous verrou : les
+    modifications faites entre-temps par d'autres sessions sont conservées.
+    """
+    ids = set(email_ids)
+    if not ids:
+        return
+    with emails_lock():
+        emails = load_emails()
+        for email in emails:
+            if email.get('id') in ids:
+                email['read'] = True
+        save_emails(emails)
 
 
 def find_email_by_id(emails: List[Dict], email_id: str) -> Optional[Dict]:
@@ -76,11 +153,15 @@ Réponds en français de manière naturelle et concise."""
     try:
         synthesis = send_llama_chat(
             system_prompt=system_prompt,
-            user_content=f"Résume cet email:\n\n{email_body}",
+            user_content=f"Résume cet email:\n\n{truncate_text(email_body, EMAIL_BODY_TOKENS)}",
             temperature=0.7,
             max_tokens=256,
+            # Synthèse en masse : ne doit pas retarder les tours des autres sessions
+            priority=BACKGROUND,
         )
         return synthesis
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return f"Erreur lors de la synthèse: {str(e)}"
 
@@ -232,7 +313,7 @@ def handle_read_email(emails: List[Dict], email_id: str) -> Dict[str, Any]:
 
         # Marquer comme lu et sauvegarder
         email['read'] = True
-        save_emails(emails)
+        mark_emails_read([email['id']])
 
         return {
             "type": "email_success",
@@ -283,10 +364,16 @@ def handle_synthesize_email(emails: List[Dict], email_info: str) -> Dict[str, An
                 }
             emails_to_synthesize = [email]
 
-        # Générer les synthèses avec le LLM
+        # Générer les synthèses avec le LLM, tant que le budget du tour le permet
         syntheses = []
         for email in emails_to_synthesize:
-            summary = synthesize_email_with_llm(email.get('body', ''))
+            left = remaining()
+            if left is not None and left < SYNTHESIS_RESERVE:
+                break
+            try:
+                summary = synthesize_email_with_llm(email.get('body', ''))
+            except DeadlineExceeded:
+                break
 
             syntheses.append({
                 'id': email['id'],
@@ -299,15 +386,21 @@ def handle_synthesize_email(emails: List[Dict], email_info: str) -> Dict[str, An
             # Marquer comme lu
             email['read'] = True
 
-        # Sauvegarder le statut mis à jour
-        save_emails(emails)
+        # Sauvegarder le statut mis à jour (fichier relu sous verrou)
+        mark_emails_read(item['id'] for item in syntheses)
+
+        message = f"Voici la synthèse de {len(syntheses)} email(s) :"
+        skipped = len(emails_to_synthesize) - len(syntheses)
+        if skipped:
+            # Les emails non résumés restent non lus : une nouvelle demande les reprendra
+            message += f" ({skipped} autre(s) non résumé(s) faute de temps, redemande-moi la suite)"
 
         return {
             "type": "email_success",
             "action": "synthesize",
             "syntheses": syntheses,
             "count": len(syntheses),
-            "message": f"Voici la synthèse de {len(syntheses)} email(s) :"
+            "message": message
         }
 
     except Exception as e:
@@ -334,8 +427,11 @@ def email_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
 
     # Initialiser avec des emails d'exemple si le fichier n'existe pas
     if not emails:
-        emails = initialize_sample_emails()
-        save_emails(emails)
+        with emails_lock():
+            emails = load_emails()
+            if not emails:
+                emails = initialize_sample_emails()
+                save_emails(emails)
 
     # Router vers l'opération appropriée
     if action in ["list", "lister", "voir", "afficher", "show"]:
@@ -355,39 +451,38 @@ def email_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
 # Skill Definition
 # =========================
 
-def create_email_skill() -> Skill:
-    """Crée et retourne le skill email"""
-    email_slots = [
-        Slot(
-            name="action",
-            description=(
+# Métadonnées lues par skill_registry sans importer ce module
+SKILL = {
+    "name": "email",
+    "description": (
+        "Consultation, lecture et synthèse d'emails. "
+        "Utilise cette skill quand l'utilisateur demande de lire, lister ou résumer ses emails"
+    ),
+    "slots": [
+        {
+            "name": "action",
+            "description": (
                 "L'action voulue: "
                 "list (lister les emails), "
                 "read (lire un email spécifique), "
                 "synthesize (synthétiser/résumer un ou plusieurs emails)"
             ),
-            question="Que veux-tu faire avec tes emails ? (lister/lire/synthétiser)"
-        ),
-        Slot(
-            name="email_info",
-            description=(
+            "question": "Que veux-tu faire avec tes emails ? (lister/lire/synthétiser)",
+        },
+        {
+            "name": "email_info",
+            "description": (
                 "L'ID ou le numéro de l'email pour les actions read et synthesize. "
                 "Pour LIST: laisser vide. "
                 "Pour READ: ID de l'email (ex: 'email_001' ou '1'). "
                 "Pour SYNTHESIZE: ID de l'email, ou 'tous'/'all' pour synthétiser tous les emails non lus."
             ),
-            question="Quel email veux-tu consulter ? (donne l'ID, ou dis 'tous' pour synthétiser tout)"
-        )
-    ]
-
-    return Skill(
-        name="email",
-        description=(
-            "Consultation, lecture et synthèse d'emails. "
-            "Utilise cette skill quand l'utilisateur demande de lire, lister ou résumer ses emails"
-        ),
-        slots=email_slots,
-        final_answer_system_prompt="""
+            "question": "Quel email veux-tu consulter ? (donne l'ID, ou dis 'tous' pour synthétiser tout)",
+        },
+    ],
+    # Actions dont email_info est l'ID d'un email listé ("lis le 2e")
+    "references": {"email_info": ["read", "lire", "ouvrir", "open", "synthesize", "synthétiser", "synthetiser", "résumer", "resumer", "summary"]},
+    "final_answer_system_prompt": """
 Tu es un assistant qui aide à consulter et synthétiser les emails.
 Tu reçois des données structurées avec les emails et leurs synthèses.
 Si c'est un succès, présente les informations de manière claire et engageante.
@@ -396,5 +491,10 @@ Pour les synthèses, présente-les de manière concise et structurée.
 Si c'est une erreur, explique le problème simplement.
 Réponds en français de façon naturelle et concise.
 """,
-        on_ready=email_on_ready
-    )
+    "on_ready": "email_on_ready",
+}
+
+
+def create_email_skill() -> Skill:
+    """Crée et retourne le skill email"""
+    return build_skill(SKILL, email_on_ready)
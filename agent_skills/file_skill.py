@@ -4,7 +4,28 @@
 
 from typing import Any, Dict
 import os
-from agent import Skill, Slot
+import tempfile
+from agent import Skill
+from skill_registry import build_skill
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# mkstemp crée en 0600 : le fichier remplacé garde ses droits, un nouveau
+# fichier prend ceux d'une création normale (umask lu une fois, à l'import)
+NEW_FILE_MODE = 0o666 & ~_umask()
+
+
+def _file_mode(path: str) -> int:
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return NEW_FILE_MODE
+
 
 def file_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
     title = values.get("title", "")
@@ -22,9 +43,18 @@ def file_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
     file_path = os.path.join(files_dir, title)
 
     try:
-        # Créer le fichier avec le contenu
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        # Créer le fichier avec le contenu (écriture atomique : un autre
+        # processus ne voit jamais un fichier à moitié écrit)
+        fd, tmp_path = tempfile.mkstemp(dir=files_dir, prefix=".file-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.chmod(tmp_path, _file_mode(file_path))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
         return {
             "type": "file_success",
@@ -41,31 +71,33 @@ def file_on_ready(values: Dict[str, str]) -> Dict[str, Any]:
         }
 
 
-def create_file_skill() -> Skill:
-    """Crée et retourne le skill file txt"""
-    file_slots = [
-        Slot(
-            name="title",
-            description="le nom du fichier à créer (avec ou sans extension .txt). Exemple: 'notes', 'todo.txt', 'memo'",
-            question="Quel nom veux-tu donner à ton fichier ?",
-        ),
-        Slot(
-            name="content",
-            description="le contenu texte à écrire dans le fichier",
-            question="Quel contenu veux-tu mettre dans ce fichier ?",
-        )
-    ]
-
-    return Skill(
-        name="file",
-        description="création et écriture de fichiers texte. Utilise cette skill quand l'utilisateur veut créer, écrire ou sauvegarder un fichier texte",
-        slots=file_slots,
-        final_answer_system_prompt="""
+# Métadonnées lues par skill_registry sans importer ce module
+SKILL = {
+    "name": "file",
+    "description": "création et écriture de fichiers texte. Utilise cette skill quand l'utilisateur veut créer, écrire ou sauvegarder un fichier texte",
+    "slots": [
+        {
+            "name": "title",
+            "description": "le nom du fichier à créer (avec ou sans extension .txt). Exemple: 'notes', 'todo.txt', 'memo'",
+            "question": "Quel nom veux-tu donner à ton fichier ?",
+        },
+        {
+            "name": "content",
+            "description": "le contenu texte à écrire dans le fichier",
+            "question": "Quel contenu veux-tu mettre dans ce fichier ?",
+        },
+    ],
+    "final_answer_system_prompt": """
 Tu es un assistant qui aide à créer et gérer des fichiers texte.
 Tu reçois des données structurées avec le nom du fichier et le résultat de la création.
 Si c'est un succès, confirme que le fichier a été créé et où il se trouve.
 Si c'est une erreur, explique le problème de manière claire et propose une solution.
 Réponds en français de façon naturelle et concise.
 """,
-        on_ready=file_on_ready,
-    )
+    "on_ready": "file_on_ready",
+}
+
+
+def create_file_skill() -> Skill:
+    """Crée et retourne le skill file txt"""
+    return build_skill(SKILL, file_on_ready)
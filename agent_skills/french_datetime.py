@@ -0,0 +1,546 @@
+# =========================
+# Parser de dates / heures / durées en français
+# =========================
+#
+# Grammaire simple à base de motifs précompilés :
+#   <expression> := [<date>] [<moment>] [<heure>]
+#   <date>       := aujourd'hui | demain | après-demain | hier | avant-hier
+#                 | dans N <unité> | il y a N <unité> | dans NhMM
+#                 | [ce] <jour> [prochain | en huit]
+#                 | [le] N[er] <mois> [AAAA] | JJ/MM[/AAAA] | AAAA-MM-JJ
+#                 | la semaine prochaine | le mois prochain
+#   <moment>     := matin | midi | après-midi | soir | nuit | minuit
+#   <heure>      := HHhMM | HH:MM | HH heures [MM] | midi | minuit [et quart | et demie]
+#
+# Les résultats sont mis en cache par (expression normalisée, jour de référence) :
+# la même phrase répétée dans la journée ne repasse pas par les regex.
+
+from typing import Dict, NamedTuple, Optional, Tuple
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import pytz
+
+PARIS_TZ = pytz.timezone('Europe/Paris')
+
+DEFAULT_HOUR = 12
+DEFAULT_DURATION = timedelta(hours=1)
+CACHE_SIZE = 2048
+
+
+# =========================
+# Vocabulaire
+# =========================
+
+WEEKDAYS: Dict[str, int] = {
+    "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3,
+    "vendredi": 4, "samedi": 5, "dimanche": 6,
+}
+
+MONTHS: Dict[str, int] = {
+    "janvier": 1, "janv": 1, "fevrier": 2, "fevr": 2, "fev": 2, "mars": 3,
+    "avril": 4, "avr": 4, "mai": 5, "juin": 6, "juillet": 7, "juil": 7,
+    "aout": 8, "septembre": 9, "sept": 9, "octobre": 10, "oct": 10,
+    "novembre": 11, "nov": 11, "decembre": 12, "dec": 12,
+}
+
+NUMBER_WORDS: Dict[str, int] = {
+    "un": 1, "une": 1, "deux": 2, "trois": 3, "quatre": 4, "cinq": 5,
+    "six": 6, "sept": 7, "huit": 8, "neuf": 9, "dix": 10, "onze": 11,
+    "douze": 12, "quinze": 15, "vingt": 20, "trente": 30, "quarante": 40,
+    "quarante-cinq": 45, "cinquante": 50,
+}
+
+# Heure par défaut associée à un moment de la journée
+MOMENTS: Dict[str, int] = {
+    "matin": 9, "midi": 12, "apres-midi": 14, "aprem": 14,
+    "soir": 19, "soiree": 19, "nuit": 22, "minuit": 0,
+}
+
+RELATIVE_DAYS: Dict[str, int] = {
+    "aujourd'hui": 0, "aujourdhui": 0, "auj": 0, "today": 0,
+    "apres-demain": 2, "apres demain": 2, "demain": 1, "tomorrow": 1, "tmr": 1,
+    "avant-hier": -2, "avant hier": -2, "hier": -1,
+}
+
+# Unités -> (jours, minutes) ; "mois" est traité à part
+UNITS: Dict[str, Tuple[int, int]] = {
+    "minute": (0, 1), "min": (0, 1), "mn": (0, 1),
+    "heure": (0, 60), "h": (0, 60),
+    "jour": (1, 0), "j": (1, 0),
+    "semaine": (7, 0), "sem": (7, 0),
+}
+
+
+# =========================
+# Motifs précompilés
+# =========================
+
+def _alternation(words) -> str:
+    # Les plus longs d'abord pour que "apres-demain" passe avant "demain"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+_NUMBER = rf"(?:\d+|{_alternation(NUMBER_WORDS)})"
+_UNIT = r"(?:minutes?|mins?|mn|heures?|h|jours?|j|semaines?|sem|mois)"
+
+_RE_SPACES = re.compile(r"\s+")
+_RE_DURATION_CLAUSE = re.compile(
+    r"(?:\bqui\s+)?\b(?:dure|durera|duree\s+(?:de\s+)?|pendant)\s+[^,|]*"
+)
+_RE_RELATIVE_DAY = re.compile(rf"\b({_alternation(RELATIVE_DAYS)})(?![\w-])")
+_RE_IN_DELTA = re.compile(rf"\b(dans|il y a)\s+({_NUMBER})\s*({_UNIT})\b")
+_RE_IN_HM = re.compile(r"\b(dans|il y a)\s+(\d+)\s*(?:h|heures?)\s*(\d{1,2})(?:\s*(?:minutes?|mins?|mn))?\b")
+_RE_WEEKDAY = re.compile(
+    rf"\b({_alternation(WEEKDAYS)})\b(?:\s+(prochain|en huit))?"
+)
+_RE_NEXT_PERIOD = re.compile(r"\b(semaine|mois|annee)\s+prochaine?\b")
+_RE_DAY_MONTH = re.compile(
+    rf"\b(\d{{1,2}})(?:er)?\s+({_alternation(MONTHS)})\.?(?:\s+(\d{{4}}))?\b"
+)
+_RE_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_RE_SLASH_DATE = re.compile(r"\b(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?\b")
+_RE_MOMENT = re.compile(rf"\b({_alternation(MOMENTS)})\b")
+_RE_TIME_HM = re.compile(
+    r"(?:\ba\s+|\bvers\s+)?\b(\d{1,2})\s*(?:h|:|heures?)\s*(\d{2})?(?!\s*(?:min|mn))"
+    r"(?:\s*(am|pm))?"
+)
+_RE_TIME_AMPM = re.compile(r"\b(\d{1,2})\s*(am|pm)\b")
+_RE_TIME_FRACTION = re.compile(r"\b(et quart|et demie?|moins le quart)\b")
+
+_RE_DURATION_PART = re.compile(
+    rf"({_NUMBER}|demi|quart)\s*(?:-\s*)?(?:d')?\s*({_UNIT})\b(?:\s*(?:et\s+)?(\d{{1,2}}|demie?|quart)\b(?!\s*{_UNIT}))?"
+)
+_RE_DURATION_COMPACT = re.compile(r"\b(\d+)\s*h\s*(\d{1,2})(?!\d)")
+
+
+# =========================
+# Normalisation
+# =========================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_expression(text: str) -> str:
+    """
+    Minuscules, sans accents, apostrophes et espaces uniformisés.
+    """
+    if not text:
+        return ""
+    s = text.lower().replace("’", "'").replace("`", "'")
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return _RE_SPACES.sub(" ", s).strip()
+
+
+def _to_int(token: str) -> int:
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS[token]
+
+
+# =========================
+# Résultat intermédiaire (indépendant de l'heure courante)
+# =========================
+
+class _DateSpec(NamedTuple):
+    day: Optional[date]              # jour absolu, None si non trouvé
+    hour: Optional[int]
+    minute: int
+    delta: Optional[timedelta]       # décalage relatif à l'instant courant ("dans 2 heures")
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.month - 1 + months
+    year = d.year + month_index // 12
+    month = month_index % 12 + 1
+    # Ramener au dernier jour valide du mois
+    for day in (d.day, 30, 29, 28):
+        try:
+            return date(year, month, day)
+        except ValueError:
+            continue
+    return date(year, month, 28)
+
+
+def _parse_date_part(s: str, today: date) -> Tuple[Optional[date], Optional[timedelta]]:
+    if match := _RE_IN_HM.search(s):
+        sign = 1 if match.group(1) == "dans" else -1
+        return None, sign * timedelta(hours=int(match.group(2)), minutes=int(match.group(3)))
+
+    if match := _RE_IN_DELTA.search(s):
+        sign = 1 if match.group(1) == "dans" else -1
+        n = _to_int(match.group(2)) * sign
+        unit = match.group(3)
+        if unit == "mois":
+            return _add_months(today, n), None
+        unit_key = unit.rstrip("s") if unit not in UNITS else unit
+        days, minutes = UNITS.get(unit_key, UNITS["jour"])
+        if minutes:
+            return None, timedelta(minutes=minutes * n)
+        return today + timedelta(days=days * n), None
+
+    if match := _RE_RELATIVE_DAY.search(s):
+        return today + timedelta(days=RELATIVE_DAYS[match.group(1)]), None
+
+    if match := _RE_ISO_DATE.search(s):
+        try:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3))), None
+        except ValueError:
+            pass
+
+    if match := _RE_DAY_MONTH.search(s):
+        day, month = int(match.group(1)), MONTHS[match.group(2)]
+        year = int(match.group(3)) if match.group(3) else today.year
+        try:
+            result = date(year, month, day)
+        except ValueError:
+            result = None
+        if result is not None:
+            # Sans année explicite, une date passée désigne l'an prochain
+            if not match.group(3) and result < today:
+                result = result.replace(year=year + 1)
+            return result, None
+
+    if match := _RE_SLASH_DATE.search(s):
+        day, month = int(match.group(1)), int(match.group(2))
+        year_token = match.group(3)
+        year = today.year
+        if year_token:
+            year = int(year_token) + (2000 if len(year_token) == 2 else 0)
+        try:
+            result = date(year, month, day)
+            if not year_token and result < today:
+                result = result.replace(year=year + 1)
+            return result, None
+        except ValueError:
+            pass
+
+    if match := _RE_WEEKDAY.search(s):
+        target = WEEKDAYS[match.group(1)]
+        ahead = (target - today.weekday()) % 7
+        modifier = match.group(2)
+        if modifier and ahead == 0:
+            ahead = 7
+        if modifier == "en huit":
+            ahead += 7
+        return today + timedelta(days=ahead), None
+
+    if match := _RE_NEXT_PERIOD.search(s):
+        period = match.group(1)
+        if period == "semaine":
+            return today + timedelta(days=7 - today.weekday()), None
+        if period == "mois":
+            return _add_months(today.replace(day=1), 1), None
+        return date(today.year + 1, 1, 1), None
+
+    return None, None
+
+
+def _parse_time_part(s: str) -> Tuple[Optional[int], int]:
+    hour: Optional[int] = None
+    minute = 0
+
+    if match := _RE_TIME_HM.search(s):
+        hour = int(match.group(1))
+        minute = int(match.group(2) or 0)
+        if match.group(3) == "pm" and hour < 12:
+            hour += 12
+    elif match := _RE_TIME_AMPM.search(s):
+        hour = int(match.group(1)) % 12 + (12 if match.group(2) == "pm" else 0)
+    elif match := _RE_MOMENT.search(s):
+        hour = MOMENTS[match.group(1)]
+
+    if hour is not None and (hour > 23 or minute > 59):
+        return None, 0
+
+    if hour is not None and (fraction := _RE_TIME_FRACTION.search(s)):
+        if fraction.group(1) == "et quart":
+            minute = 15
+        elif fraction.group(1) == "moins le quart":
+            hour, minute = (hour - 1) % 24, 45
+        else:
+            minute = 30
+
+    # "8h ce soir" -> 20h
+    if hour is not None and hour < 12:
+        moment = _RE_MOMENT.search(s)
+        if moment and moment.group(1) in ("soir", "soiree", "apres-midi", "aprem") and hour != 0:
+            hour += 12
+
+    return hour, minute
+
+
+def _fallback_dateutil(s: str) -> Optional[datetime]:
+    # Import paresseux : dateutil n'est utile que pour les formats exotiques
+    from dateutil import parser as dateutil_parser
+    try:
+        return dateutil_parser.parse(s, dayfirst=True)
+    except (ValueError, OverflowError):
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_cached(expression: str, time_expression: str, today: date) -> _DateSpec:
+    s = _RE_DURATION_CLAUSE.sub(" ", expression)
+    day, delta = _parse_date_part(s, today)
+
+    if time_expression:
+        hour, minute = _parse_time_part(time_expression)
+    else:
+        hour, minute = _parse_time_part(s)
+
+    if day is None and delta is None and hour is None and s.strip():
+        parsed = _fallback_dateutil(s)
+        if parsed is not None:
+            has_time = bool(parsed.hour or parsed.minute)
+            return _DateSpec(
+                parsed.date(),
+                parsed.hour if has_time else None,
+                parsed.minute,
+                None,
+            )
+
+    return _DateSpec(day, hour, minute, delta)
+
+
+# =========================
+# API publique
+# =========================
+
+def parse_datetime(
+    date_expression: Optional[str],
+    time_expression: Optional[str] = None,
+    reference: Optional[datetime] = None,
+) -> datetime:
+    """
+    Parse une date (et éventuellement une heure) en français naturel.
+
+    Exemples:
+      - "lundi prochain", "le 15 janvier", "15/01/2026"
+      - "ce soir", "demain matin", "dans 2 semaines à 9h"
+      - "dans 3 heures" (relatif à l'instant de référence)
+
+    Sans heure trouvée, l'heure par défaut est midi.
+    Retourne un datetime en timezone Europe/Paris.
+    """
+    if reference is None:
+        reference = datetime.now(PARIS_TZ)
+    elif reference.tzinfo is None:
+        reference = PARIS_TZ.localize(reference)
+    else:
+        reference = reference.astimezone(PARIS_TZ)
+
+    expression = normalize_expression(date_expression or "") or "aujourd'hui"
+    spec = _parse_cached(
+        expression,
+        normalize_expression(time_expression or ""),
+        reference.date(),
+    )
+
+    if spec.delta is not None:
+        return (reference + spec.delta).replace(second=0, microsecond=0)
+
+    day = spec.day or reference.date()
+    hour = DEFAULT_HOUR if spec.hour is None else spec.hour
+    return PARIS_TZ.localize(datetime(day.year, day.month, day.day, hour, spec.minute))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_duration_cached(expression: str) -> Optional[timedelta]:
+    if match := _RE_DURATION_COMPACT.search(expression):
+        return timedelta(hours=int(match.group(1)), minutes=int(match.group(2)))
+
+    total = timedelta()
+    found = False
+    for match in _RE_DURATION_PART.finditer(expression):
+        amount_token, unit, extra = match.groups()
+        if amount_token == "demi":
+            amount = 0.5
+        elif amount_token == "quart":
+            amount = 0.25
+        else:
+            amount = _to_int(amount_token)
+
+        if unit == "mois":
+            total += timedelta(days=30 * amount)
+        else:
+            unit_key = unit if unit in UNITS else unit.rstrip("s")
+            days, minutes = UNITS.get(unit_key, (0, 60))
+            total += timedelta(days=days * amount, minutes=minutes * amount)
+            if extra and minutes == 60:
+                if extra.startswith("demi"):
+                    total += timedelta(minutes=30)
+                elif extra == "quart":
+                    total += timedelta(minutes=15)
+                else:
+                    total += timedelta(minutes=int(extra))
+        found = True
+
+    return total if found and total > timedelta() else None
+
+
+def find_duration(text: Optional[str]) -> Optional[timedelta]:
+    """
+    Cherche une durée dans un texte libre. Retourne None si aucune n'est trouvée.
+    """
+    if not text:
+        return None
+    return _parse_duration_cached(normalize_expression(text))
+
+
+def parse_duration(duration_str: Optional[str]) -> timedelta:
+    """
+    Parse une durée en français.
+
+    Exemples:
+      - "1h", "1 heure", "une heure et demie" -> 1 heure (et demie)
+      - "30min", "une demi-heure", "un quart d'heure"
+      - "2h30", "2 heures 15", "2 jours", "1 semaine"
+
+    Retourne un timedelta (1 heure par défaut).
+    """
+    return find_duration(duration_str) or DEFAULT_DURATION
+
+
+def cache_info() -> Dict[str, object]:
+    """Statistiques des caches (pour le débogage et le benchmark)."""
+    return {
+        "datetime": _parse_cached.cache_info()._asdict(),
+        "duration": _parse_duration_cached.cache_info()._asdict(),
+        "normalize": normalize_expression.cache_info()._asdict(),
+    }
+
+
+def clear_cache() -> None:
+    _parse_cached.cache_clear()
+    _parse_duration_cached.cache_clear()
+    normalize_expression.cache_clear()
+
+
+# =========================
+# Corpus de référence + benchmark
+# =========================
+#
+# python -m agent_skills.french_datetime
+#
+# Référence fixe : mercredi 7 janvier 2026, 10h00 (Europe/Paris).
+
+_REFERENCE = datetime(2026, 1, 7, 10, 0)
+
+DATETIME_CORPUS = [
+    # (date, heure, attendu "AAAA-MM-JJ HH:MM")
+    ("aujourd'hui", None, "2026-01-07 12:00"),
+    ("demain", "14h30", "2026-01-08 14:30"),
+    ("après-demain", None, "2026-01-09 12:00"),
+    ("Après demain à 9h", None, "2026-01-09 09:00"),
+    ("hier soir", None, "2026-01-06 19:00"),
+    ("ce soir", None, "2026-01-07 19:00"),
+    ("ce matin", None, "2026-01-07 09:00"),
+    ("cet après-midi", None, "2026-01-07 14:00"),
+    ("demain matin", None, "2026-01-08 09:00"),
+    ("ce soir à 8h", None, "2026-01-07 20:00"),
+    ("lundi", None, "2026-01-12 12:00"),
+    ("lundi prochain", None, "2026-01-12 12:00"),
+    ("mercredi prochain", None, "2026-01-14 12:00"),
+    ("mercredi", None, "2026-01-07 12:00"),
+    ("vendredi en huit", None, "2026-01-16 12:00"),
+    ("le 15 janvier", None, "2026-01-15 12:00"),
+    ("le 1er mars à 10h", None, "2026-03-01 10:00"),
+    ("15 janvier 2027", "18:45", "2027-01-15 18:45"),
+    ("le 3 janvier", None, "2027-01-03 12:00"),
+    ("15/01/2026", None, "2026-01-15 12:00"),
+    ("15/02", "9h", "2026-02-15 09:00"),
+    ("2026-02-01", None, "2026-02-01 12:00"),
+    ("dans 3 jours", None, "2026-01-10 12:00"),
+    ("dans 2 semaines à 9h", None, "2026-01-21 09:00"),
+    ("dans une semaine", None, "2026-01-14 12:00"),
+    ("dans 2 mois", None, "2026-03-07 12:00"),
+    ("dans 2 heures", None, "2026-01-07 12:00"),
+    ("dans 30 minutes", None, "2026-01-07 10:30"),
+    ("dans 2h30", None, "2026-01-07 12:30"),
+    ("dans 1h15", None, "2026-01-07 11:15"),
+    ("dans 1 heure 45", None, "2026-01-07 11:45"),
+    ("il y a 2h30", None, "2026-01-07 07:30"),
+    ("la semaine prochaine", None, "2026-01-12 12:00"),
+    ("le mois prochain", None, "2026-02-01 12:00"),
+    ("demain à midi et demie", None, "2026-01-08 12:30"),
+    ("demain à 10 heures et quart", None, "2026-01-08 10:15"),
+    ("demain à 10h moins le quart", None, "2026-01-08 09:45"),
+    ("demain à 14h30 qui dure 1h", None, "2026-01-08 14:30"),
+    ("vendredi", "3pm", "2026-01-09 15:00"),
+    ("", "14h", "2026-01-07 14:00"),
+]
+
+DURATION_CORPUS = [
+    ("1h", timedelta(hours=1)),
+    ("1 heure", timedelta(hours=1)),
+    ("30min", timedelta(minutes=30)),
+    ("45 minutes", timedelta(minutes=45)),
+    ("2h30", timedelta(hours=2, minutes=30)),
+    ("2h30min", timedelta(hours=2, minutes=30)),
+    ("2 heures 15", timedelta(hours=2, minutes=15)),
+    ("une heure et demie", timedelta(hours=1, minutes=30)),
+    ("une demi-heure", timedelta(minutes=30)),
+    ("un quart d'heure", timedelta(minutes=15)),
+    ("2 jours", timedelta(days=2)),
+    ("1 semaine", timedelta(days=7)),
+    ("qui dure deux heures", timedelta(hours=2)),
+    ("", timedelta(hours=1)),
+    ("n'importe quoi", timedelta(hours=1)),
+]
+
+
+def run_corpus() -> int:
+    """Vérifie le corpus de référence. Retourne le nombre d'échecs."""
+    failures = 0
+    for expr, time_expr, expected in DATETIME_CORPUS:
+        got = parse_datetime(expr, time_expr, reference=_REFERENCE).strftime("%Y-%m-%d %H:%M")
+        if got != expected:
+            failures += 1
+            print(f"ÉCHEC date: {expr!r} / {time_expr!r} -> {got} (attendu {expected})")
+    for expr, expected in DURATION_CORPUS:
+        got = parse_duration(expr)
+        if got != expected:
+            failures += 1
+            print(f"ÉCHEC durée: {expr!r} -> {got} (attendu {expected})")
+    total = len(DATETIME_CORPUS) + len(DURATION_CORPUS)
+    print(f"Corpus: {total - failures}/{total} OK")
+    return failures
+
+
+def benchmark(iterations: int = 2000) -> None:
+    import time
+
+    def run_once():
+        for expr, time_expr, _ in DATETIME_CORPUS:
+            parse_datetime(expr, time_expr, reference=_REFERENCE)
+        for expr, _ in DURATION_CORPUS:
+            parse_duration(expr)
+
+    n_calls = iterations * (len(DATETIME_CORPUS) + len(DURATION_CORPUS))
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        clear_cache()
+        run_once()
+    cold = time.perf_counter() - start
+
+    clear_cache()
+    run_once()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        run_once()
+    warm = time.perf_counter() - start
+
+    print(f"Sans cache : {cold / n_calls * 1e6:.1f} µs/appel")
+    print(f"Avec cache : {warm / n_calls * 1e6:.1f} µs/appel")
+    print("Cache:", cache_info())
+
+
+if __name__ == "__main__":
+    import sys
+
+    failed = run_corpus()
+    benchmark()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,197 @@
+# =========================
+# Lecture / écriture ICS en streaming
+# =========================
+#
+# Calendar.from_ical() construit l'arbre complet du fichier en mémoire.
+# Ici on lit le fichier ligne par ligne et on ne parse qu'un VEVENT à la
+# fois : la mémoire utilisée dépend de la taille d'un événement, pas de
+# celle du fichier.
+#
+# Les VTIMEZONE (référencés par les TZID= des événements) sont recopiés,
+# dédoublonnés par TZID ; ils sont écrits après les événements, ce que
+# permet la RFC 5545 (ordre des composants libre) : une seule lecture.
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import os
+import re
+import tempfile
+
+from icalendar import Event
+
+import tracing
+
+# callback(octets_lus, octets_total, nb_evenements)
+ProgressCallback = Callable[[int, int, int], None]
+
+PROGRESS_EVERY_BYTES = 1024 * 1024
+
+# {TZID: texte brut du VTIMEZONE}
+Timezones = Dict[str, bytes]
+
+_TZID = re.compile(rb"^TZID:(.+?)\r?$", re.MULTILINE)
+
+DEFAULT_HEADER = [
+    b"BEGIN:VCALENDAR",
+    b"VERSION:2.0",
+    b"PRODID:-//Home Assistant Agent//FR",
+    b"CALSCALE:GREGORIAN",
+    b"METHOD:PUBLISH",
+]
+
+
+def iter_vevent_blocks(path: str, progress: Optional[ProgressCallback] = None) -> Iterator[bytes]:
+    """
+    Parcourt un fichier ICS et retourne le texte brut de chaque VEVENT
+    (sous-composants comme VALARM inclus), un à la fois.
+    """
+    for _, raw in iter_blocks(path, progress):
+        yield raw
+
+
+def iter_blocks(
+    path: str,
+    progress: Optional[ProgressCallback] = None,
+    names: Tuple[bytes, ...] = (b"VEVENT",),
+) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    (nom, texte brut) de chaque composant de premier niveau dont le nom
+    est dans `names`, un à la fois.
+    """
+    total = os.path.getsize(path)
+    read = 0
+    next_report = PROGRESS_EVERY_BYTES
+    count = 0
+    block: List[bytes] = []
+    depth = 0
+    name = b""
+
+    with open(path, "rb") as f:
+        for line in f:
+            read += len(line)
+            stripped = line.rstrip(b"\r\n")
+            upper = stripped.upper()
+
+            if depth == 0:
+                if upper.startswith(b"BEGIN:") and upper[6:] in names:
+                    depth = 1
+                    name = upper[6:]
+                    block = [stripped]
+            else:
+                block.append(stripped)
+                if upper.startswith(b"BEGIN:"):
+                    depth += 1
+                elif upper.startswith(b"END:"):
+                    depth -= 1
+                    if depth == 0:
+                        if name == b"VEVENT":
+                            count += 1
+                        yield name, b"\r\n".join(block) + b"\r\n"
+                        block = []
+
+            if progress is not None and read >= next_report:
+                progress(read, total, count)
+                next_report = read + PROGRESS_EVERY_BYTES
+
+    if progress is not None:
+        progress(read, total, count)
+
+
+def iter_events(
+    path: str,
+    progress: Optional[ProgressCallback] = None,
+    timezones: Optional[Timezones] = None,
+) -> Iterator[Event]:
+    """
+    Retourne les VEVENT d'un fichier ICS un par un, sous forme d'objets Event.
+    Les blocs illisibles sont ignorés. Avec `timezones`, les VTIMEZONE
+    rencontrés y sont ajoutés (le premier de chaque TZID est gardé).
+    """
+    names = (b"VEVENT", b"VTIMEZONE") if timezones is not None else (b"VEVENT",)
+    for name, raw in iter_blocks(path, progress, names):
+        if name == b"VTIMEZONE":
+            match = _TZID.search(raw)
+            if match is not None:
+                timezones.setdefault(match.group(1).decode("utf-8", "replace"), raw)
+            continue
+        try:
+            yield Event.from_ical(raw)
+        except ValueError as e:
+            tracing.warning("VEVENT ignoré (illisible): %s", e)
+
+
+def write_events(
+    path: str,
+    events: Iterable[Event],
+    header: Optional[List[bytes]] = None,
+    timezones: Optional[Timezones] = None,
+) -> int:
+    """
+    Écrit un fichier ICS en consommant les événements au fil de l'eau.
+    L'écriture passe par un fichier temporaire renommé à la fin :
+    le fichier cible n'est jamais laissé à moitié écrit. `timezones` est
+    lu après les événements : il peut être rempli pendant leur lecture
+    (iter_events(..., timezones=...)).
+    Retourne le nombre d'événements écrits.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".calendar-", suffix=".ics.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for line in header or DEFAULT_HEADER:
+                f.write(line + b"\r\n")
+            for event in events:
+                f.write(event.to_ical())
+                count += 1
+            for raw in (timezones or {}).values():
+                f.write(raw)
+            f.write(b"END:VCALENDAR\r\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return count
+
+
+def merge_into(
+    dest_path: str,
+    source_path: str,
+    progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Importe les événements de source_path dans dest_path sans charger
+    aucun des deux fichiers en entier. Les UID déjà présents sont ignorés :
+    seul l'ensemble des UID (et les VTIMEZONE) est gardé en mémoire.
+    """
+    seen: Set[str] = set()
+    timezones: Timezones = {}
+    stats = {"imported": 0, "skipped": 0}
+
+    def merged() -> Iterator[Event]:
+        if os.path.exists(dest_path):
+            for event in iter_events(dest_path, timezones=timezones):
+                seen.add(str(event.get("uid", "")))
+                yield event
+        for event in iter_events(source_path, progress, timezones):
+            uid = str(event.get("uid", ""))
+            if uid and uid in seen:
+                stats["skipped"] += 1
+                continue
+            seen.add(uid)
+            stats["imported"] += 1
+            yield event
+
+    stats["total"] = write_events(dest_path, merged(), timezones=timezones)
+    return stats
+
+
+def print_progress(read: int, total: int, count: int) -> None:
+    """Callback de progression par défaut (affichage console)."""
+    percent = 100.0 * read / total if total else 100.0
+    tracing.info("Import ICS: %5.1f%% (%d Ko, %d événements)", percent, read // 1024, count)
@@ -0,0 +1,160 @@
+# =========================
+# Historique de conversation borné en tokens
+# =========================
+#
+# Chaque session garde ses derniers échanges (message utilisateur, réponse)
+# tant qu'ils tiennent dans HISTORY_TOKENS. Au-delà, les plus anciens sont
+# repliés dans un résumé glissant, calculé en arrière-plan (appel LLM en
+# priorité BACKGROUND) : le tour en cours n'attend jamais le résumé. En
+# attendant qu'il arrive, les échanges à replier restent dans la fenêtre ;
+# au pire la fenêtre atteint MAX_HISTORY_TOKENS, les plus anciens échanges
+# sont alors oubliés. La taille du prompt reste bornée quelle que soit la
+# durée de la session.
+#
+# Les tokens sont comptés par prompt_budget.count_tokens().
+
+from typing import Dict, List, Optional, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_pool import session_scope
+from llm_scheduler import BACKGROUND
+from prompt_budget import count_tokens
+import tracing
+
+HISTORY_TOKENS = 512          # échanges gardés mot pour mot
+MAX_HISTORY_TOKENS = 1024     # borne dure (résumé en retard ou en échec)
+SUMMARY_TOKENS = 160          # taille max du résumé
+SUMMARY_WORKERS = 2
+
+# Un seul verrou pour toutes les sessions : il ne protège que des échanges
+# de listes (le résumé lui-même est calculé hors verrou)
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _summary_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+        return _executor
+
+
+SUMMARY_SYSTEM_PROMPT = """
+Tu résumes une conversation entre un utilisateur et son assistant.
+Tu reçois le résumé précédent (peut être vide) et les nouveaux échanges.
+Produis un résumé unique, en français, de quelques phrases au plus :
+garde les faits utiles pour la suite (noms, dates, préférences, demandes
+en cours, ce qui a été fait), oublie les politesses.
+Réponds uniquement avec le résumé, sans introduction.
+"""
+
+
+class ConversationMemory:
+    """
+    Derniers échanges d'une session + résumé des plus anciens.
+    """
+
+    __slots__ = ("turns", "summary", "tokens", "folding")
+
+    def __init__(self, turns: Optional[List[Tuple[str, str]]] = None, summary: str = ""):
+        # (message utilisateur, réponse, tokens)
+        self.turns: List[Tuple[str, str, int]] = []
+        self.summary: str = summary
+        self.tokens = 0
+        self.folding = False
+        for user, assistant in turns or ():
+            self._append(user, assistant)
+
+    def _append(self, user: str, assistant: str) -> None:
+        tokens = count_tokens(user) + count_tokens(assistant)
+        self.turns.append((user, assistant, tokens))
+        self.tokens += tokens
+
+    # --- Lecture ---
+
+    def messages(self, last: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Historique au format chat (à passer en `history` à send_llama_chat) :
+        résumé éventuel puis échanges, du plus ancien au plus récent.
+        `last` : seulement les N derniers échanges, sans résumé.
+        """
+        with _lock:
+            turns = self.turns if last is None else self.turns[-last:] if last > 0 else []
+            summary = self.summary if last is None else ""
+            messages: List[Dict[str, str]] = []
+            if summary:
+                # Paire user/assistant plutôt qu'un 2e message système :
+                # certains templates de chat le refusent
+                messages.append({"role": "user", "content": f"(Résumé de notre conversation jusqu'ici : {summary})"})
+                messages.append({"role": "assistant", "content": "D'accord."})
+            for user, assistant, _ in turns:
+                messages.append({"role": "user", "content": user})
+                messages.append({"role": "assistant", "content": assistant})
+            return messages
+
+    def snapshot(self) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        with _lock:
+            return self.summary, tuple((user, assistant) for user, assistant, _ in self.turns)
+
+    # --- Écriture ---
+
+    def add(self, user: str, assistant: str, session_id: Optional[str] = None) -> None:
+        """Ajoute un échange ; lance un résumé en arrière-plan si la fenêtre déborde."""
+        with _lock:
+            self._append(user, assistant)
+            # Borne dure : le résumé n'a pas suivi, on oublie les plus anciens
+            while self.tokens > MAX_HISTORY_TOKENS and len(self.turns) > 1:
+                self.tokens -= self.turns.pop(0)[2]
+            if self.tokens <= HISTORY_TOKENS or self.folding:
+                return
+            # On replie les plus anciens jusqu'à revenir à la moitié du budget
+            folded, kept = [], self.tokens
+            for turn in self.turns[:-1]:
+                if kept <= HISTORY_TOKENS // 2:
+                    break
+                folded.append(turn)
+                kept -= turn[2]
+            if not folded:
+                return
+            self.folding = True
+            summary = self.summary
+        _summary_executor().submit(self._fold, summary, folded, session_id)
+
+    def clear(self) -> None:
+        with _lock:
+            self.turns = []
+            self.summary = ""
+            self.tokens = 0
+
+    def _fold(self, summary: str, folded: List[Tuple[str, str, int]], session_id: Optional[str]) -> None:
+        from agent import send_llama_chat
+
+        exchanges = "\n".join(f"Utilisateur : {user}\nAssistant : {assistant}" for user, assistant, _ in folded)
+        try:
+            with session_scope(session_id):
+                new_summary = send_llama_chat(
+                    system_prompt=SUMMARY_SYSTEM_PROMPT,
+                    user_content=f"Résumé précédent : {summary or '(aucun)'}\n\nNouveaux échanges :\n{exchanges}",
+                    temperature=0.3,
+                    max_tokens=SUMMARY_TOKENS,
+                    verbose=False,
+                    priority=BACKGROUND,
+                ).strip()
+        except Exception as e:
+            # On réessaiera au prochain échange ; la borne dure protège le prompt
+            tracing.warning("Résumé de conversation impossible: %s", e)
+            with _lock:
+                self.folding = False
+            return
+
+        with _lock:
+            self.folding = False
+            if not new_summary:
+                return
+            self.summary = new_summary
+            # Échanges repliés encore présents (la borne dure a pu en retirer)
+            gone = {id(turn) for turn in folded}
+            self.turns = [turn for turn in self.turns if id(turn) not in gone]
+            self.tokens = sum(turn[2] for turn in self.turns)
@@ -0,0 +1,81 @@
+# =========================
+# Budget de temps d'un tour de conversation
+# =========================
+#
+# handle_user_message ouvre un deadline_scope : l'échéance du tour est
+# portée par une ContextVar, donc visible sans paramètre supplémentaire
+# par send_llama_chat (qui borne son timeout au temps restant) et par les
+# handlers des skills (qui peuvent s'arrêter proprement avant l'échéance).
+# Un tour de 4 appels ne peut plus durer 4 x 60 s : il dure au plus
+# TURN_BUDGET secondes.
+
+from typing import Optional
+import contextvars
+import time
+from contextlib import contextmanager
+
+TURN_BUDGET = 45.0      # secondes par message utilisateur
+LLM_TIMEOUT = 60.0      # plafond d'un appel LLM isolé (hors tour)
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("turn_deadline", default=None)
+
+
+class DeadlineExceeded(RuntimeError):
+    """Le budget de temps du tour est épuisé."""
+
+
+@contextmanager
+def deadline_scope(budget: Optional[float]):
+    """
+    Fixe l'échéance du bloc à maintenant + budget secondes (None : pas de
+    limite). Un scope imbriqué ne peut que raccourcir l'échéance englobante.
+    """
+    deadline = _deadline.get()
+    if budget is not None:
+        own = time.monotonic() + budget
+        deadline = own if deadline is None else min(deadline, own)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def detached_scope(budget: Optional[float]):
+    """
+    Comme deadline_scope, mais remplace l'échéance englobante au lieu de la
+    raccourcir : pour un traitement qui peut continuer après la fin du tour
+    (handler passé en arrière-plan, voir skill_executor.py).
+    """
+    token = _deadline.set(None if budget is None else time.monotonic() + budget)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance, ou None s'il n'y en a pas."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(cap: float = LLM_TIMEOUT) -> float:
+    """
+    Timeout à donner à une opération bloquante : le plafond `cap`, réduit au
+    temps restant du tour. Lève DeadlineExceeded si le budget est épuisé.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("Budget de temps du tour épuisé")
+    return min(cap, left)
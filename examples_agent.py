@@ -3,25 +3,22 @@
 # Multi-Skill Agent Principal
 # =========================
 
+import threading
+from typing import List
+
 from agent import MultiSkillAgent, Skill
+from skill_executor import get_skill_executor
 
-# Importer les skills depuis le dossier agent_skills
-from agent_skills.audio_skill import create_audio_skill
-from agent_skills.file_skill import create_file_skill
-from agent_skills.calendar_skill_ics import create_calendar_skill
-from agent_skills.email_skill import create_email_skill
+# Les skills du dossier agent_skills sont découverts sans être importés :
+# leurs dépendances (pygame, icalendar...) se chargent au premier usage
+from skill_registry import discover_skills
 
 # =========================
 # Construction de l'agent
 # =========================
 
-def build_agent() -> MultiSkillAgent:
-    # Créer les skills en utilisant les fonctions importées
-    audio_skill = create_audio_skill()
-    file_skill = create_file_skill()
-    calendar_skill = create_calendar_skill()
-    email_skill = create_email_skill()
-
+def build_skills() -> List[Skill]:
+    """Skills de l'application (partagés par toutes les sessions d'un processus)."""
     # Skill smalltalk (pas de slots)
     smalltalk_skill = Skill(
         name="smalltalk",
@@ -34,7 +31,20 @@ Réponds naturellement en français, de façon sympathique et concise.
         on_ready=None,
     )
 
-    return MultiSkillAgent([audio_skill, file_skill, calendar_skill, email_skill, smalltalk_skill])
+    return [*discover_skills(), smalltalk_skill]
+
+
+def build_agent(warmup: bool = False) -> MultiSkillAgent:
+    return MultiSkillAgent(build_skills(), warmup=warmup)
+
+
+def start_reminders() -> None:
+    """Charge le calendrier et démarre les rappels (hors du chemin de démarrage)."""
+    from agent_skills.calendar_skill_ics import get_reminder_scheduler
+
+    get_reminder_scheduler().subscribe(
+        "cli", lambda message, details: print(f"\nAssistant (rappel): {message}")
+    )
 
 
 # =========================
@@ -42,7 +52,16 @@ Réponds naturellement en français, de façon sympathique et concise.
 # =========================
 
 def main():
-    agent = build_agent()
+    # Vérifie le serveur et préchauffe son cache avant le premier message
+    agent = build_agent(warmup=True)
+
+    # Rappels du calendrier : affichés dès qu'ils se déclenchent
+    threading.Thread(target=start_reminders, name="reminders-startup", daemon=True).start()
+    # Tâches longues terminées en arrière-plan : affichées dès qu'elles finissent
+    get_skill_executor().subscribe(
+        agent.session_id, "cli", lambda message, details: print(f"\nAssistant (tâche terminée): {message}")
+    )
+
     print("Assistant: Salut !")
     print("Tu peux me demander de jouer un audio, créer un fichier, gérer ton calendrier, consulter tes emails ou juste discuter.")
     print("Tape 'quit' pour arrêter, ou 'reset' pour annuler une demande en cours.\n")
@@ -0,0 +1,143 @@
+# =========================
+# Lecture en streaming des réponses JSON
+# =========================
+#
+# Pour le routage et l'extraction, le modèle répond un objet JSON qui est
+# en général complet après quelques dizaines de tokens ; sans streaming on
+# attend quand même la fin de la génération (texte après l'objet, fences,
+# max_tokens). Ici la réponse est lue en streaming (SSE de llama-server)
+# et la requête est coupée dès que le premier objet JSON est équilibré :
+# fermer la connexion fait abandonner la génération au serveur.
+#
+# Le lecteur suit les accolades hors chaînes (guillemets et échappements
+# compris) et ignore un éventuel bloc <think>...</think> en tête.
+
+from typing import Any, Dict, Optional
+import json
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class JsonObjectReader:
+    """
+    Détecte, morceau par morceau, la fin du premier objet JSON d'un texte.
+    `feed()` retourne True dès que l'objet est complet ; `text` contient
+    alors tout ce qui a été reçu.
+    """
+
+    __slots__ = ("text", "done", "_pos", "_depth", "_in_string", "_escape", "_started")
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0            # prochain caractère à examiner
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+
+    def _start(self) -> Optional[int]:
+        """Position de la première accolade, après le bloc de réflexion éventuel."""
+        begin = 0
+        think = self.text.find(THINK_OPEN)
+        if think != -1:
+            close = self.text.find(THINK_CLOSE, think)
+            if close == -1:
+                return None  # réflexion en cours
+            begin = close + len(THINK_CLOSE)
+        brace = self.text.find("{", begin)
+        return None if brace == -1 else brace
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self.text += chunk
+        if not self._started:
+            start = self._start()
+            if start is None:
+                return False
+            self._started = True
+            self._pos = start
+
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    return True
+        self._pos = len(text)
+        return False
+
+
+def read_chat_stream(response: Any, stop_at_json: bool = True) -> bytes:
+    """
+    Lit une réponse /v1/chat/completions en streaming (lignes "data: ...")
+    et retourne l'équivalent non streamé ({"choices": [{"message": ...}]}),
+    pour que l'appelant la traite comme une réponse normale.
+    `stop_at_json` : arrête la lecture dès que le premier objet JSON du
+    contenu est complet (l'appelant ferme alors la connexion).
+    Le champ `usage` (dernier morceau, avec stream_options.include_usage)
+    est repris s'il a été lu : jamais quand la lecture s'arrête à la fin
+    de l'objet JSON, les tokens de l'appel sont alors estimés.
+    """
+    reader = JsonObjectReader()
+    parts = []
+    finish_reason = None
+    usage = None
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+            usage = chunk.get("usage") or usage
+            choice = chunk["choices"][0]
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            continue
+        delta = (choice.get("delta") or {}).get("content") or ""
+        finish_reason = choice.get("finish_reason") or finish_reason
+        parts.append(delta)
+        if stop_at_json and reader.feed(delta):
+            finish_reason = "json"
+            break
+    result: Dict[str, Any] = {
+        "choices": [{
+            "message": {"role": "assistant", "content": "".join(parts)},
+            "finish_reason": finish_reason,
+        }],
+    }
+    if usage:
+        result["usage"] = usage
+    return json.dumps(result).encode("utf-8")
+
+
+# =========================
+# Démonstration
+# =========================
+
+if __name__ == "__main__":
+    reader = JsonObjectReader()
+    chunks = ["<think>\n", "{pas ça}", "</think>\n```json\n", '{"slots": {"note": "a } dans', ' une \\"chaîne\\""', "}}", "\n```\nDe plus..."]
+    for chunk in chunks:
+        complete = reader.feed(chunk)
+        print(f"{chunk!r:40} -> {'complet' if complete else '...'}")
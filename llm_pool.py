@@ -0,0 +1,610 @@
+# =========================
+# Pool de serveurs LLM (répartition de charge + bascule)
+# =========================
+#
+# send_llama_chat ne parle plus à UNE URL mais à un pool de llama-server :
+#   - répartition : on choisit le serveur qui a le moins de requêtes en
+#     cours (least outstanding requests) ;
+#   - affinité de session : une session reste sur le même serveur tant
+#     qu'il n'est pas nettement plus chargé que les autres, pour réutiliser
+#     le préfixe déjà présent dans son cache KV ;
+#   - disjoncteur : après FAILURE_THRESHOLD échecs consécutifs (connexion,
+#     timeout, HTTP 5xx), le serveur est éjecté pendant EJECTION_TIME
+#     (doublé à chaque récidive). À l'expiration, une seule requête d'essai
+#     passe (semi-ouvert) : succès -> réadmis, échec -> éjecté plus longtemps ;
+#   - sondes de santé : un thread interroge /health en tâche de fond, ce qui
+#     éjecte un serveur tombé avant qu'un utilisateur ne le découvre et
+#     réadmet plus tôt un serveur revenu.
+# Une requête qui échoue est rejouée sur un autre serveur du pool.
+# Doublons (hedging) : si une requête dépasse le p95 des latences récentes,
+# un doublon part vers un autre serveur ; la première réponse gagne et
+# l'autre requête est annulée en fermant sa socket. Sous un slot() du
+# scheduler, le doublon prend une place de plus, seulement si elle est
+# libre tout de suite : pas de doublon quand les serveurs sont saturés.
+# Requêtes "stream" : la réponse est lue en streaming et la connexion fermée
+# dès que l'objet JSON attendu est complet (json_stream.py).
+#
+# La session courante est portée par une ContextVar (session_scope) : pas
+# besoin de la passer à chaque appel de send_llama_chat.
+
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+import contextvars
+import http.client
+import json
+import queue
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import tracing
+from json_stream import read_chat_stream
+from llm_scheduler import current_slot
+
+FAILURE_THRESHOLD = 3       # échecs consécutifs avant éjection
+EJECTION_TIME = 5.0         # première éjection (secondes), doublée à chaque récidive
+MAX_EJECTION_TIME = 60.0
+HEALTH_INTERVAL = 5.0       # période des sondes /health
+HEALTH_TIMEOUT = 2.0
+AFFINITY_SLACK = 2          # requêtes en cours tolérées en plus pour rester sur son serveur
+MAX_AFFINITY = 10000        # sessions mémorisées (LRU)
+LATENCY_ALPHA = 0.2         # lissage de la latence moyenne affichée dans stats()
+HEDGING = True              # doublon vers un 2e serveur quand le p95 est dépassé
+HEDGE_MIN_SAMPLES = 20      # latences observées avant d'activer les doublons
+LATENCY_WINDOW = 200
+
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_session", default=None)
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]):
+    """Associe les appels LLM du bloc à une session (affinité de serveur)."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> Optional[str]:
+    return _session.get()
+
+
+def base_url(url: str) -> str:
+    """'http://localhost:8080/v1/chat/completions' -> 'http://localhost:8080'"""
+    for suffix in ("/v1/chat/completions", "/chat/completions"):
+        if url.endswith(suffix):
+            return url[: -len(suffix)]
+    return url.rstrip("/")
+
+
+class Backend:
+    """Un llama-server du pool et l'état de son disjoncteur."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.base_url = base_url(url)
+        self.outstanding = 0
+        self.failures = 0           # échecs consécutifs
+        self.ejections = 0          # éjections consécutives (backoff)
+        self.ejected_until = 0.0    # 0 = circuit fermé
+        self.trial = False          # requête d'essai en cours (semi-ouvert)
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0             # doublons reçus
+        self.latency: Optional[float] = None
+
+    def state(self, now: float) -> str:
+        if not self.ejected_until:
+            return "closed"
+        return "open" if now < self.ejected_until else "half-open"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half-open" and not self.trial)
+
+    def eject(self, now: float) -> None:
+        self.ejections += 1
+        delay = min(EJECTION_TIME * 2 ** (self.ejections - 1), MAX_EJECTION_TIME)
+        self.ejected_until = now + delay
+        self.trial = False
+        tracing.warning("[pool] %s éjecté pour %.0f s", self.base_url, delay)
+
+    def readmit(self) -> None:
+        if self.ejected_until:
+            tracing.info("[pool] %s réadmis", self.base_url)
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.trial = False
+
+
+class _ClientError(str):
+    """Erreur 4xx / réponse illisible : pas de bascule ni de pénalité pour le serveur."""
+
+
+class _Call:
+    """Une requête POST vers un serveur, annulable depuis un autre thread."""
+
+    def __init__(self, backend: Backend, body: bytes, stream: bool = False):
+        self.backend = backend
+        self.body = body
+        self.stream = stream
+        self.started = time.monotonic()
+        self.cancelled = False
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def run(self, timeout: float):
+        parts = urlsplit(self.backend.url)
+        conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            if self.cancelled:
+                raise ConnectionAbortedError("requête annulée")
+            self._conn = conn_class(parts.netloc, timeout=timeout)
+        try:
+            self._conn.request("POST", parts.path or "/", body=self.body,
+                               headers={"Content-Type": "application/json"})
+            response = self._conn.getresponse()
+            if self.stream and response.status == 200 and "event-stream" in (response.getheader("Content-Type") or ""):
+                # Connexion fermée (finally) dès l'objet JSON complet
+                return response.status, read_chat_stream(response)
+            return response.status, response.read()
+        finally:
+            self._conn.close()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            conn = self._conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class LLMPool:
+    """
+    Pool de llama-server avec répartition de charge, affinité et bascule.
+    """
+
+    def __init__(self, urls: List[str], health_interval: float = HEALTH_INTERVAL, hedging: bool = HEDGING):
+        if not urls:
+            raise ValueError("Le pool LLM doit contenir au moins un serveur")
+        self.backends: List[Backend] = [Backend(url) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._affinity: "OrderedDict[str, Backend]" = OrderedDict()
+        self.hedging = hedging
+        # Latences récentes par max_tokens (une requête d'un token et une
+        # synthèse de 512 tokens n'ont pas le même p95)
+        self._latencies: Dict[Any, Deque[float]] = {}
+        self._health_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def urls(self) -> List[str]:
+        return [b.url for b in self.backends]
+
+    # --- Appel ---
+
+    def post(
+        self,
+        payload: Dict[str, Any],
+        timeout: float = 60,
+        session_id: Optional[str] = None,
+        only: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Envoie la requête au meilleur serveur, puis aux autres en cas d'échec.
+        `timeout` borne la durée totale, bascules et doublon compris.
+        `only` force un serveur précis (préchauffage), sans bascule ni doublon.
+        Lève RuntimeError si aucun serveur n'a pu répondre.
+        """
+        self._ensure_health_thread()
+        if session_id is None:
+            session_id = current_session()
+
+        body = json.dumps(payload).encode("utf-8")
+        stream = bool(payload.get("stream"))
+        latency_key = payload.get("max_tokens")
+        deadline = time.monotonic() + timeout
+        tried: Set[Backend] = set()
+        last_error: Any = "aucun serveur disponible"
+
+        for _ in range(len(self.backends)):
+            if time.monotonic() >= deadline:
+                last_error = f"délai de {timeout:.0f} s dépassé"
+                break
+            backend = self._acquire(session_id, tried, only)
+            if backend is None:
+                break
+            tried.add(backend)
+            hedge_after = self._hedge_delay(latency_key) if only is None else None
+
+            ok, result = self._call_hedged(backend, body, deadline, hedge_after, session_id, tried, latency_key, stream)
+            if ok:
+                return result
+            last_error = result
+            if isinstance(result, _ClientError):
+                break  # 4xx : la requête elle-même est en cause, inutile de rejouer
+
+        raise RuntimeError(f"Erreur lors de l'appel à llama-server: {last_error}")
+
+    # --- Doublon (hedging) ---
+
+    def _hedge_delay(self, latency_key: Any) -> Optional[float]:
+        """p95 des latences récentes pour ce type de requête, ou None (pas de doublon)."""
+        if not self.hedging or len(self.backends) < 2:
+            return None
+        with self._lock:
+            samples = self._latencies.get(latency_key)
+            if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _call_hedged(
+        self,
+        backend: Backend,
+        body: bytes,
+        deadline: float,
+        hedge_after: Optional[float],
+        session_id: Optional[str],
+        tried: Set[Backend],
+        latency_key: Any,
+        stream: bool = False,
+    ):
+        """
+        Lance la requête ; si elle n'a pas répondu après le p95, envoie un
+        doublon à un autre serveur. La première réponse valide gagne, l'autre
+        requête est annulée (socket fermée : llama-server abandonne la
+        génération). Retourne (True, données) ou (False, erreur).
+        """
+        results: "queue.Queue" = queue.Queue()
+        calls = [self._start_call(backend, body, deadline, results, latency_key, stream)]
+        hedged = hedge_after is None
+        last_error: Any = None
+
+        while True:
+            now = time.monotonic()
+            wait = deadline - now
+            if not hedged:
+                wait = min(wait, calls[0].started + hedge_after - now)
+            try:
+                call, ok, result = results.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    for c in calls:
+                        c.cancel()
+                    return False, f"délai dépassé sur {backend.base_url}"
+                hedged = True
+                held = current_slot()
+                if held is not None and not held[0].try_acquire(held[1]):
+                    continue  # scheduler plein : un doublon ferait attendre les autres
+                on_done = (lambda: held[0].release(held[1])) if held is not None else None
+                other = self._acquire(session_id, tried, None)
+                if other is None:
+                    if on_done is not None:
+                        on_done()
+                    continue
+                tried.add(other)
+                with self._lock:
+                    other.hedges += 1
+                calls.append(self._start_call(other, body, deadline, results, latency_key, stream, on_done))
+                continue
+
+            calls.remove(call)
+            if ok:
+                for c in calls:
+                    c.cancel()
+                if session_id and call.backend is not backend:
+                    self._set_affinity(session_id, call.backend)
+                return True, result
+            last_error = result
+            if not calls:
+                return False, last_error
+            hedged = True  # le doublon déjà parti prend le relais
+
+    def _start_call(
+        self, backend: Backend, body: bytes, deadline: float, results: "queue.Queue", latency_key: Any, stream: bool = False,
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> "_Call":
+        """Requête dans un thread ; on_done() est appelé à sa fin (place du doublon)."""
+        call = _Call(backend, body, stream)
+
+        def run() -> None:
+            try:
+                status, data = call.run(max(0.001, deadline - time.monotonic()))
+            except (OSError, http.client.HTTPException) as e:
+                if call.cancelled:
+                    self._release(backend, outcome="cancelled")
+                else:
+                    self._release(backend, outcome="failure")
+                    results.put((call, False, e))
+                return
+            if status >= 500:
+                self._release(backend, outcome="failure")
+                results.put((call, False, f"HTTP {status} sur {backend.base_url}"))
+                return
+
+            self._release(backend, outcome="success", latency=time.monotonic() - call.started, latency_key=latency_key)
+            if status >= 400:
+                results.put((call, False, _ClientError(f"HTTP {status}: {data[:200]!r}")))
+                return
+            try:
+                results.put((call, True, json.loads(data)))
+            except ValueError as e:
+                results.put((call, False, _ClientError(f"réponse non JSON: {e}")))
+
+        def run_then_release() -> None:
+            try:
+                run()
+            finally:
+                on_done()
+
+        threading.Thread(target=run if on_done is None else run_then_release, name="llm-call", daemon=True).start()
+        return call
+
+    def _acquire(self, session_id: Optional[str], exclude: Set[Backend], only: Optional[str]) -> Optional[Backend]:
+        with self._lock:
+            now = time.monotonic()
+            pool = [b for b in self.backends if b not in exclude and (only is None or b.url == only)]
+            if not pool:
+                return None
+            candidates = [b for b in pool if b.available(now)]
+            if not candidates:
+                if exclude:
+                    return None
+                # Tous éjectés : on tente celui qui revient le plus tôt plutôt que d'échouer sans essayer
+                candidates = [min(pool, key=lambda b: b.ejected_until)]
+
+            least = min(b.outstanding for b in candidates)
+            preferred = self._affinity.get(session_id) if session_id else None
+            if preferred in candidates and preferred.outstanding <= least + AFFINITY_SLACK:
+                chosen = preferred
+            else:
+                chosen = random.choice([b for b in candidates if b.outstanding == least])
+
+            if chosen.state(now) == "half-open":
+                chosen.trial = True
+            chosen.outstanding += 1
+            chosen.requests += 1
+
+            if session_id and only is None:
+                self._remember(session_id, chosen)
+            return chosen
+
+    def _set_affinity(self, session_id: str, backend: Backend) -> None:
+        with self._lock:
+            self._remember(session_id, backend)
+
+    def _remember(self, session_id: str, backend: Backend) -> None:
+        self._affinity[session_id] = backend
+        self._affinity.move_to_end(session_id)
+        if len(self._affinity) > MAX_AFFINITY:
+            self._affinity.popitem(last=False)
+
+    def _release(self, backend: Backend, outcome: str, latency: Optional[float] = None, latency_key: Any = None) -> None:
+        """outcome : "success", "failure", ou "cancelled" (perdant d'un doublon, neutre)."""
+        with self._lock:
+            backend.outstanding -= 1
+            if outcome == "success":
+                if latency is not None:
+                    backend.latency = latency if backend.latency is None else (
+                        (1 - LATENCY_ALPHA) * backend.latency + LATENCY_ALPHA * latency
+                    )
+                    samples = self._latencies.get(latency_key)
+                    if samples is None:
+                        samples = self._latencies[latency_key] = deque(maxlen=LATENCY_WINDOW)
+                    samples.append(latency)
+                backend.readmit()
+            elif outcome == "failure":
+                self._record_failure(backend, time.monotonic())
+            elif backend.trial:
+                backend.trial = False  # l'essai n'a pas abouti : un autre pourra le refaire
+
+    def _record_failure(self, backend: Backend, now: float) -> None:
+        backend.errors += 1
+        backend.failures += 1
+        if backend.trial or backend.failures >= FAILURE_THRESHOLD:
+            backend.eject(now)
+
+    # --- Sondes de santé ---
+
+    def check_health(self) -> None:
+        """Interroge /health sur chaque serveur et met à jour les disjoncteurs."""
+        for backend in self.backends:
+            parts = urlsplit(backend.base_url)
+            conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(parts.netloc, timeout=HEALTH_TIMEOUT)
+            try:
+                conn.request("GET", parts.path + "/health")
+                healthy = conn.getresponse().status == 200
+            except (OSError, http.client.HTTPException):
+                healthy = False
+            finally:
+                conn.close()
+            with self._lock:
+                now = time.monotonic()
+                state = backend.state(now)
+                if healthy and state != "closed" and not backend.trial:
+                    # De retour : la prochaine vraie requête sert d'essai
+                    backend.ejected_until = now
+                elif not healthy and state == "closed":
+                    self._record_failure(backend, now)
+                elif not healthy and state == "half-open" and not backend.trial:
+                    backend.eject(now)
+
+    def _ensure_health_thread(self) -> None:
+        if self._health_thread is not None or len(self.backends) < 2:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="llm-pool-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self) -> None:
+        while not self._stopped.wait(self.health_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                tracing.error("Erreur lors des sondes de santé du pool: %s", e)
+
+    def close(self) -> None:
+        self._stopped.set()
+
+    # --- Observabilité ---
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "url": b.base_url,
+                    "state": b.state(now),
+                    "outstanding": b.outstanding,
+                    "requests": b.requests,
+                    "errors": b.errors,
+                    "hedges": b.hedges,
+                    "latency_ms": round(b.latency * 1000) if b.latency is not None else None,
+                    "sessions": sum(1 for v in self._affinity.values() if v is b),
+                }
+                for b in self.backends
+            ]
+
+
+_pool: Optional[LLMPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_llm_pool(urls: List[str]) -> LLMPool:
+    """Pool partagé par le processus, recréé si la liste des serveurs change."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.urls != list(urls):
+            if _pool is not None:
+                _pool.close()
+            _pool = LLMPool(list(urls))
+        return _pool
+
+
+# =========================
+# Démonstration sur des serveurs factices
+# =========================
+#
+# python llm_pool.py
+#
+# Lance trois faux llama-server locaux (un rapide, un lent, un qui tombe
+# puis revient) et montre la répartition, l'affinité, l'éjection et la
+# réadmission ; puis compare la latence de queue avec et sans doublons.
+
+def _start_stub_server(delay: float, stall: float = 0.0):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"up": True}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, code: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode()
+            try:
+                self.send_response(code)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except OSError:
+                pass  # requête annulée par le client (doublon perdant)
+
+        def do_GET(self):
+            self._reply(200 if state["up"] else 503, {"status": "ok" if state["up"] else "down"})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not state["up"]:
+                self._reply(503, {"error": "down"})
+                return
+            # `stall` : proportion de requêtes anormalement lentes (queue de latence)
+            time.sleep(0.5 if random.random() < stall else delay)
+            self._reply(200, {"choices": [{"message": {"content": "ok"}}]})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions", state
+
+
+def demo() -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    global EJECTION_TIME
+    EJECTION_TIME = 1.0
+
+    (fast, _), (slow, _), (flaky, flaky_state) = (
+        _start_stub_server(0.02), _start_stub_server(0.2), _start_stub_server(0.02),
+    )
+    pool = LLMPool([fast, slow, flaky], health_interval=0.5)
+    payload = {"messages": [], "max_tokens": 1}
+
+    def burst(n: int, sessions: int) -> None:
+        def call(i: int) -> None:
+            with session_scope(f"s{i % sessions}"):
+                pool.post(payload, timeout=5)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(call, range(n)))
+
+    def show(title: str) -> None:
+        print(f"\n{title}")
+        for s in pool.stats():
+            print(f"  {s['url']:<24} {s['state']:<9} requêtes={s['requests']:<4} "
+                  f"erreurs={s['errors']:<3} latence={s['latency_ms']} ms sessions={s['sessions']}")
+
+    burst(120, sessions=30)
+    show("1) 120 requêtes, 30 sessions : le serveur lent reçoit moins de requêtes")
+
+    flaky_state["up"] = False
+    burst(60, sessions=30)
+    show("2) Le 3e serveur tombe : éjecté, ses requêtes basculent sans erreur côté appelant")
+
+    flaky_state["up"] = True
+    time.sleep(1.5)
+    burst(60, sessions=30)
+    show("3) Il revient : réadmis après sonde de santé + requête d'essai")
+
+    with session_scope("fidele"):
+        seen = set()
+        for _ in range(10):
+            pool.post(payload, timeout=5)
+            seen.add(pool._affinity["fidele"].base_url)
+    print(f"\n4) Affinité : 10 requêtes séquentielles d'une session -> {len(seen)} serveur(s)")
+    pool.close()
+
+    # 5) Deux serveurs dont 3 % des réponses traînent 500 ms
+    stalling = [_start_stub_server(0.02, stall=0.03)[0] for _ in range(2)]
+    print("\n5) Doublons après le p95 (2 serveurs, 3 % de réponses à 500 ms)")
+    for hedging in (False, True):
+        pool = LLMPool(stalling, hedging=hedging)
+        latencies = []
+
+        def timed(_: int) -> None:
+            start = time.perf_counter()
+            pool.post(payload, timeout=5)
+            latencies.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(timed, range(300)))
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        hedges = sum(b["hedges"] for b in pool.stats())
+        print(f"  doublons {'activés  ' if hedging else 'désactivés'} : p50={p50:.0f} ms  p99={p99:.0f} ms  ({hedges} doublons)")
+        pool.close()
+
+
+if __name__ == "__main__":
+    demo()
@@ -0,0 +1,333 @@
+# =========================
+# Ordonnancement des appels LLM par priorité
+# =========================
+#
+# llama-server n'a que quelques slots parallèles (-np) et ne préempte pas
+# une génération en cours. Sans ordonnancement, une rafale de synthèses
+# d'emails occupe tous les slots et le routage du message suivant attend
+# derrière. Le scheduler limite donc le nombre d'appels en vol côté client :
+#   - deux classes : "interactive" (routage, extraction, réponses) et
+#     "background" (synthèses en masse, résumés, préchauffage) ;
+#   - RESERVED_INTERACTIVE slots ne sont jamais donnés au background : un
+#     appel interactif trouve toujours une place sans attendre la fin d'une
+#     longue génération ;
+#   - quand une place se libère, l'interactif passe avant le background ;
+#   - dans une classe, les sessions sont servies à tour de rôle (une
+#     session qui envoie 20 synthèses n'affame pas les autres) ;
+#   - files bornées par classe + timeout : au-delà, l'appel est refusé
+#     tout de suite (Overloaded) plutôt que d'attendre indéfiniment ;
+#   - un doublon (hedging, llm_pool.py) prend lui aussi une place, mais
+#     seulement si elle est libre tout de suite (try_acquire) : sinon pas
+#     de doublon, la capacité n'est jamais dépassée.
+
+from typing import Any, Deque, Dict, Optional, Tuple
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+SLOTS_PER_BACKEND = 4        # capacité supposée tant que /props n'a pas été lu
+RESERVED_INTERACTIVE = 1     # slots jamais occupés par le background
+QUEUE_LIMITS = {INTERACTIVE: 64, BACKGROUND: 32}
+
+
+# Place détenue par le bloc slot() en cours : (scheduler, priorité)
+_held: contextvars.ContextVar[Optional[Tuple["LLMScheduler", str]]] = contextvars.ContextVar(
+    "llm_slot", default=None
+)
+
+
+class Overloaded(RuntimeError):
+    """File d'attente pleine, ou attente trop longue : l'appel LLM est refusé."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "session", "enqueued", "granted")
+
+    def __init__(self, priority: str, session: str):
+        self.priority = priority
+        self.session = session
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class LLMScheduler:
+    """
+    Limite les appels LLM en vol et choisit qui passe quand une place se libère.
+    """
+
+    def __init__(
+        self,
+        capacity: int = SLOTS_PER_BACKEND,
+        reserved_interactive: int = RESERVED_INTERACTIVE,
+        queue_limits: Optional[Dict[str, int]] = None,
+    ):
+        self._cond = threading.Condition()
+        self.capacity = max(1, capacity)
+        self.reserved_interactive = reserved_interactive
+        self.queue_limits = dict(QUEUE_LIMITS if queue_limits is None else queue_limits)
+
+        self._running = {p: 0 for p in PRIORITIES}
+        # Par classe : une file par session + ordre de passage des sessions
+        self._queues: Dict[str, Dict[str, Deque[_Waiter]]] = {p: {} for p in PRIORITIES}
+        self._rotation: Dict[str, Deque[str]] = {p: deque() for p in PRIORITIES}
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._rejected = {p: 0 for p in PRIORITIES}
+        self._wait_total = {p: 0.0 for p in PRIORITIES}
+        self._served = {p: 0 for p in PRIORITIES}
+
+    def set_capacity(self, capacity: int) -> None:
+        """Ajuste la capacité (ex : somme des slots lus dans /props)."""
+        with self._cond:
+            self.capacity = max(1, capacity)
+            self._dispatch()
+
+    # --- Acquisition ---
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, session: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        Bloc exécuté avec une place LLM réservée.
+        Lève Overloaded si la file est pleine ou si l'attente dépasse `timeout`.
+        """
+        self.acquire(priority, session, timeout)
+        token = _held.set((self, priority))
+        try:
+            yield
+        finally:
+            _held.reset(token)
+            self.release(priority)
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> bool:
+        """
+        Prend une place seulement si elle est libre tout de suite et que
+        personne de prioritaire n'attend. Ne met jamais en file.
+        """
+        with self._cond:
+            ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+            if any(self._queued[p] for p in ahead) or not self._has_room(priority):
+                return False
+            self._running[priority] += 1
+            return True
+
+    def acquire(self, priority: str = INTERACTIVE, session: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité inconnue: {priority}")
+        session = session or ""
+
+        with self._cond:
+            if self._queued[priority] == 0 and self._has_room(priority):
+                self._running[priority] += 1
+                self._served[priority] += 1
+                return
+
+            if self._queued[priority] >= self.queue_limits.get(priority, 0):
+                self._rejected[priority] += 1
+                raise Overloaded(f"File LLM '{priority}' pleine ({self._queued[priority]} en attente)")
+
+            waiter = _Waiter(priority, session)
+            self._enqueue(waiter)
+            self._dispatch()
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not waiter.granted:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    self._remove(waiter)
+                    self._rejected[priority] += 1
+                    raise Overloaded(f"Pas de place LLM '{priority}' après {timeout:.1f} s d'attente")
+                self._cond.wait(left)
+
+            self._wait_total[priority] += time.monotonic() - waiter.enqueued
+
+    def release(self, priority: str) -> None:
+        with self._cond:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    # --- Interne (sous self._cond) ---
+
+    def _has_room(self, priority: str) -> bool:
+        total = sum(self._running.values())
+        if total >= self.capacity:
+            return False
+        if priority == BACKGROUND:
+            limit = max(1, self.capacity - self.reserved_interactive)
+            return self._running[BACKGROUND] < limit
+        return True
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queues = self._queues[waiter.priority]
+        if waiter.session not in queues:
+            queues[waiter.session] = deque()
+            self._rotation[waiter.priority].append(waiter.session)
+        queues[waiter.session].append(waiter)
+        self._queued[waiter.priority] += 1
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queues = self._queues[waiter.priority]
+        pending = queues.get(waiter.session)
+        if pending is None or waiter not in pending:
+            return
+        pending.remove(waiter)
+        self._queued[waiter.priority] -= 1
+        if not pending:
+            del queues[waiter.session]
+            self._rotation[waiter.priority].remove(waiter.session)
+
+    def _dispatch(self) -> None:
+        """Donne les places libres : interactif d'abord, sessions à tour de rôle."""
+        granted = False
+        for priority in PRIORITIES:
+            rotation = self._rotation[priority]
+            queues = self._queues[priority]
+            while rotation and self._has_room(priority):
+                session = rotation.popleft()
+                pending = queues[session]
+                waiter = pending.popleft()
+                if pending:
+                    rotation.append(session)
+                else:
+                    del queues[session]
+                self._queued[priority] -= 1
+                self._running[priority] += 1
+                self._served[priority] += 1
+                waiter.granted = True
+                granted = True
+            if rotation and priority == INTERACTIVE:
+                break  # de l'interactif attend encore : rien pour le background
+        if granted:
+            self._cond.notify_all()
+
+    # --- Observabilité ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                **{
+                    p: {
+                        "running": self._running[p],
+                        "queued": self._queued[p],
+                        "served": self._served[p],
+                        "rejected": self._rejected[p],
+                        "avg_wait_ms": round(1000 * self._wait_total[p] / self._served[p]) if self._served[p] else 0,
+                    }
+                    for p in PRIORITIES
+                },
+            }
+
+
+def current_slot() -> Optional[Tuple[LLMScheduler, str]]:
+    """(scheduler, priorité) de la place détenue par l'appel en cours, ou None."""
+    return _held.get()
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler(backends: int = 1) -> LLMScheduler:
+    """Scheduler partagé par le processus (créé avec SLOTS_PER_BACKEND par serveur)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(capacity=SLOTS_PER_BACKEND * max(1, backends))
+        return _scheduler
+
+
+# =========================
+# Démonstration : interactif pendant une saturation background
+# =========================
+#
+# python llm_scheduler.py
+#
+# Un faux llama-server à 4 slots (les requêtes en trop attendent côté
+# serveur, comme avec -np 4). 12 threads envoient des générations longues
+# en continu (background) pendant qu'une session envoie des requêtes
+# courtes (interactive). On compare la latence interactive avec et sans
+# scheduler.
+
+def demo() -> None:
+    import json
+    import urllib.request
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    server_slots = threading.Semaphore(4)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with server_slots:
+                time.sleep(0.4 if payload["max_tokens"] > 64 else 0.03)
+            data = b'{"choices": [{"message": {"content": "ok"}}]}'
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    def post(max_tokens: int) -> None:
+        body = json.dumps({"messages": [], "max_tokens": max_tokens}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=30).read()
+
+    def run(scheduler: Optional[LLMScheduler]) -> None:
+        stop = threading.Event()
+
+        def call(priority: str, session: str, max_tokens: int) -> None:
+            if scheduler is None:
+                post(max_tokens)
+                return
+            with scheduler.slot(priority, session, timeout=30):
+                post(max_tokens)
+
+        def background_worker(i: int) -> None:
+            while not stop.is_set():
+                try:
+                    call(BACKGROUND, f"bulk{i % 3}", 512)
+                except Overloaded:
+                    time.sleep(0.05)
+
+        workers = [threading.Thread(target=background_worker, args=(i,), daemon=True) for i in range(12)]
+        for w in workers:
+            w.start()
+        time.sleep(0.5)  # saturation installée
+
+        latencies = []
+        for _ in range(40):
+            start = time.perf_counter()
+            call(INTERACTIVE, "user", 16)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.02)
+        stop.set()
+        for w in workers:
+            w.join()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        label = "avec scheduler" if scheduler else "sans scheduler"
+        print(f"  {label:<15}: interactif p50={p50:.0f} ms  p99={p99:.0f} ms")
+        if scheduler:
+            print(f"  {scheduler.stats()}")
+
+    print("Latence interactive pendant 12 flux de générations longues (serveur à 4 slots)")
+    run(None)
+    run(LLMScheduler(capacity=4))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    demo()
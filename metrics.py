@@ -0,0 +1,345 @@
+# =========================
+# Métriques : compteurs et histogrammes à percentiles
+# =========================
+#
+# Toujours actives (contrairement aux traces, échantillonnées) : chaque
+# étape de handle_user_message (turn, route, switch, extract, handler,
+# render) alimente un histogramme de durée par étape et par skill, chaque
+# appel LLM les compteurs d'appels et de tokens (champ `usage` de
+# llama-server, estimation à défaut) de l'étape qui l'a fait. Les appels
+# JSON lus en streaming (route, switch, extract) sont fermés dès l'objet
+# complet, avant le morceau qui porte `usage` : leurs tokens sont toujours
+# estimés (agent_llm_estimated_usage_total). Les valeurs
+# lues à la demande (cache des commandes, sessions, handlers en cours)
+# viennent de collecteurs enregistrés par le serveur.
+#
+# Histogrammes façon HdrHistogram : SUB_BUCKETS intervalles par puissance
+# de 2, soit une erreur relative < 1/SUB_BUCKETS sur chaque percentile,
+# une mémoire de quelques centaines d'entiers par série quelle que soit la
+# durée, et des histogrammes additionnables (fusion des workers).
+#
+# Export : prometheus() (format texte, percentiles en "summary") et
+# snapshot() (dict JSON ; raw=True ajoute les intervalles, pour merge()).
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import math
+import threading
+
+ENABLED = True
+SUB_BUCKETS = 16                       # erreur relative < 6,25 %
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+_SUB_BITS = SUB_BUCKETS.bit_length() - 1
+
+Labels = Tuple[Tuple[str, str], ...]
+# (nom, type "counter"/"gauge", aide, labels, valeur)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    # Tous les chiffres : avec :g, un compteur de tokens au-delà de 1e6
+    # serait arrondi à 6 chiffres et rate() le verrait plat
+    value = float(value) if not isinstance(value, int) else value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return str(int(value))
+
+
+class Histogram:
+    """
+    Histogramme log-linéaire de valeurs >= 0, stockées en unités entières
+    (`scale` : 1e6 pour des secondes mesurées à la microseconde).
+    """
+
+    __slots__ = ("scale", "counts", "count", "total", "max")
+
+    def __init__(self, scale: float = 1.0):
+        self.scale = scale
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(units: int) -> int:
+        if units < 2 * SUB_BUCKETS:
+            return units
+        shift = units.bit_length() - _SUB_BITS - 1
+        return shift * SUB_BUCKETS + (units >> shift)
+
+    @staticmethod
+    def _upper(index: int) -> int:
+        """Plus grande valeur (en unités) de l'intervalle `index`."""
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift, top = divmod(index, SUB_BUCKETS)
+        shift -= 1
+        top += SUB_BUCKETS
+        return ((top + 1) << shift) - 1
+
+    def record(self, value: float) -> None:
+        value = max(0.0, value)
+        index = self._index(int(value * self.scale))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper(index) / self.scale, self.max)
+        return self.max
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        for index, n in data.get("buckets", {}).items():
+            index = int(index)
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += data.get("count", 0)
+        self.total += data.get("sum", 0.0)
+        self.max = max(self.max, data.get("max", 0.0))
+
+    def summary(self, raw: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+        }
+        for q in QUANTILES:
+            data[f"p{q * 100:g}"] = round(self.percentile(q), 6)
+        if raw:
+            data["scale"] = self.scale
+            data["buckets"] = dict(self.counts)
+        return data
+
+
+class Registry:
+    """Compteurs et histogrammes nommés, avec labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, float]] = {}   # nom -> (type, aide, échelle)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    # --- Déclaration ---
+
+    def counter(self, name: str, help: str) -> None:
+        self._meta[name] = ("counter", help, 1.0)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help: str, scale: float = 1.0) -> None:
+        self._meta[name] = ("summary", help, scale)
+        self._histograms.setdefault(name, {})
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Fonction appelée à chaque export (valeurs tenues ailleurs : cache, sessions...)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    # --- Mesure ---
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        if not ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        if not ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._meta[name][2])
+            histogram.record(value)
+
+    # --- Export ---
+
+    def _collect(self) -> List[Sample]:
+        with self._lock:
+            collectors = list(self._collectors)
+        samples: List[Sample] = []
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                import tracing  # tracing importe ce module
+                tracing.error("Collecteur de métriques en échec: %s", e)
+        return samples
+
+    def snapshot(self, raw: bool = False) -> Dict[str, Any]:
+        """
+        {"counters": {nom: [{"labels": {...}, "value": v}]},
+         "gauges": {...}, "histograms": {nom: [{"labels": {...}, "count", "p95"...}]}}
+        """
+        snapshot: Dict[str, Any] = {"counters": {}, "gauges": {}, "histograms": {}}
+        with self._lock:
+            for name, series in self._counters.items():
+                group = snapshot["gauges" if self._meta[name][0] == "gauge" else "counters"]
+                group[name] = [{"labels": dict(k), "value": v} for k, v in series.items()]
+            for name, series in self._histograms.items():
+                snapshot["histograms"][name] = [
+                    {"labels": dict(k), **h.summary(raw)} for k, h in series.items()
+                ]
+        for name, kind, help, labels, value in self._collect():
+            self._meta.setdefault(name, (kind, help, 1.0))
+            group = snapshot["counters" if kind == "counter" else "gauges"]
+            group.setdefault(name, []).append({"labels": labels, "value": value})
+        if raw:
+            snapshot["help"] = {name: help for name, (_, help, _) in self._meta.items()}
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Ajoute un snapshot brut (raw=True) d'un autre processus."""
+        with self._lock:
+            for group in ("counters", "gauges"):
+                for name, series in snapshot.get(group, {}).items():
+                    if name not in self._meta:
+                        kind = "counter" if group == "counters" else "gauge"
+                        self._meta[name] = (kind, snapshot.get("help", {}).get(name, ""), 1.0)
+                    target = self._counters.setdefault(name, {})
+                    for item in series:
+                        key = _labels(item["labels"])
+                        target[key] = target.get(key, 0.0) + item["value"]
+            for name, series in snapshot.get("histograms", {}).items():
+                target = self._histograms.setdefault(name, {})
+                for item in series:
+                    if name not in self._meta:
+                        self._meta[name] = ("summary", snapshot.get("help", {}).get(name, ""), item.get("scale", 1.0))
+                    key = _labels(item["labels"])
+                    if key not in target:
+                        target[key] = Histogram(item.get("scale", 1.0))
+                    target[key].merge(item)
+
+    def prometheus(self) -> str:
+        """Format texte d'exposition Prometheus (0.0.4)."""
+        lines: List[str] = []
+
+        def fmt(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+            items = sorted(labels.items()) + ([extra] if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+        snapshot = self.snapshot()
+        kinds = {name: kind for name, (kind, _, _) in self._meta.items()}
+        helps = {name: help for name, (_, help, _) in self._meta.items()}
+        for group in ("counters", "gauges"):
+            for name, series in sorted(snapshot[group].items()):
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {helps.get(name, '')}".rstrip())
+                lines.append(f"# TYPE {name} {kinds.get(name, 'counter' if group == 'counters' else 'gauge')}")
+                lines.extend(f"{name}{fmt(item['labels'])} {_number(item['value'])}" for item in series)
+        for name, series in sorted(snapshot["histograms"].items()):
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {helps.get(name, '')}".rstrip())
+            lines.append(f"# TYPE {name} summary")
+            for item in series:
+                for q in QUANTILES:
+                    lines.append(f"{name}{fmt(item['labels'], ('quantile', f'{q:g}'))} {_number(item[f'p{q * 100:g}'])}")
+                lines.append(f"{name}_sum{fmt(item['labels'])} {_number(item['sum'])}")
+                lines.append(f"{name}_count{fmt(item['labels'])} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# =========================
+# Métriques de l'agent
+# =========================
+
+REGISTRY = Registry()
+REGISTRY.histogram("agent_stage_seconds", "Durée des étapes d'un tour (turn, route, switch, extract, handler, render)", scale=1e6)
+REGISTRY.counter("agent_stage_errors_total", "Étapes terminées par une exception")
+REGISTRY.counter("agent_llm_calls_total", "Appels LLM par étape")
+REGISTRY.counter("agent_llm_prompt_tokens_total", "Tokens de prompt par étape")
+REGISTRY.counter("agent_llm_completion_tokens_total", "Tokens générés par étape")
+REGISTRY.counter("agent_llm_estimated_usage_total", "Appels LLM sans champ usage (tokens estimés)")
+REGISTRY.histogram("agent_handler_seconds", "Durée réelle des handlers par skill (arrière-plan compris)", scale=1e6)
+REGISTRY.histogram("agent_turn_llm_calls", "Appels LLM par tour")
+REGISTRY.histogram("agent_turn_tokens", "Tokens par tour (prompt, completion)")
+
+
+def observe_stage(stage: str, seconds: float, skill: Optional[str] = None, error: bool = False) -> None:
+    REGISTRY.observe("agent_stage_seconds", seconds, stage=stage, skill=skill)
+    if error:
+        REGISTRY.inc("agent_stage_errors_total", stage=stage)
+
+
+def observe_llm(stage: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+    REGISTRY.inc("agent_llm_calls_total", stage=stage)
+    REGISTRY.inc("agent_llm_prompt_tokens_total", prompt_tokens, stage=stage)
+    REGISTRY.inc("agent_llm_completion_tokens_total", completion_tokens, stage=stage)
+    if estimated:
+        REGISTRY.inc("agent_llm_estimated_usage_total", stage=stage)
+
+
+def observe_handler(skill: str, seconds: float, outcome: str) -> None:
+    REGISTRY.observe("agent_handler_seconds", seconds, skill=skill, outcome=outcome)
+
+
+def observe_turn(llm_calls: int, prompt_tokens: int, completion_tokens: int) -> None:
+    REGISTRY.observe("agent_turn_llm_calls", llm_calls)
+    REGISTRY.observe("agent_turn_tokens", prompt_tokens, kind="prompt")
+    REGISTRY.observe("agent_turn_tokens", completion_tokens, kind="completion")
+
+
+def add_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    REGISTRY.add_collector(collector)
+
+
+def snapshot(raw: bool = False) -> Dict[str, Any]:
+    return REGISTRY.snapshot(raw)
+
+
+def prometheus() -> str:
+    return REGISTRY.prometheus()
+
+
+# =========================
+# Démonstration
+# =========================
+
+if __name__ == "__main__":
+    import random
+
+    values = [random.lognormvariate(-3, 0.5) for _ in range(100000)]
+    histogram = Histogram(scale=1e6)
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for q in QUANTILES:
+        exact = values[math.ceil(q * len(values)) - 1]
+        print(f"p{q * 100:g}: exact {exact * 1000:.2f} ms, histogramme {histogram.percentile(q) * 1000:.2f} ms"
+              f" ({len(histogram.counts)} intervalles)")
+
+    observe_stage("route", 0.12)
+    observe_llm("route", 420, 18)
+    print(prometheus())
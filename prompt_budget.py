@@ -0,0 +1,184 @@
+# =========================
+# Budget de tokens des prompts
+# =========================
+#
+# Un prompt ne doit jamais dépasser le contexte du modèle, et son coût de
+# prefill doit rester prévisible quelle que soit la taille des données
+# (liste d'emails, calendrier chargé, corps de mail...). Ce module :
+#   - estime le nombre de tokens d'un texte (count_tokens, calibré par
+#     /tokenize au préchauffage) ;
+#   - sérialise une donnée structurée en JSON compact et la réduit jusqu'à
+#     tenir dans un budget (fit_payload) : chaînes longues tronquées,
+#     listes longues réduites à leurs premiers éléments + nombre omis ;
+#   - tronque un texte libre (truncate_text) ;
+#   - garantit qu'une requête tient dans le contexte (fit_messages) :
+#     l'historique le plus ancien part d'abord, puis le message utilisateur
+#     est tronqué. send_llama_chat l'applique à chaque appel.
+
+from typing import Any, Dict, List, Optional, Tuple
+import json
+
+from llm_pool import base_url
+
+CHARS_PER_TOKEN = 3.5         # français, tokenizers type Qwen/Llama
+CONTEXT_TOKENS = 4096         # contexte par slot supposé tant que /props n'a pas été lu
+CONTEXT_MARGIN = 0.9          # part utilisable : l'estimation n'est pas exacte
+TEMPLATE_TOKENS = 8           # balises du template de chat, par message
+MIN_STRING_CHARS = 40
+MIN_LIST_ITEMS = 3
+ELLIPSIS = "…"
+
+_chars_per_token = CHARS_PER_TOKEN
+_context_tokens = CONTEXT_TOKENS
+
+
+# =========================
+# Mesure
+# =========================
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens approximatif de `text`."""
+    return int(len(text) / _chars_per_token) + 1
+
+
+def calibrate_tokens(url: str, timeout: float = 5.0) -> Optional[float]:
+    """
+    Mesure le ratio caractères/token du modèle servi par `url` (/tokenize)
+    et l'utilise pour count_tokens(). Retourne le ratio, ou None si le
+    serveur ne répond pas.
+    """
+    global _chars_per_token
+    import requests
+
+    sample = (
+        "Bonjour ! Peux-tu ajouter une réunion avec l'équipe demain à 14h30 "
+        "et me rappeler d'envoyer le rapport trimestriel avant vendredi ?"
+    )
+    try:
+        response = requests.post(f"{base_url(url)}/tokenize", json={"content": sample}, timeout=timeout)
+        tokens = response.json().get("tokens")
+    except (requests.RequestException, ValueError, AttributeError):
+        return None
+    if not tokens:
+        return None
+    _chars_per_token = len(sample) / len(tokens)
+    return _chars_per_token
+
+
+def set_context_size(n_ctx: int) -> None:
+    """Contexte d'un slot de llama-server (default_generation_settings.n_ctx)."""
+    global _context_tokens
+    if n_ctx > 0:
+        _context_tokens = n_ctx
+
+
+def context_size() -> int:
+    return _context_tokens
+
+
+def messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + TEMPLATE_TOKENS for m in messages)
+
+
+# =========================
+# Réduction
+# =========================
+
+def compact_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Coupe `text` (sur une fin de mot si possible) pour tenir dans max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, int((max_tokens - 1) * _chars_per_token) - len(ELLIPSIS))
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + ELLIPSIS
+
+
+def _shrink(obj: Any, string_limit: int, list_limit: int) -> Any:
+    if isinstance(obj, str):
+        return obj if len(obj) <= string_limit else obj[:string_limit].rstrip() + ELLIPSIS
+    if isinstance(obj, dict):
+        return {k: _shrink(v, string_limit, list_limit) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        items = [_shrink(v, string_limit, list_limit) for v in obj[:list_limit]]
+        if len(obj) > list_limit:
+            items.append(f"{ELLIPSIS} (+{len(obj) - list_limit} autres)")
+        return items
+    return obj
+
+
+def _longest(obj: Any) -> Tuple[int, int]:
+    """(plus longue chaîne, plus longue liste) de la structure."""
+    if isinstance(obj, str):
+        return len(obj), 0
+    if isinstance(obj, dict):
+        values = list(obj.values())
+    elif isinstance(obj, (list, tuple)):
+        values = list(obj)
+    else:
+        return 0, 0
+    string, items = 0, len(values) if not isinstance(obj, dict) else 0
+    for value in values:
+        s, i = _longest(value)
+        string, items = max(string, s), max(items, i)
+    return string, items
+
+
+def fit_payload(obj: Any, max_tokens: int) -> str:
+    """
+    JSON compact de `obj` tenant dans max_tokens : on tronque d'abord les
+    chaînes longues (corps de mail, descriptions), puis on réduit les listes
+    longues à leurs premiers éléments ; en dernier recours le texte JSON
+    lui-même est coupé.
+    """
+    text = compact_json(obj)
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    string_limit, list_limit = _longest(obj)
+    while True:
+        if string_limit > MIN_STRING_CHARS:
+            string_limit = max(MIN_STRING_CHARS, string_limit // 2)
+        elif list_limit > MIN_LIST_ITEMS:
+            list_limit = max(MIN_LIST_ITEMS, list_limit // 2)
+        else:
+            return truncate_text(text, max_tokens)
+        text = compact_json(_shrink(obj, string_limit, list_limit))
+        if count_tokens(text) <= max_tokens:
+            return text
+
+
+def fit_messages(messages: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+    """
+    Messages (system, historique..., dernier message) tenant dans le contexte
+    avec max_tokens de génération. Retire l'historique le plus ancien (par
+    paires user/assistant), puis tronque le dernier message, puis le prompt
+    système.
+    """
+    budget = int(_context_tokens * CONTEXT_MARGIN) - max_tokens
+    if messages_tokens(messages) <= budget:
+        return messages
+
+    messages = list(messages)
+    # Historique : tout ce qui est entre le prompt système et le dernier
+    # message, retiré par paires user/assistant (résumé compris) : certains
+    # templates de chat exigent l'alternance des rôles
+    while len(messages) > 2 and messages_tokens(messages) > budget:
+        pair = len(messages) > 3 and messages[1]["role"] == "user" and messages[2]["role"] == "assistant"
+        del messages[1:3 if pair else 2]
+    over = messages_tokens(messages) - budget
+    for index in (len(messages) - 1, 0):
+        if over <= 0:
+            break
+        message = messages[index]
+        own = count_tokens(message["content"])
+        kept = max(1, own - over)
+        messages[index] = {**message, "content": truncate_text(message["content"], kept)}
+        over -= own - count_tokens(messages[index]["content"])
+    return messages
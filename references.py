@@ -0,0 +1,192 @@
+# =========================
+# Références aux résultats affichés ("le deuxième", "celui de Marie")
+# =========================
+#
+# Après "liste mes mails", l'utilisateur dit "lis le deuxième" ou "résume
+# celui de Marie". Le routeur et l'extraction ne savent pas à quoi cela
+# correspond : la session garde donc la dernière liste renvoyée par chaque
+# skill (position -> ID + texte des champs), et ce module résout localement,
+# sans appel LLM :
+#   - les ordinaux : premier, 2e, troisième, dernier, avant-dernier...
+#   - les désignations : "celui de Marie", "celle avec Paul", et pour un
+#     slot qui attend un ID, un nom seul ("Marie") présent dans un seul
+#     élément de la liste.
+# Les actions qui prennent l'ID d'un élément listé sont déclarées dans le
+# SKILL du module : "references": {slot: [actions...]}. Pour les autres
+# (ajout d'un événement...), la valeur du slot n'est jamais remplacée.
+#
+# Sans passer par le routeur, seule une commande explicite sur un élément
+# ("lis le 2e", "supprime celui de Marie"), juste après la liste, va au
+# skill de cette liste (command_reference) : "qui est le premier
+# ministre ?" ou "joue la deuxième chanson" restent routés normalement.
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import re
+import unicodedata
+
+MAX_ITEMS = 50           # éléments gardés par liste
+MAX_TEXT_CHARS = 160     # texte gardé par élément (pour "celui de ...")
+ID_KEYS = ("id", "uid")
+
+# (ID, texte des champs courts, sans accents)
+Item = Tuple[str, str]
+
+_ORDINALS = {
+    "premier": 1, "premiere": 1, "1er": 1, "1re": 1, "1ere": 1,
+    "deuxieme": 2, "second": 2, "seconde": 2,
+    "troisieme": 3, "quatrieme": 4, "cinquieme": 5, "sixieme": 6,
+    "septieme": 7, "huitieme": 8, "neuvieme": 9, "dixieme": 10,
+    "dernier": -1, "derniere": -1,
+    "avant-dernier": -2, "avant-derniere": -2, "avant dernier": -2, "avant derniere": -2,
+}
+_NOT_AN_ITEM = (
+    r"janvier|fevrier|mars|avril|mai|juin|juillet|aout|septembre|octobre|novembre|decembre"
+    r"|jour|fois|semaine|mois|trimestre|semestre|etage|lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche"
+)
+_ORDINAL_WORDS = "|".join(sorted((re.escape(k) for k in _ORDINALS), key=len, reverse=True)) + r"|\d+(?:e|eme)"
+# Le mot peut être suivi d'un nom (mail, événement...) mais pas d'un mois
+# ni d'une unité : "le premier mars" est une date, pas un élément
+_ORDINAL = re.compile(r"\b(" + _ORDINAL_WORDS + r")\b(?!\s*(?:\d|" + _NOT_AN_ITEM + r")\b)")
+_ARTICLE = r"(?:la\s+|le\s+|les\s+|l')?"
+# Verbe d'action sur un élément, suivi directement de la référence
+_COMMAND = re.compile(
+    r"^(?:(?:peux|pourrais)[- ]tu\s+|tu\s+peux\s+)?"
+    r"(?:lis|lire|relis|relire|ouvre|ouvrir|affiche|afficher|montre|montrer|detaille|detailler"
+    r"|supprime|supprimer|efface|effacer|resume|resumer|synthetise|synthetiser"
+    r"|modifie|modifier|deplace|deplacer|change|changer)(?:-moi|-le|-la)?\s+(.+)$"
+)
+_TARGET = re.compile(r"^" + _ARTICLE + r"(?:(?:" + _ORDINAL_WORDS + r")|celui|celle|ceux|celles)\b")
+_DEMONSTRATIVE = re.compile(r"\b(?:celui|celle|ceux|celles)\s+(?:de|d'|du|des|avec|par)\s*" + _ARTICLE + r"([a-z][\w-]{2,})")
+_OF_NAME = re.compile(r"\b(?:de|d'|du|avec|par)\s*" + _ARTICLE + r"([a-z][\w-]{2,})")
+_WORD = re.compile(r"[a-z0-9][\w-]{2,}")
+_STOPWORDS = {
+    "mail", "mails", "email", "emails", "message", "messages", "evenement", "evenements",
+    "rendez-vous", "rdv", "reunion", "reunions", "liste", "calendrier", "celui", "celle",
+    "ceux", "celles", "tous", "toutes", "tout", "les", "des", "une", "lis", "lire", "supprime",
+    "supprimer", "resume", "resumer", "synthetise", "modifie", "modifier", "montre", "ouvre",
+}
+
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def result_items(result: Any) -> Optional[Tuple[Item, ...]]:
+    """
+    Liste d'éléments identifiés d'un résultat de handler : la première
+    liste de dicts portant un "id" ou un "uid" (emails, événements,
+    synthèses...). None si le résultat n'en contient pas.
+    """
+    if not isinstance(result, dict):
+        return None
+    for value in result.values():
+        if not (isinstance(value, list) and value and isinstance(value[0], dict)):
+            continue
+        key = next((k for k in ID_KEYS if k in value[0]), None)
+        if key is None:
+            continue
+        items = []
+        for entry in value[:MAX_ITEMS]:
+            if not isinstance(entry, dict) or not entry.get(key):
+                continue
+            text = " ".join(
+                str(v) for k, v in entry.items()
+                if k not in ID_KEYS and isinstance(v, str) and len(v) <= MAX_TEXT_CHARS
+            )
+            items.append((str(entry[key]), _fold(text)[:MAX_TEXT_CHARS]))
+        return tuple(items)
+    return None
+
+
+def _ordinal(folded: str) -> Optional[int]:
+    match = _ORDINAL.search(folded)
+    if match is None:
+        return None
+    word = match.group(1)
+    if word in _ORDINALS:
+        return _ORDINALS[word]
+    return int(re.match(r"\d+", word).group(0))
+
+
+def _by_name(names: Sequence[str], items: Sequence[Item]) -> Optional[str]:
+    for name in names:
+        if name in _STOPWORDS:
+            continue
+        pattern = re.compile(rf"\b{re.escape(name)}\b")
+        matches = [item_id for item_id, text in items if pattern.search(text)]
+        if len(matches) == 1:
+            return matches[0]
+    return None
+
+
+def resolve(text: str, items: Sequence[Item], loose: bool = False) -> Optional[str]:
+    """
+    ID de l'élément désigné par `text`, ou None. Sans `loose`, seules les
+    formes explicites comptent (ordinal, "celui de X") ; avec `loose`
+    (valeur d'un slot qui attend un ID), "de X" ou un nom seul présent
+    dans un seul élément suffisent.
+    """
+    if not items or not text:
+        return None
+    folded = _fold(text)
+
+    position = _ordinal(folded)
+    if position is not None:
+        index = position - 1 if position > 0 else len(items) + position
+        return items[index][0] if 0 <= index < len(items) else None
+
+    names = _DEMONSTRATIVE.findall(folded)
+    if not names and loose:
+        # "de Marie", ou un mot seul ("Marie") ; pas n'importe quel mot d'une
+        # phrase, qui pourrait être le titre d'un nouvel événement
+        words = _WORD.findall(folded)
+        names = _OF_NAME.findall(folded) or (words if len(words) == 1 else [])
+    return _by_name(names, items)
+
+
+def command_reference(text: str, items: Sequence[Item]) -> Optional[str]:
+    """
+    ID de l'élément visé par une commande explicite ("lis le deuxième",
+    "supprime le dernier mail", "résume celui de Marie"), ou None : le
+    verbe d'action doit précéder directement la référence.
+    """
+    match = _COMMAND.match(_fold(text).strip())
+    if match is None or not _TARGET.match(match.group(1)):
+        return None
+    return resolve(match.group(1), items)
+
+
+def substitute(value: str, item_id: str, ids: Sequence[str]) -> str:
+    """
+    Remplace la référence par l'ID dans une valeur de slot. Format "ID |
+    champs..." (modification d'événement) : seul le premier champ change.
+    Une valeur qui est déjà un ID connu est gardée.
+    """
+    head, sep, rest = value.partition("|")
+    if head.strip() in ids:
+        return value
+    return f"{item_id} {sep}{rest}" if sep else item_id
+
+
+def remember(results: Optional[Dict[str, Tuple[Item, ...]]], skill: str, result: Any) -> Optional[Dict[str, Tuple[Item, ...]]]:
+    """Ajoute la liste de `result` aux listes de la session (la plus récente en dernier)."""
+    items = result_items(result)
+    if items is None:
+        return results
+    results = dict(results or {})
+    results.pop(skill, None)
+    results[skill] = items
+    return results
+
+
+def latest(results: Optional[Dict[str, Tuple[Item, ...]]]) -> Optional[Tuple[str, Tuple[Item, ...]]]:
+    """(skill, éléments) de la liste la plus récente."""
+    if not results:
+        return None
+    skill = next(reversed(list(results)))
+    return skill, results[skill]
+
+
+def item_ids(items: Sequence[Item]) -> List[str]:
+    return [item_id for item_id, _ in items]
@@ -0,0 +1,699 @@
+# =========================
+# Serveur multi-sessions (HTTP + WebSocket)
+# =========================
+#
+# python server.py [--host 127.0.0.1] [--port 8000]
+#
+# Chaque session est un MultiSkillAgent indépendant, identifié par un
+# session_id ; les skills sont construits une fois et partagés.
+#
+#   POST   /chat                {"session_id": "...", "message": "..."}
+#                               -> {"session_id", "answer", "turn", "latency_ms", "new_session"}
+#   GET    /ws?session_id=...   WebSocket : on envoie {"message": "..."} (ou du texte brut),
+#                               on reçoit {"type": "thinking"} puis {"type": "answer", ...},
+#                               et les rappels du calendrier ({"type": "reminder", ...})
+#   GET    /sessions            métriques de toutes les sessions
+#   GET    /sessions/<id>       métriques d'une session
+#   DELETE /sessions/<id>       ferme une session
+#   GET    /health
+#   GET    /metrics             métriques au format texte Prometheus (percentiles par étape,
+#                               appels et tokens LLM, cache, handlers)
+#   GET    /metrics.json        les mêmes en JSON (?raw=1 : histogrammes fusionnables)
+#
+# Éviction : une session inactive depuis SESSION_TTL est fermée ; au-delà
+# de MAX_SESSIONS ou de MAX_MEMORY_BYTES (estimation de l'état des
+# sessions), les moins récemment utilisées sont fermées en premier. Une
+# session entre la réception d'un message et la fin de son traitement
+# (épinglée par get_or_create, désépinglée par handle) n'est jamais évincée.
+#
+# Avec --spill-dir, une session évincée n'est pas perdue : son état
+# (MultiSkillAgent.snapshot(), quelques dizaines d'octets) est écrit sur
+# disque et relu au message suivant. Les fichiers non relus depuis
+# SPILL_TTL sont supprimés.
+#
+# Uniquement la bibliothèque standard : ThreadingHTTPServer (un thread par
+# connexion) et un WebSocket minimal (RFC 6455, trames texte, ping/close).
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import base64
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from agent import MultiSkillAgent, Skill
+import metrics
+import tracing
+from skill_executor import get_skill_executor
+from utterance_cache import get_utterance_cache
+
+MAX_SESSIONS = 10000
+SESSION_TTL = 30 * 60               # secondes d'inactivité avant éviction
+MAX_MEMORY_BYTES = 256 * 1024 * 1024
+JANITOR_INTERVAL = 30.0
+MAX_BODY_BYTES = 64 * 1024
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SPILL_TTL = 24 * 3600               # durée de vie d'une session sur disque
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+# =========================
+# Sessions
+# =========================
+
+def estimate_size(obj: Any, shared: Set[int], seen: Optional[Set[int]] = None) -> int:
+    """
+    Taille approximative (octets) de l'état propre d'une session : on
+    parcourt dicts, listes et attributs, sans compter les objets partagés
+    (skills, slots) ni deux fois le même objet.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or id(obj) in shared:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, shared, seen) + estimate_size(v, shared, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, shared, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), shared, seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(
+            estimate_size(getattr(obj, name), shared, seen)
+            for name in obj.__slots__ if hasattr(obj, name)
+        )
+    return size
+
+
+class Session:
+    """Un agent + ses métriques. Un seul message traité à la fois par session."""
+
+    def __init__(self, session_id: str, agent: MultiSkillAgent):
+        self.session_id = session_id
+        self.agent = agent
+        self.lock = threading.Lock()
+        # Requêtes entre get_or_create() et la fin de handle() : jamais évincée
+        self.pins = 0
+        self.created = time.time()
+        self.last_active = time.monotonic()
+        self.turns = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.size = 0
+
+    def snapshot(self) -> bytes:
+        return marshal.dumps((self.agent.snapshot(), self.created, self.turns, self.errors, self.total_latency))
+
+    @classmethod
+    def restore(cls, skills: Dict[str, Skill], data: bytes) -> "Session":
+        try:
+            agent_data, created, turns, errors, total_latency = marshal.loads(data)
+        except (EOFError, TypeError, ValueError) as e:
+            raise ValueError(f"Session illisible: {e}") from e
+        agent = MultiSkillAgent.restore(skills, agent_data)
+        session = cls(agent.session_id, agent)
+        session.created, session.turns, session.errors, session.total_latency = created, turns, errors, total_latency
+        return session
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "turns": self.turns,
+            "errors": self.errors,
+            "busy": self.lock.locked(),
+            "avg_latency_ms": round(1000 * self.total_latency / self.turns) if self.turns else 0,
+            "last_latency_ms": round(1000 * self.last_latency),
+            "idle_s": round(time.monotonic() - self.last_active, 1),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created)),
+            "state_bytes": self.size,
+            "current_skill": self.agent.current_skill_name,
+        }
+
+
+class SessionManager:
+    """
+    Sessions indexées par ID, en ordre LRU, avec éviction TTL / nombre / mémoire.
+    Avec `spill_dir`, les sessions évincées sont écrites sur disque et
+    rechargées à leur prochain message.
+    """
+
+    def __init__(
+        self,
+        skills: List[Skill],
+        max_sessions: int = MAX_SESSIONS,
+        ttl: float = SESSION_TTL,
+        max_memory: int = MAX_MEMORY_BYTES,
+        spill_dir: Optional[str] = None,
+        spill_ttl: float = SPILL_TTL,
+    ):
+        self.skills = skills
+        # Un seul index {nom: Skill} pour tous les agents
+        self.skill_index: Dict[str, Skill] = {s.name: s for s in skills}
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory = 0
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+        # Objets partagés par toutes les sessions : exclus de l'estimation mémoire
+        self._shared: Set[int] = {id(self.skill_index)}
+        for skill in skills:
+            self._shared.update(id(o) for o in (skill, skill.name, skill.slots, skill.on_ready, *skill.slots))
+            self._shared.update(id(slot.name) for slot in skill.slots)
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[Session, bool]:
+        """
+        Session de cet ID (créée ou relue sur disque au besoin), épinglée :
+        elle ne peut pas être évincée avant handle() ou release().
+        """
+        with self._lock:
+            if session_id and session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+                session = self._sessions[session_id]
+                session.pins += 1
+                return session, False
+            session = self._unspill_locked(session_id) if session_id else None
+            created = session is None
+            if session is None:
+                session_id = session_id or uuid.uuid4().hex
+                session = Session(session_id, MultiSkillAgent(self.skill_index, session_id=session_id))
+            session.size = estimate_size(session.agent, self._shared)
+            self._sessions[session.session_id] = session
+            self._memory += session.size
+            session.pins += 1
+            self._evict_locked()
+            return session, created
+
+    def release(self, session: Session) -> None:
+        """Désépingle une session obtenue par get_or_create() sans passer par handle()."""
+        with self._lock:
+            session.pins -= 1
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def handle(self, session: Session, message: str) -> Dict[str, Any]:
+        """
+        Traite un message dans une session épinglée par get_or_create(), met
+        à jour les métriques et désépingle la session.
+        """
+        try:
+            with session.lock:
+                start = time.perf_counter()
+                try:
+                    answer = session.agent.handle_user_message(message)
+                except Exception as e:
+                    tracing.error("Erreur interne (session %s): %s", session.session_id, e)
+                    session.errors += 1
+                    answer = "Oups, j'ai eu un souci interne, peux-tu réessayer ?"
+                latency = time.perf_counter() - start
+
+                session.turns += 1
+                session.total_latency += latency
+                session.last_latency = latency
+                session.last_active = time.monotonic()
+                size = estimate_size(session.agent, self._shared)
+        except BaseException:
+            self.release(session)
+            raise
+
+        with self._lock:
+            session.pins -= 1
+            # Toujours présente sauf DELETE /sessions/<id> pendant le tour
+            if self._sessions.get(session.session_id) is session:
+                self._memory += size - session.size
+                self._sessions.move_to_end(session.session_id)
+            session.size = size
+            self._evict_locked()
+
+        return {
+            "session_id": session.session_id,
+            "answer": answer,
+            "turn": session.turns,
+            "latency_ms": round(latency * 1000),
+        }
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            spilled = self._remove_spill(session_id)
+            if session is None:
+                return spilled
+            self._memory -= session.size
+            return True
+
+    def sweep(self) -> int:
+        """
+        Évince les sessions inactives depuis plus de ttl secondes (sur disque
+        si spill_dir), et supprime les sessions sur disque trop anciennes.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                sid for sid, s in self._sessions.items()
+                if now - s.last_active > self.ttl and not s.pins
+            ]
+            for sid in expired:
+                self._drop_locked(sid)
+        if self.spill_dir:
+            self._sweep_spill()
+        return len(expired)
+
+    def _evict_locked(self) -> None:
+        # Du moins récemment utilisé au plus récent, en sautant les sessions épinglées
+        for sid in list(self._sessions.keys()):
+            if len(self._sessions) <= self.max_sessions and self._memory <= self.max_memory:
+                return
+            if self._sessions[sid].pins:
+                continue
+            self._drop_locked(sid)
+
+    def _drop_locked(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._memory -= session.size
+        self.evicted += 1
+        if self.spill_dir:
+            try:
+                self._spill(session)
+            except OSError as e:
+                tracing.error("Impossible d'écrire la session %s sur disque: %s", session_id, e)
+
+    # --- Sessions sur disque ---
+
+    def _spill_path(self, session_id: str) -> str:
+        # L'ID vient du client : on ne s'en sert pas directement comme nom de fichier
+        name = hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.spill_dir, name + ".session")
+
+    def _spill(self, session: Session) -> None:
+        path = self._spill_path(session.session_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(session.snapshot())
+        os.replace(tmp_path, path)
+        self.spilled += 1
+
+    def _unspill_locked(self, session_id: str) -> Optional[Session]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            tracing.error("Impossible de relire la session %s: %s", session_id, e)
+            return None
+        try:
+            session = Session.restore(self.skill_index, data)
+        except ValueError as e:
+            tracing.warning("Session %s ignorée: %s", session_id, e)
+            return None
+        if session.session_id != session_id:
+            return None
+        self.restored += 1
+        return session
+
+    def _remove_spill(self, session_id: str) -> bool:
+        if not self.spill_dir:
+            return False
+        try:
+            os.remove(self._spill_path(session_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _sweep_spill(self) -> None:
+        limit = time.time() - self.spill_ttl
+        with os.scandir(self.spill_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".session") and entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            memory = self._memory
+        return {
+            "sessions": len(sessions),
+            "state_bytes": memory,
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "items": [s.metrics() for s in sessions],
+        }
+
+    def start_janitor(self, interval: float = JANITOR_INTERVAL) -> None:
+        def loop() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    tracing.error("Erreur lors de l'éviction des sessions: %s", e)
+        threading.Thread(target=loop, name="session-janitor", daemon=True).start()
+
+
+# =========================
+# WebSocket minimal (RFC 6455)
+# =========================
+
+class WebSocket:
+    """Trames texte uniquement ; ping/pong et close gérés."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    @staticmethod
+    def accept_key(key: str) -> str:
+        digest = hashlib.sha1((key + _WS_GUID).encode("ascii")).digest()
+        return base64.b64encode(digest).decode("ascii")
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self.rfile.read(n)
+        if len(data) < n:
+            raise ConnectionError("connexion fermée")
+        return data
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        header = bytes([0x80 | opcode])
+        n = len(payload)
+        if n < 126:
+            header += bytes([n])
+        elif n < 65536:
+            header += bytes([126]) + struct.pack("!H", n)
+        else:
+            header += bytes([127]) + struct.pack("!Q", n)
+        with self._send_lock:
+            if self.closed:
+                return
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def send_json(self, data: Dict[str, Any]) -> None:
+        self._send_frame(0x1, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def messages(self) -> Iterable[str]:
+        """Messages texte reçus, jusqu'à la fermeture."""
+        fragments: List[bytes] = []
+        while not self.closed:
+            b1, b2 = self._read_exact(2)
+            fin, opcode = b1 & 0x80, b1 & 0x0F
+            length = b2 & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read_exact(8))[0]
+            if length > MAX_BODY_BYTES:
+                raise ConnectionError("trame trop grande")
+            mask = self._read_exact(4) if b2 & 0x80 else None
+            payload = self._read_exact(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+            if opcode == 0x8:  # close
+                self._send_frame(0x8, payload[:2])
+                self.closed = True
+                return
+            if opcode == 0x9:  # ping
+                self._send_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1):
+                fragments.append(payload)
+                if fin:
+                    text = b"".join(fragments).decode("utf-8", errors="replace")
+                    fragments = []
+                    yield text
+
+
+# =========================
+# HTTP
+# =========================
+
+def content_length(headers) -> Optional[int]:
+    """Content-Length de la requête (0 si absent), None s'il est invalide."""
+    try:
+        length = int(headers.get("Content-Length") or 0)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AgentServer/1.0"
+    manager: SessionManager = None  # renseigné par make_server
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send_json(self, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8") -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = content_length(self.headers)
+        if length is None or length > MAX_BODY_BYTES:
+            # Corps non lu : la connexion ne peut pas être réutilisée
+            self.close_connection = True
+            if length is None:
+                self._send_json(400, {"error": "Content-Length invalide"})
+            else:
+                self._send_json(413, {"error": "Requête trop grande"})
+            return None
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "JSON invalide"})
+            return None
+        if not isinstance(data, dict):
+            self._send_json(400, {"error": "Objet JSON attendu"})
+            return None
+        return data
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "utterance_cache": get_utterance_cache().stats(),
+                "handlers": get_skill_executor().stats(),
+                "tracing": tracing.stats(),
+            })
+        elif url.path == "/metrics":
+            self._send_text(200, metrics.prometheus(), PROMETHEUS_CONTENT_TYPE)
+        elif url.path == "/metrics.json":
+            raw = parse_qs(url.query).get("raw", ["0"])[0] not in ("0", "")
+            self._send_json(200, metrics.snapshot(raw))
+        elif url.path == "/ws":
+            self._websocket(parse_qs(url.query).get("session_id", [None])[0])
+        elif url.path == "/sessions":
+            self._send_json(200, self.manager.metrics())
+        elif url.path.startswith("/sessions/"):
+            session = self.manager.get(url.path[len("/sessions/"):])
+            if session is None:
+                self._send_json(404, {"error": "Session inconnue"})
+            else:
+                self._send_json(200, session.metrics())
+        else:
+            self._send_json(404, {"error": "Ressource inconnue"})
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/chat":
+            self._send_json(404, {"error": "Ressource inconnue"})
+            return
+        data = self._read_json()
+        if data is None:
+            return
+        message = data.get("message")
+        if not isinstance(message, str) or not message.strip():
+            self._send_json(400, {"error": "Champ 'message' manquant"})
+            return
+        session, created = self.manager.get_or_create(data.get("session_id"))
+        result = self.manager.handle(session, message.strip())
+        self._send_json(200, {**result, "new_session": created})
+
+    def do_DELETE(self) -> None:
+        path = urlsplit(self.path).path
+        if path.startswith("/sessions/") and self.manager.close(path[len("/sessions/"):]):
+            self._send_json(200, {"closed": True})
+        else:
+            self._send_json(404, {"error": "Session inconnue"})
+
+    def _websocket(self, session_id: Optional[str]) -> None:
+        key = self.headers.get("Sec-WebSocket-Key")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self._send_json(400, {"error": "Upgrade WebSocket attendu"})
+            return
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", WebSocket.accept_key(key))
+        self.end_headers()
+        self.close_connection = True
+
+        ws = WebSocket(self.rfile, self.wfile)
+        session, created = self.manager.get_or_create(session_id)
+        # Connexion ouverte sans message : la session reste évinçable
+        self.manager.release(session)
+        ws.send_json({"type": "session", "session_id": session.session_id, "new_session": created})
+
+        subscriber = f"ws:{session.session_id}:{id(ws)}"
+        scheduler = _reminder_scheduler()
+        if scheduler is not None:
+            scheduler.subscribe(
+                subscriber,
+                lambda message, details: ws.send_json({"type": "reminder", "message": message, **details}),
+            )
+        # Résultats des handlers de la session passés en arrière-plan
+        executor = get_skill_executor()
+        executor.subscribe(
+            session.session_id,
+            subscriber,
+            lambda message, details: ws.send_json({"type": "task", "message": message, **details}),
+        )
+        try:
+            for text in ws.messages():
+                try:
+                    data = json.loads(text)
+                    message = data.get("message", "") if isinstance(data, dict) else str(data)
+                except ValueError:
+                    message = text
+                message = message.strip()
+                if not message:
+                    continue
+                ws.send_json({"type": "thinking"})
+                # La session a pu être évincée (et écrite sur disque) entre deux messages
+                session, _ = self.manager.get_or_create(session.session_id)
+                ws.send_json({"type": "answer", **self.manager.handle(session, message)})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            ws.closed = True
+            if scheduler is not None:
+                scheduler.unsubscribe(subscriber)
+            executor.unsubscribe(session.session_id, subscriber)
+
+
+def _reminder_scheduler():
+    """Rappels du calendrier, si le skill calendrier est disponible."""
+    try:
+        from agent_skills.calendar_skill_ics import get_reminder_scheduler
+        return get_reminder_scheduler()
+    except Exception as e:
+        tracing.warning("Rappels indisponibles: %s", e)
+        return None
+
+
+def add_tracing_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--log-level", default=tracing.LOG_LEVEL, choices=list(tracing.LEVELS),
+                        help="niveau du journal console (debug : prompts et réponses brutes)")
+    parser.add_argument("--trace-file", default=None, help="fichier JSONL des spans (route, extract, handler...)")
+    parser.add_argument("--trace-sample", type=float, default=tracing.TRACE_SAMPLE, help="part des tours tracés")
+
+
+def runtime_metrics(manager: SessionManager) -> List[metrics.Sample]:
+    """Valeurs lues à chaque export de /metrics : sessions, cache des commandes, handlers."""
+    sessions = manager.metrics()
+    cache = get_utterance_cache().stats()
+    handlers = get_skill_executor().stats()
+    samples: List[metrics.Sample] = [
+        ("agent_sessions", "gauge", "Sessions en mémoire", {}, sessions["sessions"]),
+        ("agent_sessions_state_bytes", "gauge", "Taille estimée de l'état des sessions", {}, sessions["state_bytes"]),
+        ("agent_sessions_evicted_total", "counter", "Sessions évincées", {}, sessions["evicted"]),
+        ("agent_utterance_cache_hits_total", "counter", "Commandes servies par le cache (sans LLM)", {}, cache["hits"]),
+        ("agent_utterance_cache_misses_total", "counter", "Commandes absentes du cache", {}, cache["misses"]),
+        ("agent_utterance_cache_entries", "gauge", "Gabarits dans le cache des commandes", {}, cache["entries"]),
+        ("agent_handlers_background", "gauge", "Handlers passés en arrière-plan en cours", {}, handlers["background"]),
+        ("agent_handlers_rejected_total", "counter", "Handlers refusés (concurrence du skill)", {}, handlers["rejected"]),
+    ]
+    samples.extend(
+        ("agent_handlers_running", "gauge", "Handlers en cours par skill", {"skill": skill}, n)
+        for skill, n in handlers["running"].items()
+    )
+    return samples
+
+
+def make_server(host: str, port: int, manager: SessionManager) -> ThreadingHTTPServer:
+    metrics.add_collector(lambda: runtime_metrics(manager))
+    handler = type("BoundAgentRequestHandler", (AgentRequestHandler,), {"manager": manager})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    from examples_agent import build_skills
+
+    parser = argparse.ArgumentParser(description="Serveur multi-sessions de l'agent")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--ttl", type=float, default=SESSION_TTL)
+    parser.add_argument("--max-memory-mb", type=int, default=MAX_MEMORY_BYTES // (1024 * 1024))
+    parser.add_argument("--spill-dir", default=None, help="répertoire où écrire les sessions évincées")
+    add_tracing_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure(level=args.log_level, trace_file=args.trace_file, sample=args.trace_sample)
+
+    manager = SessionManager(
+        build_skills(),
+        max_sessions=args.max_sessions,
+        ttl=args.ttl,
+        max_memory=args.max_memory_mb * 1024 * 1024,
+        spill_dir=args.spill_dir,
+    )
+    manager.start_janitor()
+    server = make_server(args.host, args.port, manager)
+    print(f"Serveur de l'agent sur http://{args.host}:{args.port} (POST /chat, GET /ws)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
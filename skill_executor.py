@@ -0,0 +1,268 @@
+# =========================
+# Exécution des handlers de skills (on_ready)
+# =========================
+#
+# Les handlers tournent sur un pool de threads borné (HANDLER_WORKERS) au
+# lieu du thread du tour :
+#   - concurrence par skill : au plus `skill.concurrency` handlers d'un même
+#     skill à la fois (un seul lecteur audio, une seule écriture ICS...) ;
+#     au-delà, la demande attend une place puis est refusée ;
+#   - délai : le tour attend le résultat au plus `skill.timeout` secondes
+#     (et jamais au-delà de son propre budget). Passé ce délai, le tour
+#     répond tout de suite "en cours" ({"type": "<skill>_pending"}) et le
+#     handler continue en arrière-plan, avec son propre budget
+#     (HANDLER_MAX_RUNTIME) ;
+#   - livraison : le résultat final d'un handler passé en arrière-plan est
+#     poussé aux abonnés de la session (WebSocket, CLI), ou gardé pour être
+#     ajouté à la réponse du tour suivant (collect) ;
+#   - annulation : cancel(session) retire les handlers pas encore démarrés
+#     et signale aux autres qu'ils doivent s'arrêter. Un thread ne se tue
+#     pas : un handler long vérifie cancelled() entre deux étapes, et ses
+#     appels LLM échouent dès que l'annulation est demandée.
+
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import metrics
+import tracing
+from deadlines import detached_scope, expired, remaining
+
+HANDLER_WORKERS = 8          # handlers simultanés, tous skills confondus
+HANDLER_CONCURRENCY = 2      # handlers simultanés d'un même skill (défaut)
+HANDLER_TIMEOUT = 20.0       # attente max du tour avant de répondre "en cours" (défaut)
+HANDLER_MAX_RUNTIME = 300.0  # budget d'un handler passé en arrière-plan
+ANSWER_MARGIN = 5.0          # temps du tour gardé pour formuler la réponse
+MAX_FINISHED = 32            # résultats non livrés gardés par session
+
+PENDING_MESSAGE = "C'est en cours, je te préviens dès que c'est terminé."
+
+# (message, détails) : même forme que les abonnés aux rappels du calendrier
+JobCallback = Callable[[str, Dict[str, Any]], None]
+
+_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("skill_job", default=None)
+
+
+class HandlerCancelled(RuntimeError):
+    """Le handler en cours a été annulé (reset de la session, budget épuisé)."""
+
+
+def cancelled() -> bool:
+    """Vrai si le handler en cours doit s'arrêter (à vérifier entre deux étapes longues)."""
+    job = _job.get()
+    return job is not None and (job.cancel_event.is_set() or expired())
+
+
+def check_cancelled() -> None:
+    """Lève HandlerCancelled si le handler en cours a été annulé."""
+    job = _job.get()
+    if job is not None and job.cancel_event.is_set():
+        raise HandlerCancelled(f"Tâche '{job.skill}' annulée")
+
+
+def result_message(result: Any) -> str:
+    if isinstance(result, dict):
+        return str(result.get("message") or result.get("error") or result.get("type", ""))
+    return str(result)
+
+
+class Job:
+    __slots__ = ("id", "skill", "session_id", "future", "cancel_event", "started", "background")
+
+    def __init__(self, skill: str, session_id: Optional[str]):
+        self.id = uuid.uuid4().hex[:8]
+        self.skill = skill
+        self.session_id = session_id
+        self.future: Optional[Future] = None
+        self.cancel_event = threading.Event()
+        self.started = time.monotonic()
+        self.background = False
+
+
+class SkillExecutor:
+    """
+    Pool borné pour les handlers des skills, avec limites par skill, délai
+    et passage en arrière-plan.
+    """
+
+    def __init__(self, workers: int = HANDLER_WORKERS, max_runtime: float = HANDLER_MAX_RUNTIME):
+        self.max_runtime = max_runtime
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="skill")
+        self._lock = threading.Lock()
+        self._limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._subscribers: Dict[str, Dict[str, JobCallback]] = {}
+        self._finished: Dict[Optional[str], Deque[Tuple[str, Dict[str, Any]]]] = {}
+        self.completed = 0
+        self.backgrounded = 0
+        self.rejected = 0
+        self.cancellations = 0
+
+    # --- Exécution ---
+
+    def _limit(self, skill: Any) -> threading.BoundedSemaphore:
+        with self._lock:
+            limit = self._limits.get(skill.name)
+            if limit is None:
+                limit = self._limits[skill.name] = threading.BoundedSemaphore(max(1, skill.concurrency))
+            return limit
+
+    def run(self, skill: Any, values: Dict[str, str], session_id: Optional[str] = None) -> Any:
+        """
+        Exécute skill.on_ready(values) sur le pool et retourne son résultat,
+        ou un résultat "en cours" si le délai du skill (borné par le budget
+        du tour) est dépassé. Les exceptions du handler sont propagées.
+        """
+        wait = skill.timeout
+        left = remaining()
+        if left is not None:
+            wait = max(0.0, min(wait, left - ANSWER_MARGIN))
+        # Une seule échéance pour l'attente d'une place et celle du résultat
+        deadline = time.monotonic() + wait
+
+        limit = self._limit(skill)
+        if not limit.acquire(timeout=wait):
+            with self._lock:
+                self.rejected += 1
+            return {
+                "type": f"{skill.name}_error",
+                "message": f"Trop de demandes '{skill.name}' en cours, réessaie dans un instant.",
+            }
+
+        job = Job(skill.name, session_id)
+        # Session, échéance... suivent le handler dans son thread
+        context = contextvars.copy_context()
+        try:
+            job.future = self._executor.submit(context.run, self._call, job, skill.on_ready, values)
+        except RuntimeError:
+            limit.release()
+            raise
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future.add_done_callback(lambda _: self._done(job, limit))
+
+        try:
+            return job.future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            pass
+        with self._lock:
+            if not job.future.done():
+                job.background = True
+                self.backgrounded += 1
+        if not job.background:
+            return job.future.result()
+
+        tracing.info("[skills] '%s' continue en arrière-plan (tâche %s)", skill.name, job.id)
+        return {"type": f"{skill.name}_pending", "job_id": job.id, "message": PENDING_MESSAGE}
+
+    def _call(self, job: Job, handler: Callable[[Dict[str, str]], Any], values: Dict[str, str]) -> Any:
+        _job.set(job)
+        # Le handler a son propre budget : il peut survivre au tour
+        with detached_scope(self.max_runtime):
+            return handler(values)
+
+    def _done(self, job: Job, limit: threading.BoundedSemaphore) -> None:
+        limit.release()
+        # Durée réelle du handler (arrière-plan compris), l'attente du tour est dans le span "handler"
+        outcome = "cancelled" if job.future.cancelled() or job.cancel_event.is_set() else \
+            "error" if job.future.exception() is not None else "ok"
+        metrics.observe_handler(job.skill, time.monotonic() - job.started, outcome)
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            if job.cancel_event.is_set():
+                self.cancellations += 1
+                return
+            self.completed += 1
+            if not job.background:
+                return
+            result = self._outcome(job)
+            details = {"job_id": job.id, "skill": job.skill, "result": result}
+            delivery = (result_message(result), details)
+            callbacks = list(self._subscribers.get(job.session_id, {}).values())
+            if not callbacks:
+                self._finished.setdefault(job.session_id, deque(maxlen=MAX_FINISHED)).append(delivery)
+        for callback in callbacks:
+            try:
+                callback(*delivery)
+            except Exception as e:
+                tracing.error("Erreur lors de la livraison de la tâche %s: %s", job.id, e)
+
+    @staticmethod
+    def _outcome(job: Job) -> Any:
+        try:
+            return job.future.result()
+        except Exception as e:
+            tracing.error("Erreur dans le handler du skill '%s' (tâche %s): %s", job.skill, job.id, e)
+            return {"type": f"{job.skill}_error", "message": f"La tâche '{job.skill}' a échoué : {e}"}
+
+    # --- Livraison ---
+
+    def subscribe(self, session_id: str, name: str, callback: JobCallback) -> None:
+        """Reçoit les résultats des handlers de la session passés en arrière-plan."""
+        with self._lock:
+            self._subscribers.setdefault(session_id, {})[name] = callback
+
+    def unsubscribe(self, session_id: str, name: str) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.pop(name, None)
+                if not subscribers:
+                    del self._subscribers[session_id]
+
+    def collect(self, session_id: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Résultats terminés et pas encore livrés de la session (vidés)."""
+        with self._lock:
+            finished = self._finished.pop(session_id, None)
+        return list(finished or ())
+
+    # --- Annulation ---
+
+    def cancel(self, session_id: Optional[str]) -> int:
+        """Annule les handlers de la session ; retourne le nombre de tâches concernées."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+            self._finished.pop(session_id, None)
+        for job in jobs:
+            job.cancel_event.set()
+            job.future.cancel()
+        if jobs:
+            tracing.info("[skills] %d tâche(s) annulée(s)", len(jobs))
+        return len(jobs)
+
+    # --- Observabilité ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            running: Dict[str, int] = {}
+            for job in self._jobs.values():
+                running[job.skill] = running.get(job.skill, 0) + 1
+            return {
+                "running": running,
+                "background": sum(1 for job in self._jobs.values() if job.background),
+                "oldest_s": round(max((now - job.started for job in self._jobs.values()), default=0.0), 1),
+                "completed": self.completed,
+                "backgrounded": self.backgrounded,
+                "rejected": self.rejected,
+                "cancelled": self.cancellations,
+                "undelivered": sum(len(q) for q in self._finished.values()),
+            }
+
+
+_executor: Optional[SkillExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_skill_executor() -> SkillExecutor:
+    """Pool partagé par toutes les sessions du processus."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = SkillExecutor()
+        return _executor
@@ -0,0 +1,207 @@
+# =========================
+# Registre de skills (chargement paresseux)
+# =========================
+#
+# Chaque module de skill déclare ses métadonnées dans un dictionnaire
+# littéral SKILL (nom, description, slots, prompt final, nom du handler).
+# Le registre lit ce dictionnaire avec `ast`, SANS importer le module :
+# pygame, icalendar, dateutil, pytz... ne sont chargés que la première
+# fois que le on_ready du skill est appelé.
+#
+# Sources de skills :
+#   - un dossier (par défaut agent_skills/) : tout fichier *.py avec un SKILL
+#   - des entry points (groupe "agent_skills") : l'objet pointé est soit un
+#     dictionnaire SKILL (avec une clé "module"), soit une fonction qui
+#     retourne un Skill.
+
+from typing import Any, Callable, Dict, List, Optional
+import ast
+import importlib
+import os
+import threading
+
+from agent import Skill, Slot
+import tracing
+
+DEFAULT_SKILLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_skills")
+DEFAULT_SKILLS_PACKAGE = "agent_skills"
+ENTRY_POINT_GROUP = "agent_skills"
+
+
+class LazyHandler:
+    """
+    Handler on_ready qui importe son module au premier appel seulement.
+    """
+
+    def __init__(self, module_name: str, function_name: str):
+        self.module_name = module_name
+        self.function_name = function_name
+        self._function: Optional[Callable[[Dict[str, str]], Any]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._function is not None
+
+    def load(self) -> Callable[[Dict[str, str]], Any]:
+        if self._function is None:
+            with self._lock:
+                if self._function is None:
+                    module = importlib.import_module(self.module_name)
+                    self._function = getattr(module, self.function_name)
+        return self._function
+
+    def __call__(self, values: Dict[str, str]) -> Any:
+        return self.load()(values)
+
+    def __repr__(self) -> str:
+        state = "chargé" if self.loaded else "non chargé"
+        return f"<LazyHandler {self.module_name}:{self.function_name} ({state})>"
+
+
+def build_skill(metadata: Dict[str, Any], on_ready: Optional[Callable[[Dict[str, str]], Any]]) -> Skill:
+    """Construit un Skill à partir d'un dictionnaire SKILL."""
+    return Skill(
+        name=metadata["name"],
+        description=metadata["description"],
+        slots=[Slot(**slot) for slot in metadata.get("slots", [])],
+        final_answer_system_prompt=metadata["final_answer_system_prompt"],
+        on_ready=on_ready,
+        # Limites d'exécution du handler (skill_executor.py), optionnelles
+        **{key: metadata[key] for key in ("concurrency", "timeout") if key in metadata},
+        references={slot: tuple(actions) for slot, actions in metadata.get("references", {}).items()},
+    )
+
+
+def read_skill_metadata(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Extrait le dictionnaire SKILL d'un fichier source sans l'exécuter.
+    Retourne None si le fichier n'en déclare pas.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    if "SKILL" not in source:
+        return None
+
+    tree = ast.parse(source, filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        if any(isinstance(t, ast.Name) and t.id == "SKILL" for t in targets):
+            try:
+                return ast.literal_eval(value)
+            except ValueError as e:
+                tracing.warning("SKILL non littéral dans %s: %s", path, e)
+                return None
+    return None
+
+
+def discover_directory(directory: str = DEFAULT_SKILLS_DIR, package: str = DEFAULT_SKILLS_PACKAGE) -> List[Skill]:
+    """Skills déclarés par les fichiers *.py d'un dossier, triés par nom de fichier."""
+    skills = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".py") or filename.startswith("_"):
+            continue
+        metadata = read_skill_metadata(os.path.join(directory, filename))
+        if metadata is None:
+            continue
+        module_name = f"{package}.{filename[:-3]}"
+        handler = metadata.get("on_ready")
+        on_ready = LazyHandler(module_name, handler) if handler else None
+        skills.append(build_skill(metadata, on_ready))
+    return skills
+
+
+def discover_entry_points(group: str = ENTRY_POINT_GROUP) -> List[Skill]:
+    """Skills publiés par des paquets installés (entry points)."""
+    from importlib.metadata import entry_points
+
+    skills = []
+    for ep in entry_points(group=group):
+        try:
+            target = ep.load()
+            if isinstance(target, dict):
+                handler = target.get("on_ready")
+                on_ready = LazyHandler(target["module"], handler) if handler else None
+                skills.append(build_skill(target, on_ready))
+            else:
+                skills.append(target())
+        except Exception as e:
+            tracing.warning("Skill '%s' ignoré: %s", ep.name, e)
+    return skills
+
+
+def discover_skills(
+    directory: Optional[str] = DEFAULT_SKILLS_DIR,
+    entry_point_group: Optional[str] = ENTRY_POINT_GROUP,
+) -> List[Skill]:
+    """
+    Tous les skills disponibles. En cas de doublon de nom, le dossier l'emporte.
+    """
+    skills: Dict[str, Skill] = {}
+    if entry_point_group:
+        for skill in discover_entry_points(entry_point_group):
+            skills[skill.name] = skill
+    if directory:
+        for skill in discover_directory(directory):
+            skills[skill.name] = skill
+    return list(skills.values())
+
+
+# =========================
+# Benchmark du démarrage à froid
+# =========================
+#
+# python skill_registry.py
+#
+# Compare, dans des processus Python neufs, la construction de l'agent en
+# important tous les skills (ancienne méthode) et via le registre.
+
+_EAGER = """
+from agent import MultiSkillAgent
+from agent_skills.audio_skill import create_audio_skill
+from agent_skills.file_skill import create_file_skill
+from agent_skills.calendar_skill_ics import create_calendar_skill
+from agent_skills.email_skill import create_email_skill
+MultiSkillAgent([create_audio_skill(), create_file_skill(), create_calendar_skill(), create_email_skill()])
+"""
+
+_LAZY = """
+from agent import MultiSkillAgent
+from skill_registry import discover_skills
+MultiSkillAgent(discover_skills())
+"""
+
+
+def benchmark(runs: int = 10) -> None:
+    import statistics
+    import subprocess
+    import sys
+    import time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def measure(code: str) -> float:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    baseline = measure("pass")
+    eager = measure(_EAGER) - baseline
+    lazy = measure(_LAZY) - baseline
+    print(f"Interpréteur seul      : {baseline * 1000:.0f} ms (déduit ci-dessous)")
+    print(f"Import de tous les skills : {eager * 1000:.0f} ms")
+    print(f"Registre paresseux        : {lazy * 1000:.0f} ms")
+    if lazy > 0:
+        print(f"Gain : x{eager / lazy:.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,320 @@
+# =========================
+# Traces et journaux de l'agent
+# =========================
+#
+# Deux usages, tous deux désactivables à coût quasi nul :
+#
+#   - journal console à niveaux (debug, info, warning, error) : remplace
+#     les print() du chemin chaud. Au niveau par défaut (LOG_LEVEL) les
+#     prompts, réponses brutes du LLM et valeurs de slots ne sont ni
+#     formatés ni écrits ; `debug()` ne formate son message que si le
+#     niveau est actif.
+#
+#   - traces structurées : chaque tour échantillonné (TRACE_SAMPLE) reçoit
+#     un identifiant, et ses étapes (route, switch, extract, handler,
+#     render) sont enregistrées comme des spans : durée, appels LLM, tokens
+#     du prompt et de la génération. Les enregistrements partent dans une
+#     file bornée, écrite en JSONL par un thread (écritures groupées, en
+#     append) ; le tour n'attend jamais le disque. File pleine : les
+#     enregistrements sont perdus et comptés.
+#
+# Les spans alimentent aussi les métriques (metrics.py) : durée de chaque
+# étape, appels et tokens LLM, pour tous les tours, tracés ou non. Sans
+# fichier de trace et avec metrics.ENABLED = False, span() retourne un
+# objet inerte après une seule lecture de ContextVar.
+#
+#   configure(level="debug", trace_file="traces.jsonl", sample=0.1)
+
+from typing import Any, Dict, List, Optional
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+import metrics
+
+DEBUG, INFO, WARNING, ERROR, OFF = 10, 20, 30, 40, 100
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": OFF}
+
+LOG_LEVEL = "info"          # niveau du journal console
+TRACE_SAMPLE = 1.0          # part des tours tracés quand un fichier de trace est configuré
+TRACE_QUEUE = 10000         # enregistrements en attente d'écriture
+FLUSH_INTERVAL = 0.5        # secondes entre deux écritures groupées
+
+_level = LEVELS[LOG_LEVEL]
+_sample = TRACE_SAMPLE
+_sink: Optional["JsonlSink"] = None
+
+_trace: contextvars.ContextVar[Optional["_Trace"]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+
+
+# =========================
+# Journal console
+# =========================
+
+def enabled(level: int) -> bool:
+    return level >= _level
+
+
+def log(level: int, message: str, *args: Any) -> None:
+    """print() si `level` est actif ; `message % args` n'est calculé qu'à ce moment."""
+    if level < _level:
+        return
+    print(message % args if args else message)
+
+
+def debug(message: str, *args: Any) -> None:
+    log(DEBUG, message, *args)
+
+
+def info(message: str, *args: Any) -> None:
+    log(INFO, message, *args)
+
+
+def warning(message: str, *args: Any) -> None:
+    log(WARNING, message, *args)
+
+
+def error(message: str, *args: Any) -> None:
+    log(ERROR, message, *args)
+
+
+# =========================
+# Écriture JSONL asynchrone
+# =========================
+
+class JsonlSink:
+    """File bornée d'enregistrements, écrite en JSONL par un thread."""
+
+    def __init__(self, path: str, max_queue: int = TRACE_QUEUE, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        # O_APPEND : plusieurs processus (workers.py) peuvent partager le fichier
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch: List[Optional[Dict[str, Any]]] = [first]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [r for r in batch if r is not None]
+            if records:
+                self._write(records)
+            if None in batch:
+                return
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records).encode("utf-8")
+        try:
+            while data:
+                data = data[os.write(self._fd, data):]
+            self.written += len(records)
+        except OSError as e:
+            self.dropped += len(records)
+            print(f"Écriture des traces impossible ({self.path}): {e}")
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Écrit ce qui reste dans la file puis ferme le fichier."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        os.close(self._fd)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"file": self.path, "written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+def configure(level: Optional[str] = None, trace_file: Optional[str] = None, sample: Optional[float] = None) -> None:
+    """
+    Règle le niveau du journal console, le fichier de trace JSONL (None :
+    inchangé, "" : désactivé) et la part des tours tracés.
+    """
+    global _level, _sample, _sink
+    if level is not None:
+        _level = LEVELS[level.lower()]
+    if sample is not None:
+        _sample = max(0.0, min(1.0, sample))
+    if trace_file is not None:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+        if trace_file:
+            _sink = JsonlSink(trace_file)
+
+
+def stats() -> Dict[str, Any]:
+    level = next(name for name, value in LEVELS.items() if value == _level)
+    return {"level": level, "sample": _sample, "sink": _sink.stats() if _sink is not None else None}
+
+
+@atexit.register
+def _close_sink() -> None:
+    if _sink is not None:
+        _sink.close()
+
+
+# =========================
+# Traces : tours et spans
+# =========================
+
+class _Trace:
+    __slots__ = ("id", "session_id", "sink")
+
+    def __init__(self, session_id: Optional[str], sink: JsonlSink):
+        self.id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.sink = sink
+
+
+class Span:
+    """
+    Étape d'un tour : durée, appels LLM, tokens, attributs libres. Toujours
+    comptée dans les métriques ; écrite en JSONL si le tour est tracé.
+    """
+
+    __slots__ = ("name", "trace", "attrs", "parent", "start", "llm_calls", "prompt_tokens", "completion_tokens", "_token")
+
+    def __init__(self, name: str, trace: Optional[_Trace], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.parent = _span.get()
+        self.start = time.perf_counter()
+        self._token = _span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        _span.reset(self._token)
+        skill = self.attrs.get("skill")
+        metrics.observe_stage(self.name, duration, skill if isinstance(skill, str) else None, exc_type is not None)
+        if self.name == "turn":
+            metrics.observe_turn(self.llm_calls, self.prompt_tokens, self.completion_tokens)
+        if self.trace is None:
+            return
+        record = {
+            "ts": round(time.time() - duration, 3),
+            "trace": self.trace.id,
+            "session": self.trace.session_id,
+            "pid": os.getpid(),
+            "span": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "ms": round(duration * 1000, 2),
+        }
+        if self.llm_calls:
+            record.update(llm_calls=self.llm_calls, prompt_tokens=self.prompt_tokens,
+                          completion_tokens=self.completion_tokens)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.attrs)
+        self.trace.sink.emit(record)
+
+
+class _NoSpan:
+    """Span inerte (tour non tracé, métriques désactivées)."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _TurnScope:
+    __slots__ = ("session_id", "_token", "_span")
+
+    def __init__(self, session_id: Optional[str]):
+        self.session_id = session_id
+        self._token = None
+        self._span: Any = _NO_SPAN
+
+    def __enter__(self) -> Any:
+        sink = _sink
+        trace = None
+        if sink is not None and (_sample >= 1.0 or random.random() < _sample):
+            trace = _Trace(self.session_id, sink)
+            self._token = _trace.set(trace)
+        if trace is not None or metrics.ENABLED:
+            self._span = Span("turn", trace, {})
+        return self._span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._span.__exit__(exc_type, exc, tb)
+        if self._token is not None:
+            _trace.reset(self._token)
+
+
+def turn(session_id: Optional[str]) -> _TurnScope:
+    """Bloc d'un tour : tracé (span "turn") si le tirage d'échantillonnage le retient."""
+    return _TurnScope(session_id)
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """Étape du tour en cours ; inerte si le tour n'est pas tracé et les métriques coupées."""
+    trace = _trace.get()
+    if trace is None and not metrics.ENABLED:
+        return _NO_SPAN
+    return Span(name, trace, attrs)
+
+
+def active() -> bool:
+    """Vrai dans un span (évite de calculer ce qui ne sera ni écrit ni compté)."""
+    return _span.get() is not None or metrics.ENABLED
+
+
+def add_llm_call(prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+    """
+    Compte un appel LLM dans le span en cours et ses parents (appelé par
+    send_llama_chat) : le span "turn" totalise le tour. Les métriques le
+    rangent sous l'étape en cours ("other" hors tour : résumés...).
+    """
+    current = _span.get()
+    metrics.observe_llm(current.name if current is not None else "other",
+                        prompt_tokens, completion_tokens, estimated)
+    while current is not None:
+        current.llm_calls += 1
+        current.prompt_tokens += prompt_tokens
+        current.completion_tokens += completion_tokens
+        current = current.parent
@@ -0,0 +1,187 @@
+# =========================
+# Cache des demandes fréquentes (chemin rapide)
+# =========================
+#
+# Beaucoup de messages sont des commandes répétées ("liste mes mails",
+# "montre mon calendrier", "synthétise le mail 3") qui repassent à chaque
+# fois par le routage et l'extraction (2 appels LLM). Le cache associe la
+# *forme* d'un message (minuscules, sans accents ni ponctuation, nombres
+# et identifiants masqués) au skill choisi et aux valeurs des slots, les
+# nombres masqués devenant des paramètres :
+#
+#   "Synthétise le mail 3 !"  ->  "synthetise le mail <n>"  [3]
+#   -> skill "email", {"action": "synthesize", "email_info": <0>}
+#
+# Une forme n'est servie qu'après MIN_CONFIRMATIONS résolutions identiques
+# par le chemin normal ; un résultat d'erreur du handler la rétrograde.
+# Partagé par toutes les sessions du processus, LRU borné à MAX_ENTRIES.
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+MAX_ENTRIES = 4096
+MIN_CONFIRMATIONS = 2      # résolutions identiques avant de servir une forme
+
+_ID = re.compile(r"\b[a-z]+_\d+\b")
+_NUMBER = re.compile(r"\d+(?:[.,:h]\d+)?")
+_PARAM = re.compile(rf"{_ID.pattern}|{_NUMBER.pattern}")
+_PUNCTUATION = re.compile(r"[^\w<>]+")
+
+# Valeur de slot : morceaux de texte fixes et indices de paramètres
+Template = Dict[str, Tuple[Union[str, int], ...]]
+
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize(message: str) -> Tuple[str, List[str]]:
+    """
+    (forme, paramètres) d'un message. Deux messages qui ne diffèrent que
+    par la casse, les accents, la ponctuation ou leurs nombres ont la même
+    forme.
+    """
+    params: List[str] = []
+
+    def mask(kind: str):
+        def repl(match: "re.Match[str]") -> str:
+            params.append(match.group(0))
+            return f" <{kind}> "
+        return repl
+
+    text = _ID.sub(mask("id"), _fold(message))
+    text = _NUMBER.sub(mask("n"), text)
+    return " ".join(_PUNCTUATION.sub(" ", text).split()), params
+
+
+def _template(values: Dict[str, str], params: List[str]) -> Optional[Template]:
+    """
+    Valeurs -> gabarit, ou None si une valeur contient un nombre qui ne
+    vient pas tel quel du message (ex : "3" devenu "email_003") : le
+    gabarit serait faux pour un autre nombre.
+    """
+    if len(set(params)) != len(params):
+        return None  # paramètre ambigu
+    index = {p: i for i, p in enumerate(params)}
+    template: Template = {}
+    for name, value in values.items():
+        parts: List[Union[str, int]] = []
+        last = 0
+        # lower() garde les positions : on découpe la valeur d'origine
+        for match in _PARAM.finditer(value.lower()):
+            if match.group(0) not in index:
+                return None
+            parts.append(value[last:match.start()])
+            parts.append(index[match.group(0)])
+            last = match.end()
+        parts.append(value[last:])
+        template[name] = tuple(p for p in parts if p != "")
+    return template
+
+
+def _fill(template: Template, params: List[str]) -> Dict[str, str]:
+    return {
+        name: "".join(params[p] if isinstance(p, int) else p for p in parts)
+        for name, parts in template.items()
+    }
+
+
+class _Entry:
+    __slots__ = ("skill", "template", "confirmations", "hits")
+
+    def __init__(self, skill: str, template: Template):
+        self.skill = skill
+        self.template = template
+        self.confirmations = 1
+        self.hits = 0
+
+
+class UtteranceCache:
+    """
+    Forme de message -> (skill, gabarit de slots), avec compteur de confiance.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, min_confirmations: int = MIN_CONFIRMATIONS):
+        self.max_entries = max_entries
+        self.min_confirmations = min_confirmations
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.demotions = 0
+
+    def lookup(self, message: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """(skill, valeurs des slots) si la forme du message est connue et confirmée."""
+        shape, params = normalize(message)
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is None or entry.confirmations < self.min_confirmations:
+                self.misses += 1
+                return None
+            if any(isinstance(p, int) and p >= len(params) for parts in entry.template.values() for p in parts):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(shape)
+            entry.hits += 1
+            self.hits += 1
+            return entry.skill, _fill(entry.template, params)
+
+    def learn(self, message: str, skill: str, values: Dict[str, str]) -> None:
+        """Enregistre une résolution faite par le chemin normal (routage + extraction)."""
+        shape, params = normalize(message)
+        template = _template(values, params)
+        if not shape or template is None:
+            return
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is not None and entry.skill == skill and entry.template == template:
+                entry.confirmations += 1
+                self._entries.move_to_end(shape)
+                return
+            # Première fois, ou résolution différente : on repart de zéro
+            self._entries[shape] = _Entry(skill, template)
+            self._entries.move_to_end(shape)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def demote(self, message: str) -> None:
+        """Le chemin rapide a donné un mauvais résultat : la forme doit être reconfirmée."""
+        shape, _ = normalize(message)
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is not None:
+                entry.confirmations = 0
+                self.demotions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            confident = sum(1 for e in self._entries.values() if e.confirmations >= self.min_confirmations)
+            return {
+                "entries": len(self._entries),
+                "confident": confident,
+                "hits": self.hits,
+                "misses": self.misses,
+                "demotions": self.demotions,
+                "hit_rate": round(self.hits / (self.hits + self.misses), 3) if self.hits + self.misses else 0.0,
+            }
+
+
+_cache: Optional[UtteranceCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_utterance_cache() -> UtteranceCache:
+    """Cache partagé par toutes les sessions du processus."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UtteranceCache()
+        return _cache
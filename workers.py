@@ -0,0 +1,560 @@
+# =========================
+# Mode multi-processus (pré-fork + sessions collantes)
+# =========================
+#
+# python workers.py --workers 4 --port 8000
+#
+# Un superviseur construit les skills (et importe leurs modules) une seule
+# fois, puis fork N workers : chacun hérite de ces objets en copy-on-write
+# et sert un server.py interne sur 127.0.0.1:(port + 1 + i).
+#
+# Le superviseur est un proxy léger devant les workers : il lit le
+# session_id (corps JSON de /chat, paramètre de /ws, chemin de /sessions/<id>)
+# et l'envoie toujours au même worker grâce à un anneau de hachage
+# cohérent. Un worker qui meurt est relancé au même index : ses sessions
+# reviennent vers lui (leur état en mémoire est perdu, le routage non).
+#
+# Stockage partagé entre processus : calendrier (journal + flock, relu
+# périodiquement pour les rappels), emails (flock + écriture atomique),
+# fichiers texte (écriture atomique), cache de la bibliothèque audio
+# (écriture atomique). La lecture audio reste propre à chaque worker.
+#
+# /metrics et /metrics.json additionnent les métriques des workers
+# (histogrammes compris : les percentiles sont ceux de l'ensemble).
+#
+# Unix uniquement (os.fork).
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import bisect
+import hashlib
+import http.client
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import metrics
+import tracing
+from server import (
+    MAX_BODY_BYTES, MAX_MEMORY_BYTES, MAX_SESSIONS, PROMETHEUS_CONTENT_TYPE, SESSION_TTL, add_tracing_arguments,
+    content_length,
+)
+
+VIRTUAL_NODES = 64          # points par worker sur l'anneau
+WORKER_WAIT = 5.0           # attente max d'un worker en cours de redémarrage
+RESTART_BACKOFF = (0.1, 0.5, 1.0, 2.0, 5.0)
+PROXY_TIMEOUT = 300.0
+
+
+# =========================
+# Hachage cohérent
+# =========================
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """session_id -> index de worker, stable tant que le nombre de workers ne change pas."""
+
+    def __init__(self, nodes: int, virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f"worker-{node}#{v}"), node)
+            for node in range(nodes) for v in range(virtual_nodes)
+        )
+        self._keys = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, key: str) -> int:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+# =========================
+# Workers
+# =========================
+
+class WorkerInfo:
+    __slots__ = ("index", "port", "pid", "restarts", "started")
+
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.pid = 0
+        self.restarts = 0
+        self.started = 0.0
+
+
+def _worker_main(index: int, port: int, skills: List[Any], options: Dict[str, Any]) -> None:
+    """Corps d'un worker (processus fils) : un server.py sur 127.0.0.1:port."""
+    import tracing
+    from server import SessionManager, make_server
+
+    # Flux de sortie neufs : un verrou détenu par un thread du superviseur
+    # au moment du fork resterait pris dans le fils
+    sys.stdout = io.TextIOWrapper(open(1, "wb", buffering=0, closefd=False), write_through=True)
+    sys.stderr = io.TextIOWrapper(open(2, "wb", buffering=0, closefd=False), write_through=True)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # le superviseur gère l'arrêt
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Le thread d'écriture des traces ne survit pas au fork : chaque worker
+    # ouvre le fichier (en append) et a son propre thread
+    tracing.configure(level=options.get("log_level"), trace_file=options.get("trace_file"),
+                      sample=options.get("trace_sample"))
+
+    manager = SessionManager(
+        skills,
+        max_sessions=options["max_sessions"],
+        ttl=options["ttl"],
+        max_memory=options["max_memory"],
+        spill_dir=options.get("spill_dir"),
+    )
+    manager.start_janitor()
+    server = make_server("127.0.0.1", port, manager)
+    server.serve_forever()
+
+
+def preload_handlers(skills: List[Any]) -> None:
+    """Importe les modules des skills avant le fork (partagés en copy-on-write)."""
+    for skill in skills:
+        load = getattr(skill.on_ready, "load", None)
+        if load is None:
+            continue
+        try:
+            load()
+        except Exception as e:
+            tracing.warning("Préchargement du skill '%s' impossible: %s", skill.name, e)
+
+
+class Supervisor:
+    """
+    Fork et surveille les workers ; relance ceux qui meurent.
+    """
+
+    def __init__(self, skills: List[Any], workers: int, base_port: int, options: Dict[str, Any]):
+        self.skills = skills
+        self.options = options
+        self.workers = [WorkerInfo(i, base_port + i) for i in range(workers)]
+        self.ring = HashRing(workers)
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self) -> None:
+        for worker in self.workers:
+            self._spawn(worker)
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+
+    def _spawn(self, worker: WorkerInfo) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker_main(worker.index, worker.port, self.skills, self.options)
+            except BaseException as e:
+                tracing.error("Worker %d arrêté: %s", worker.index, e)
+            finally:
+                os._exit(1)
+        with self._lock:
+            worker.pid = pid
+            worker.started = time.monotonic()
+
+    def _monitor(self) -> None:
+        while not self._stopping:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                time.sleep(0.5)
+                continue
+            if self._stopping:
+                return
+            with self._lock:
+                worker = next((w for w in self.workers if w.pid == pid), None)
+            if worker is None:
+                continue
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            # Redémarrages rapprochés : on espace les relances
+            uptime = time.monotonic() - worker.started
+            if uptime > 60:
+                worker.restarts = 0
+            delay = RESTART_BACKOFF[min(worker.restarts, len(RESTART_BACKOFF) - 1)]
+            worker.restarts += 1
+            tracing.warning("Worker %d (pid %d) terminé (code %s), relance dans %.1f s", worker.index, pid, code, delay)
+            # Relance différée sur son propre timer : ce thread continue de
+            # récupérer les autres workers pendant l'attente
+            timer = threading.Timer(delay, self._restart, args=(worker,))
+            timer.daemon = True
+            timer.start()
+
+    def _restart(self, worker: WorkerInfo) -> None:
+        if not self._stopping:
+            self._spawn(worker)
+
+    def worker_for(self, session_id: str) -> WorkerInfo:
+        return self.workers[self.ring.node_for(session_id)]
+
+    def stop(self) -> None:
+        self._stopping = True
+        for worker in self.workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"index": w.index, "pid": w.pid, "port": w.port, "restarts": w.restarts}
+                for w in self.workers
+            ]
+
+
+# =========================
+# Proxy
+# =========================
+
+def _connect(port: int) -> socket.socket:
+    """Connexion au worker, en attendant s'il est en cours de redémarrage."""
+    deadline = time.monotonic() + WORKER_WAIT
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port), timeout=PROXY_TIMEOUT)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+class _WorkerConnection(http.client.HTTPConnection):
+    def connect(self) -> None:
+        self.sock = _connect(self.port)
+
+
+def _forward(port: int, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+    conn = _WorkerConnection("127.0.0.1", port, timeout=PROXY_TIMEOUT)
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "AgentSupervisor/1.0"
+    supervisor: Supervisor = None  # renseigné par make_proxy
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str = "application/json; charset=utf-8") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, status: int, data: Dict[str, Any]) -> None:
+        self._reply(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def _to_worker(self, session_id: str, method: str, path: str, body: Optional[bytes] = None) -> None:
+        worker = self.supervisor.worker_for(session_id)
+        try:
+            status, data = _forward(worker.port, method, path, body)
+        except OSError as e:
+            self._reply_json(503, {"error": f"Worker {worker.index} indisponible: {e}"})
+            return
+        self._reply(status, data)
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/chat":
+            self._reply_json(404, {"error": "Ressource inconnue"})
+            return
+        length = content_length(self.headers)
+        if length is None or length > MAX_BODY_BYTES:
+            self.close_connection = True
+            if length is None:
+                self._reply_json(400, {"error": "Content-Length invalide"})
+            else:
+                self._reply_json(413, {"error": "Requête trop grande"})
+            return
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply_json(400, {"error": "JSON invalide"})
+            return
+        if not isinstance(data, dict):
+            self._reply_json(400, {"error": "Objet JSON attendu"})
+            return
+        # L'ID est choisi ici pour que la session naisse sur son worker définitif
+        if not data.get("session_id"):
+            data["session_id"] = uuid.uuid4().hex
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._to_worker(str(data["session_id"]), "POST", "/chat", body)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._reply_json(200, {"status": "ok", "workers": self.supervisor.status()})
+        elif url.path == "/sessions":
+            self._all_sessions()
+        elif url.path == "/metrics":
+            self._reply(200, self._all_metrics().prometheus().encode("utf-8"), PROMETHEUS_CONTENT_TYPE)
+        elif url.path == "/metrics.json":
+            raw = parse_qs(url.query).get("raw", ["0"])[0] not in ("0", "")
+            self._reply_json(200, self._all_metrics().snapshot(raw))
+        elif url.path.startswith("/sessions/"):
+            self._to_worker(url.path[len("/sessions/"):], "GET", url.path)
+        elif url.path == "/ws":
+            self._websocket(url)
+        else:
+            self._reply_json(404, {"error": "Ressource inconnue"})
+
+    def do_DELETE(self) -> None:
+        path = urlsplit(self.path).path
+        if path.startswith("/sessions/"):
+            self._to_worker(path[len("/sessions/"):], "DELETE", path)
+        else:
+            self._reply_json(404, {"error": "Ressource inconnue"})
+
+    def _all_sessions(self) -> None:
+        merged: Dict[str, Any] = {"sessions": 0, "state_bytes": 0, "evicted": 0, "items": []}
+        for worker in self.supervisor.workers:
+            try:
+                status, body = _forward(worker.port, "GET", "/sessions")
+            except OSError:
+                continue
+            if status != 200:
+                continue
+            data = json.loads(body)
+            for key in ("sessions", "state_bytes", "evicted"):
+                merged[key] += data.get(key, 0)
+            merged["items"].extend({**item, "worker": worker.index} for item in data.get("items", []))
+        self._reply_json(200, merged)
+
+    def _all_metrics(self) -> metrics.Registry:
+        merged = metrics.Registry()
+        for worker in self.supervisor.workers:
+            try:
+                status, body = _forward(worker.port, "GET", "/metrics.json?raw=1")
+            except OSError:
+                continue
+            if status == 200:
+                merged.merge(json.loads(body))
+        return merged
+
+    def _websocket(self, url) -> None:
+        """Relaie la connexion WebSocket telle quelle vers le worker de la session."""
+        query = parse_qs(url.query)
+        session_id = query.get("session_id", [None])[0] or uuid.uuid4().hex
+        worker = self.supervisor.worker_for(session_id)
+        try:
+            upstream = _connect(worker.port)
+        except OSError as e:
+            self._reply_json(503, {"error": f"Worker {worker.index} indisponible: {e}"})
+            return
+        upstream.settimeout(None)
+
+        request = [f"GET /ws?{urlencode({'session_id': session_id})} HTTP/1.1"]
+        request += [f"{k}: {v}" for k, v in self.headers.items()]
+        upstream.sendall(("\r\n".join(request) + "\r\n\r\n").encode("latin-1"))
+        self.close_connection = True
+        self.wfile.flush()
+
+        client = self.connection
+        client.settimeout(None)
+
+        def pipe(read, dst: socket.socket) -> None:
+            try:
+                while True:
+                    chunk = read(65536)
+                    if not chunk:
+                        break
+                    dst.sendall(chunk)
+            except OSError:
+                pass
+            finally:
+                for s in (client, upstream):
+                    try:
+                        s.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+        # Côté client on lit via rfile : il peut contenir des octets déjà
+        # bufferisés par le parseur HTTP (premier message envoyé très tôt)
+        back = threading.Thread(target=pipe, args=(upstream.recv, client), daemon=True)
+        back.start()
+        pipe(self.rfile.read1, upstream)
+        back.join()
+        upstream.close()
+
+
+def make_proxy(host: str, port: int, supervisor: Supervisor) -> ThreadingHTTPServer:
+    handler = type("BoundProxyHandler", (ProxyHandler,), {"supervisor": supervisor})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+# =========================
+# Test de charge local
+# =========================
+#
+# python workers.py --benchmark
+#
+# Un faux llama-server (processus à part, réponses instantanées) et une
+# conversation "calendrier / liste" sur un calendrier de 300 événements :
+# le temps passe dans le travail CPU de l'agent (JSON, prompts, ICS).
+# Mesure le débit (requêtes/s) avec 1, 2, puis N workers.
+
+def _benchmark_llm_stub(port: int) -> None:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._send(b'{"status": "ok"}')
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            system = payload["messages"][0]["content"]
+            if "routeur" in system:
+                content = '{"intents": [{"intent": "calendar", "message": "liste"}]}'
+            elif "extraire" in system:
+                content = '{"slots": {"action": "list", "event_info": "tous"}}'
+            else:
+                content = "Voici tes événements."
+            self._send(json.dumps({"choices": [{"message": {"content": content}}]}).encode())
+
+        def _send(self, body: bytes) -> None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def benchmark(max_workers: int, requests_per_run: int = 400, concurrency: int = 16) -> None:
+    import multiprocessing
+    import subprocess
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    tmp = tempfile.mkdtemp(prefix="agent-bench-")
+    calendar_path = os.path.join(tmp, "calendar.ics")
+    with open(calendar_path, "w", encoding="utf-8") as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//FR\r\n")
+        for i in range(300):
+            f.write(
+                f"BEGIN:VEVENT\r\nUID:bench-{i}\r\nSUMMARY:Réunion {i}\r\n"
+                f"DTSTART:202701{1 + i % 28:02d}T{8 + i % 10:02d}0000\r\n"
+                f"DTEND:202701{1 + i % 28:02d}T{9 + i % 10:02d}0000\r\nEND:VEVENT\r\n"
+            )
+        f.write("END:VCALENDAR\r\n")
+
+    llm = multiprocessing.Process(target=_benchmark_llm_stub, args=(18990,), daemon=True)
+    llm.start()
+
+    counts = sorted({1, min(2, max_workers), max_workers})
+    here = os.path.dirname(os.path.abspath(__file__))
+    for n in counts:
+        code = (
+            "import agent, agent_skills.calendar_skill_ics as c, sys, workers\n"
+            "agent.LLAMA_SERVER_URL = 'http://127.0.0.1:18990/v1/chat/completions'\n"
+            f"c.CALENDAR_FILE = {calendar_path!r}\n"
+            f"sys.argv = ['workers.py', '--workers', '{n}', '--port', '18900']\n"
+            "workers.main()\n"
+        )
+        proc = subprocess.Popen([sys.executable, "-c", code], cwd=here,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                try:
+                    status, body = _forward(18900, "GET", "/health")
+                    if status == 200 and all(w["pid"] for w in json.loads(body)["workers"]):
+                        break
+                except OSError:
+                    time.sleep(0.2)
+
+            def one(i: int) -> None:
+                body = json.dumps({"session_id": f"bench-{i % 64}", "message": "liste mes événements"})
+                _forward(18900, "POST", "/chat", body.encode())
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(one, range(concurrency * 2)))  # chauffe
+                start = time.perf_counter()
+                list(executor.map(one, range(requests_per_run)))
+                elapsed = time.perf_counter() - start
+            print(f"{n} worker(s) : {requests_per_run / elapsed:7.1f} requêtes/s")
+        finally:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(timeout=10)
+    llm.terminate()
+    print(f"({os.cpu_count()} cœur(s) disponibles)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Agent multi-processus (superviseur + workers)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="par worker")
+    parser.add_argument("--ttl", type=float, default=SESSION_TTL)
+    parser.add_argument("--max-memory-mb", type=int, default=MAX_MEMORY_BYTES // (1024 * 1024), help="par worker")
+    parser.add_argument("--spill-dir", default=None, help="répertoire où écrire les sessions évincées")
+    parser.add_argument("--no-preload", action="store_true", help="ne pas importer les skills avant le fork")
+    parser.add_argument("--benchmark", action="store_true", help="test de charge local")
+    add_tracing_arguments(parser)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.workers)
+        return
+
+    from examples_agent import build_skills
+
+    skills = build_skills()
+    if not args.no_preload:
+        preload_handlers(skills)
+
+    supervisor = Supervisor(
+        skills,
+        workers=args.workers,
+        base_port=args.port + 1,
+        options={
+            "max_sessions": args.max_sessions,
+            "ttl": args.ttl,
+            "max_memory": args.max_memory_mb * 1024 * 1024,
+            "spill_dir": args.spill_dir,
+            "log_level": args.log_level,
+            "trace_file": args.trace_file,
+            "trace_sample": args.trace_sample,
+        },
+    )
+    supervisor.start()
+    proxy = make_proxy(args.host, args.port, supervisor)
+    print(f"Superviseur sur http://{args.host}:{args.port} ({args.workers} workers)")
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        proxy.server_close()
+
+
+if __name__ == "__main__":
+    main()